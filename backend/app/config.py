@@ -0,0 +1,74 @@
+import os
+
+# The backend folder, used to build default paths that work no matter where uvicorn is started from
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+# All runtime settings live here so they can be changed with environment variables without touching the code
+class Settings:
+    def __init__(self):
+        # Where trained model artifacts are saved so workers can load them instead of retraining
+        self.model_dir = os.getenv("MODEL_DIR", os.path.join(BACKEND_DIR, "models"))
+        # How many trained model artifacts stay on disk, older ones are deleted after a new model is saved
+        self.model_artifacts_keep = max(1, int(os.getenv("MODEL_ARTIFACTS_KEEP", "3")))
+
+        # Optional pause added to /api/optimize-schedule so the demo UI has time to show its animation, off by default
+        self.demo_pacing_seconds = float(os.getenv("DEMO_PACING_SECONDS", "0"))
+
+        # When the duration model is loaded: "blocking" before the first request is served, "background" in a thread
+        # while the server already answers (GET /api/ready says when it's done), "lazy" on the first request that needs it
+        self.startup_warm_up = os.getenv("STARTUP_WARM_UP", "blocking")
+
+        # How schedule optimizations run in the background: "thread" or "process"
+        self.optimizer_executor = os.getenv("OPTIMIZER_EXECUTOR", "thread")
+        # How many optimizations run at the same time
+        self.optimizer_max_workers = int(os.getenv("OPTIMIZER_MAX_WORKERS", str(min(4, os.cpu_count() or 1))))
+        # How many more can wait for a free worker before we start answering 503
+        self.optimizer_max_queue = int(os.getenv("OPTIMIZER_MAX_QUEUE", "16"))
+
+        # How many processes solve depots in parallel when a request asks for partition_by_depot, 1 solves them one after another
+        self.partition_workers = int(os.getenv("PARTITION_WORKERS", str(os.cpu_count() or 1)))
+
+        # Time the route optimizer may spend improving each crew's route, in milliseconds
+        self.route_time_budget_ms = float(os.getenv("ROUTE_TIME_BUDGET_MS", "20"))
+        # Default time the local_search and exact assignment strategies may run, in milliseconds
+        self.solver_time_budget_ms = float(os.getenv("SOLVER_TIME_BUDGET_MS", "500"))
+        # Above this many jobs local_search and exact return the greedy assignment, with a note in the strategy report
+        self.solver_max_search_jobs = int(os.getenv("SOLVER_MAX_SEARCH_JOBS", "20000"))
+        # Above this many jobs exact skips branch and bound and anneals for the whole budget instead
+        self.solver_max_exact_jobs = int(os.getenv("SOLVER_MAX_EXACT_JOBS", "1000"))
+
+        # CSV file with the coordinates of known addresses, used to estimate travel between them
+        self.locations_file = os.getenv("LOCATIONS_FILE", os.path.join(BACKEND_DIR, "app", "data", "locations.csv"))
+
+        # How many distinct feature vectors keep their predicted duration, recurring jobs skip the forest entirely
+        self.prediction_cache_size = int(os.getenv("PREDICTION_CACHE_SIZE", "100000"))
+        # How long a cached prediction lives in seconds, 0 keeps it until the model changes or it gets evicted
+        self.prediction_cache_ttl_seconds = float(os.getenv("PREDICTION_CACHE_TTL_SECONDS", "0"))
+
+        # How many finished /api/optimize-schedule responses are kept for identical requests, 0 turns the cache off
+        self.result_cache_size = int(os.getenv("RESULT_CACHE_SIZE", "256"))
+        # and how many megabytes of response bodies they may take up together
+        self.result_cache_max_bytes = int(float(os.getenv("RESULT_CACHE_MAX_MB", "256")) * 1024 * 1024)
+
+        # Append only SQLite file with the actual durations of completed jobs
+        self.feedback_db = os.getenv("FEEDBACK_DB", os.path.join(BACKEND_DIR, "data", "feedback.sqlite3"))
+        # SQLite file with every optimization's utilization, drive and miles summed per day and per crew
+        self.analytics_db = os.getenv("ANALYTICS_DB", os.path.join(BACKEND_DIR, "data", "analytics.sqlite3"))
+        # Retrain in the background once this many new feedback rows came in
+        self.retrain_min_new_rows = int(os.getenv("RETRAIN_MIN_NEW_ROWS", "500"))
+        # or when this many seconds passed since the last training and there is any new feedback
+        self.retrain_interval_seconds = float(os.getenv("RETRAIN_INTERVAL_SECONDS", "3600"))
+        # Only the newest this many feedback rows are trained on, so training time stays bounded as feedback grows
+        self.retrain_window_rows = int(os.getenv("RETRAIN_WINDOW_ROWS", "20000"))
+        # Set to 0 to turn off the background retrain thread, POST /api/model/retrain still works
+        self.retrain_enabled = os.getenv("RETRAIN_ENABLED", "1") != "0"
+
+        # Optimizations slower than this many milliseconds keep a sampling profile, 0 turns the profiler off
+        self.profile_slow_request_ms = float(os.getenv("PROFILE_SLOW_REQUEST_MS", "0"))
+        # How often the profiler samples the call stack, in milliseconds
+        self.profile_sample_interval_ms = float(os.getenv("PROFILE_SAMPLE_INTERVAL_MS", "5"))
+
+
+# Global instance
+settings = Settings()
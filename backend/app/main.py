@@ -1,11 +1,40 @@
 # FastAPI lets you create backend web servers, programs that receive HTTP requests (like GET, POST, PUT, DELETE) and send back responses.
-from fastapi import FastAPI
+import time
+# Taken before anything else is imported, GET /api/ready reports how long the imports took
+IMPORT_STARTED = time.perf_counter()
+import asyncio
+import json
+import threading
+from datetime import date
+from functools import partial
+from typing import Literal, Optional
+from fastapi import FastAPI, Header, HTTPException, Query, Request
+from pydantic import ValidationError
+from fastapi.responses import JSONResponse, PlainTextResponse, Response, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from app.services.mock_data import MockDataService
 from app.services.scheduler import ScheduleOptimizer
+from app.services.ml_model import duration_predictor
+from app.services.worker_pool import optimization_pool, PoolSaturatedError
+from app.services.partitioning import partition_solver
+from app.services.job_store import optimization_jobs
+from app.services.mock_data import get_job_features
+from app.services.feedback_store import feedback_store
+from app.services.analytics import analytics_store
+from app.services.result_cache import etag_matches, request_key, result_cache
+from app.services.retraining import model_retrainer
+from app.services.horizon import HorizonPlanner
+from app.services.bulk_io import BulkInputError, csv_lines, ndjson_lines, parse_records, record_columns
+from app.services.sessions import schedule_sessions, DuplicateIdError, UnknownIdError
+from app.services.metrics import metrics, record_optimization, run_profiled, slow_profiles, FEEDBACK_ROWS, HTTP_REQUESTS, HTTP_REQUEST_SECONDS
+from app.config import settings
+from app.models import CrewIn, FeedbackRequest, HorizonRequest, JobIn, OptimizeRequest, OptimizeResponse, ScheduleDelta
 
 app = FastAPI(title="Landscaping AI Scheduler", version="1.0.0")
 
+# Seconds since this module started importing, filled in as startup goes along
+startup_timings = {"import_seconds": None, "warm_up_seconds": None, "model_ready_seconds": None, "first_response_seconds": None}
+
 # Enable CORS for frontend
 app.add_middleware(
     CORSMiddleware,
@@ -15,14 +44,77 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Count and time every request, labelled by the route template so /api/optimize-jobs/{job_id} stays one series
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    started = time.perf_counter()
+    response = await call_next(request)
+    if startup_timings["first_response_seconds"] is None:
+        startup_timings["first_response_seconds"] = round(time.perf_counter() - IMPORT_STARTED, 3)
+    route = request.scope.get("route")
+    path = route.path if route is not None else "unmatched"
+    HTTP_REQUESTS.inc(method=request.method, route=path, status=response.status_code)
+    HTTP_REQUEST_SECONDS.observe(time.perf_counter() - started, method=request.method, route=path)
+    return response
+
 # Initialize services
 mock_data = MockDataService()
 scheduler = ScheduleOptimizer()
 
+startup_timings["import_seconds"] = round(time.perf_counter() - IMPORT_STARTED, 3)
+
+def _warm_up_model():
+    started = time.perf_counter()
+    duration_predictor.warm_up()
+    # Near zero when gunicorn already loaded the model in the parent process before forking (see gunicorn.conf.py)
+    startup_timings["warm_up_seconds"] = round(time.perf_counter() - started, 3)
+    startup_timings["model_ready_seconds"] = round(time.perf_counter() - IMPORT_STARTED, 3)
+
+# Load (or train once and save) the duration model, before the first request comes in unless STARTUP_WARM_UP says otherwise
+@app.on_event("startup")
+def warm_up_model():
+    if settings.startup_warm_up == "blocking":
+        _warm_up_model()
+    elif settings.startup_warm_up == "background":
+        threading.Thread(target=_warm_up_model, name="model-warm-up", daemon=True).start()
+    # "lazy" leaves it to the first request that predicts
+    optimization_pool.start()
+    partition_solver.start()
+    if settings.retrain_enabled:
+        model_retrainer.start()
+
+# Let running optimizations finish and stop the worker pool
+# Optimization jobs wait on the pool's workers, so they are waited for before the pool stops
+@app.on_event("shutdown")
+def stop_worker_pool():
+    optimization_jobs.shutdown()
+    optimization_pool.shutdown()
+    partition_solver.shutdown()
+    model_retrainer.stop()
+    analytics_store.close()
+
 @app.get("/")
 def read_root():
     return {"message": "Landscaping AI Scheduler API"}
 
+# For load balancers and autoscalers: 503 until the model is loaded, so no traffic is sent to a worker that would
+# make its first request wait for the model. With STARTUP_WARM_UP=lazy the worker counts as ready right away
+@app.get("/api/ready")
+def readiness():
+    """Whether the model is warm, and how long the imports and the warm up took"""
+    model_warm = duration_predictor.is_trained
+    if model_warm and startup_timings["model_ready_seconds"] is None:
+        startup_timings["model_ready_seconds"] = round(time.perf_counter() - IMPORT_STARTED, 3)
+    ready = model_warm or settings.startup_warm_up == "lazy"
+    body = {
+        "ready": ready,
+        "model_warm": model_warm,
+        "model_version": duration_predictor.model_version,
+        "startup_warm_up": settings.startup_warm_up,
+        **startup_timings
+    }
+    return JSONResponse(body, status_code=200 if ready else 503)
+
 @app.get("/api/demo-data")
 def get_demo_data():
     """Get pre-loaded demo data for the presentation"""
@@ -31,15 +123,388 @@ def get_demo_data():
         "crews": mock_data.get_sample_crews()
     }
 
-@app.post("/api/optimize-schedule")
-def optimize_schedule(request: dict):
+# Binds the assignment strategy, time budget, partitioning and risk percentile from the request, the request model already validated them
+def _optimizer_for(request):
+    return partial(
+        scheduler.optimize_schedule,
+        strategy=request.strategy,
+        time_budget_ms=request.time_budget_ms,
+        partition_by_depot=request.partition_by_depot,
+        rebalance=request.rebalance,
+        risk_percentile=request.risk_percentile
+    )
+
+# X-Debug-Timings: 1 (or any value other than 0/false) asks for the per stage timings in the response
+def _wants_timings(header_value):
+    return header_value is not None and header_value.strip().lower() not in ("", "0", "false", "no")
+
+# Records the result in /metrics and the analytics store and keeps its profile if it had one
+# The stage timings only stay in the response when the client sent the X-Debug-Timings header
+# The analytics store writes to SQLite, so the insert runs in a thread instead of blocking the event loop
+async def _finish_result(result, job_count, strategy, debug_timings):
+    record_optimization(result, job_count, strategy)
+    await asyncio.get_running_loop().run_in_executor(None, analytics_store.record, result["analytics"])
+    profile = result.pop("profile", None)
+    if profile is not None:
+        slow_profiles.append({"strategy": strategy, "job_count": job_count, **profile})
+    if not _wants_timings(debug_timings):
+        result.pop("timings", None)
+    return result
+
+# The response model is only used for the API docs, the scheduler already builds the response
+# so we skip validating thousands of job dicts on the way out
+# Identical requests (same jobs, crews, options and model) share one result, see result_cache.py. The ETag header
+# is the body's hash, sending it back as If-None-Match gets a 304 without the body when the schedule hasn't changed
+@app.post("/api/optimize-schedule", responses={200: {"model": OptimizeResponse}, 304: {"description": "Same schedule as the If-None-Match ETag"}})
+async def optimize_schedule(
+    request: OptimizeRequest,
+    x_debug_timings: Optional[str] = Header(None),
+    if_none_match: Optional[str] = Header(None)
+):
     """Main optimization endpoint"""
-    jobs = request.get("jobs", [])
-    crews = request.get("crews", [])
-    
-    result = scheduler.optimize_schedule(jobs, crews)
+    jobs = request.job_records()
+    crews = request.crew_records()
+    optimize = _optimizer_for(request)
+    # With profiling on the sampler runs next to the optimization in the same worker, thread or process
+    if settings.profile_slow_request_ms > 0:
+        optimize = partial(run_profiled, optimize, settings.profile_slow_request_ms, settings.profile_sample_interval_ms)
+
+    async def compute(debug_timings=None):
+        # The optimization is CPU bound so it runs on the worker pool, the event loop stays free for other requests
+        try:
+            result = await optimization_pool.run(optimize, jobs, crews)
+        except PoolSaturatedError:
+            # Better to tell the client to retry than to let latency pile up behind a long queue
+            raise HTTPException(status_code=503, detail="Scheduler is busy, please retry shortly", headers={"Retry-After": "1"})
+
+        # Optional demo pacing, an async sleep so it doesn't hold a worker, cache hits skip it
+        if settings.demo_pacing_seconds > 0:
+            await asyncio.sleep(settings.demo_pacing_seconds)
+        return await _finish_result(result, len(jobs), request.strategy, debug_timings)
+
+    # Asking for timings means asking for a fresh run, and before the model is loaded there's no version to key on
+    model_version = duration_predictor.model_version
+    if _wants_timings(x_debug_timings) or model_version is None:
+        return await compute(x_debug_timings)
+
+    key = request_key(jobs, crews, request.model_dump(exclude={"jobs", "crews"}), model_version)
+    # The result says which model predicted it (in a worker process that can be another one than ours), a result
+    # from any other model than the key's isn't stored, so nobody is served it (or a 304 for it) under this key
+    body, etag, how = await result_cache.get_or_compute(
+        key, compute, keep=lambda result: result["ml_model_info"]["model_version"] == model_version
+    )
+    headers = {"ETag": etag, "X-Cache": how}
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+# Async version of optimize-schedule for big fleets, returns right away with a job id to follow
+@app.post("/api/optimize-jobs", status_code=202)
+def submit_optimization_job(request: OptimizeRequest):
+    """Queue an optimization and return its job id"""
+    jobs = request.job_records()
+    crews = request.crew_records()
+    optimize = _optimizer_for(request)
+
+    # Job results are recorded when the job finishes (on the job's thread in this process, even when the optimization
+    # ran in a worker process), the timings are stripped when the result is fetched
+    # Every submission is its own run with its own progress events, the result cache is only for optimize-schedule
+    def record(result):
+        record_optimization(result, len(jobs), request.strategy)
+        analytics_store.record(result["analytics"])
+
+    try:
+        job_id = optimization_jobs.submit(optimize, jobs, crews, on_result=record)
+    except PoolSaturatedError:
+        # Jobs share the optimization pool's places with optimize-schedule
+        raise HTTPException(status_code=503, detail="Scheduler is busy, please retry shortly", headers={"Retry-After": "5"})
+
+    return {
+        "job_id": job_id,
+        "status": "queued",
+        "status_url": f"/api/optimize-jobs/{job_id}",
+        "events_url": f"/api/optimize-jobs/{job_id}/events",
+        "result_url": f"/api/optimize-jobs/{job_id}/result"
+    }
+
+def _get_job_or_404(job_id):
+    record = optimization_jobs.store.get(job_id)
+    if record is None:
+        raise HTTPException(status_code=404, detail="Optimization job not found")
+    return record
+
+@app.get("/api/optimize-jobs/{job_id}")
+def get_optimization_job(job_id: str):
+    """Current status and progress of an optimization job"""
+    record = _get_job_or_404(job_id)
+    # The result can be large, it has its own endpoint
+    record.pop("result", None)
+    return record
+
+@app.get("/api/optimize-jobs/{job_id}/result")
+def get_optimization_job_result(job_id: str, x_debug_timings: Optional[str] = Header(None)):
+    """The optimization result once the job has finished"""
+    record = _get_job_or_404(job_id)
+    if record["status"] == "failed":
+        raise HTTPException(status_code=500, detail=record["error"])
+    if record["status"] != "completed":
+        raise HTTPException(status_code=409, detail=f"Optimization job is {record['status']}")
+    result = record["result"]
+    if not _wants_timings(x_debug_timings):
+        result = {key: value for key, value in result.items() if key != "timings"}
     return result
 
+@app.get("/api/optimize-jobs/{job_id}/events")
+async def stream_optimization_job_events(job_id: str):
+    """Stream progress events as Server-Sent Events until the job finishes"""
+    _get_job_or_404(job_id)
+
+    async def event_stream():
+        sent = 0
+        while True:
+            record = optimization_jobs.store.get(job_id)
+            events = optimization_jobs.store.get_events(job_id, sent)
+            for event in events:
+                yield f"event: progress\ndata: {json.dumps(event)}\n\n"
+            sent += len(events)
+            # The record is read before the events, so once it says finished we have already sent the last event
+            if record is None or record["status"] in ("completed", "failed"):
+                status = record["status"] if record else "expired"
+                yield f"event: done\ndata: {json.dumps({'job_id': job_id, 'status': status})}\n\n"
+                break
+            await asyncio.sleep(0.1)
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+# Plans every day of a date range and streams one JSON line per day as soon as that day is planned
+# The whole plan holds one place in the optimization pool, so a burst of season plans gets a 503 like optimize-schedule,
+# and every day's optimization runs on the pool (worker processes in process mode) under that place
+@app.post("/api/horizon-schedule")
+async def plan_horizon(request: HorizonRequest):
+    """Expand recurring jobs over the date range and plan each day, rolling unassigned jobs over"""
+    try:
+        optimization_pool.reserve()
+    except PoolSaturatedError:
+        raise HTTPException(status_code=503, detail="Scheduler is busy, please retry shortly", headers={"Retry-After": "1"})
+    loop = asyncio.get_running_loop()
+
+    # Called from the thread the planner steps in, waits for the day's optimization on the pool
+    # Every planned day is an optimization for /metrics too, that also takes in what a worker process recorded
+    def optimize(jobs, crews, **options):
+        result = asyncio.run_coroutine_threadsafe(
+            optimization_pool.run(partial(scheduler.optimize_schedule, **options), jobs, crews, reserved=True), loop
+        ).result()
+        record_optimization(result, len(jobs), options["strategy"])
+        return result
+
+    planner = HorizonPlanner(optimize, request.strategy, request.time_budget_ms, request.max_rollover_days)
+    days = planner.plan(request.start_date, request.end_date, request.crew_records(), request.job_records(), request.recurring_records())
+
+    # Each planned day adds to the analytics of the date it plans, not the day the plan was made
+    async def lines():
+        try:
+            while True:
+                # The planner is a plain generator, each step runs in a thread (not a pool worker, it only waits on the pool)
+                day = await loop.run_in_executor(None, next, days, None)
+                if day is None:
+                    break
+                if "analytics" in day:
+                    await loop.run_in_executor(None, analytics_store.record, day["analytics"], day["date"])
+                yield json.dumps(day) + "\n"
+        finally:
+            optimization_pool.release()
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+# Demo data as a stream of job and crew records, the same format the streaming optimize endpoint reads
+@app.get("/api/export/demo-data")
+def export_demo_data(format: Literal["ndjson", "csv"] = "ndjson"):
+    """Demo jobs and crews as NDJSON or CSV, one record per line with a type column"""
+    records = [{"type": "job", **job} for job in mock_data.get_sample_jobs()] + [{"type": "crew", **crew} for crew in mock_data.get_sample_crews()]
+    if format == "csv":
+        return StreamingResponse(csv_lines(records, record_columns(records)), media_type="text/csv")
+    return StreamingResponse(ndjson_lines(records), media_type="application/x-ndjson")
+
+BULK_MODELS = {"job": JobIn, "crew": CrewIn}
+
+# Validates every record of an upload as it is parsed, so a bad line fails fast with its line number
+async def _read_bulk_upload(request):
+    """(jobs, crews) as the plain dicts the scheduler takes"""
+    jobs, crews = [], []
+    async for number, record in parse_records(request.stream(), request.headers.get("content-type")):
+        record_type = record.pop("type", None)
+        model = BULK_MODELS.get(record_type)
+        if model is None:
+            raise BulkInputError(number, 'type must be "job" or "crew"')
+        try:
+            item = model.model_validate(record)
+        except ValidationError as exc:
+            raise BulkInputError(number, "; ".join(f"{'.'.join(map(str, error['loc']))}: {error['msg']}" for error in exc.errors()))
+        # Same dicts OptimizeRequest.job_records and crew_records make
+        if record_type == "job":
+            jobs.append(item.model_dump(exclude_none=True))
+        else:
+            crews.append(item.model_dump())
+    return jobs, crews
+
+# Bulk version of optimize-schedule for big fleets. The body is NDJSON (or CSV with Content-Type: text/csv), one job
+# or crew per line with a type field, and is parsed as it arrives. The answer streams one JSON line per crew's route
+# followed by a summary line, with ids_only the routes list job ids instead of repeating every job
+@app.post("/api/stream/optimize-schedule")
+async def stream_optimize_schedule(
+    request: Request,
+    strategy: Literal["greedy", "local_search", "exact"] = "greedy",
+    time_budget_ms: Optional[float] = Query(default=None, gt=0),
+    partition_by_depot: bool = False,
+    risk_percentile: Optional[float] = Query(default=None, ge=50, le=95),
+    ids_only: bool = False,
+    x_debug_timings: Optional[str] = Header(None)
+):
+    """Optimize jobs and crews uploaded as NDJSON or CSV and stream the routes back"""
+    try:
+        jobs, crews = await _read_bulk_upload(request)
+    except BulkInputError as exc:
+        raise HTTPException(status_code=422, detail=str(exc))
+
+    # The routes are left out of the result and serialized one crew at a time while streaming
+    optimize = partial(
+        scheduler._optimize,
+        strategy=strategy,
+        time_budget_ms=time_budget_ms,
+        partition_by_depot=partition_by_depot,
+        risk_percentile=risk_percentile,
+        serialize_routes=False
+    )
+    try:
+        result, job_table, crew_table, plans = await optimization_pool.run(optimize, jobs, crews)
+    except PoolSaturatedError:
+        raise HTTPException(status_code=503, detail="Scheduler is busy, please retry shortly", headers={"Retry-After": "1"})
+    result = await _finish_result(result, len(jobs), strategy, x_debug_timings)
+
+    def lines():
+        for plan in plans:
+            route = scheduler._serialize_routes(job_table, crew_table, [plan], ids_only)[0]
+            yield json.dumps({"type": "route", **route}) + "\n"
+        yield json.dumps({"type": "summary", **result}) + "\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+# Schedule sessions keep an optimized day on the server so mid-day changes only repair the routes they touch
+# Both go through the optimization pool like optimize-schedule, so a burst of sessions or deltas gets a 503 instead of a queue
+@app.post("/api/sessions", status_code=201)
+async def create_schedule_session(request: OptimizeRequest, x_debug_timings: Optional[str] = Header(None)):
+    """Optimize a day and keep it as a session that accepts deltas"""
+    jobs = request.job_records()
+    optimize = partial(
+        scheduler._optimize,
+        strategy=request.strategy,
+        time_budget_ms=request.time_budget_ms,
+        partition_by_depot=request.partition_by_depot,
+        rebalance=request.rebalance,
+        risk_percentile=request.risk_percentile
+    )
+    try:
+        optimized = await optimization_pool.run(optimize, jobs, request.crew_records())
+    except PoolSaturatedError:
+        raise HTTPException(status_code=503, detail="Scheduler is busy, please retry shortly", headers={"Retry-After": "1"})
+    # The session lives in this process, only the optimization itself may have run in a worker process
+    try:
+        session, result = schedule_sessions.create(
+            scheduler, optimized, request.risk_percentile, request.partition_by_depot, request.rebalance
+        )
+    except DuplicateIdError as exc:
+        raise HTTPException(status_code=422, detail=str(exc))
+    result = await _finish_result(result, len(jobs), request.strategy, x_debug_timings)
+    return {"session_id": session.session_id, "version": session.version, **result}
+
+def _get_session_or_404(session_id):
+    session = schedule_sessions.get(session_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="Schedule session not found")
+    return session
+
+@app.get("/api/sessions/{session_id}")
+def get_schedule_session(session_id: str):
+    """The session's current routes and unassigned jobs"""
+    return _get_session_or_404(session_id).snapshot()
+
+@app.post("/api/sessions/{session_id}/deltas")
+async def apply_schedule_delta(session_id: str, delta: ScheduleDelta):
+    """Apply added, removed or changed jobs and crew changes, returns only the routes that changed"""
+    session = _get_session_or_404(session_id)
+    try:
+        return await optimization_pool.run(session.apply, delta.as_delta(), in_process=True)
+    except PoolSaturatedError:
+        raise HTTPException(status_code=503, detail="Scheduler is busy, please retry shortly", headers={"Retry-After": "1"})
+    except UnknownIdError as exc:
+        raise HTTPException(status_code=404, detail=exc.args[0])
+    except DuplicateIdError as exc:
+        raise HTTPException(status_code=409, detail=str(exc))
+
+# Prometheus scrapes this, counters and histograms for the stages, the model and every route
+@app.get("/metrics", response_class=PlainTextResponse)
+def get_metrics():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+# Crews report how long jobs really took, the background retrainer learns from it
+@app.post("/api/feedback", status_code=201)
+def record_feedback(request: FeedbackRequest):
+    """Record actual durations of completed jobs"""
+    rows = []
+    for job in request.completed_jobs:
+        record = job.model_dump(exclude_none=True)
+        # Same features the model predicts from, so feedback rows line up with predictions
+        rows.append((job.id, get_job_features(record), job.predicted_duration, job.actual_duration))
+    feedback_store.append(rows)
+    FEEDBACK_ROWS.inc(len(rows))
+    model_retrainer.notify()
+    return {"recorded": len(rows), **model_retrainer.status()}
+
+# Dashboard numbers across every optimization so far, read from running totals so nothing is recomputed
+@app.get("/api/analytics")
+def get_analytics(
+    group_by: Literal["day", "crew"] = "day",
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    crew_id: Optional[str] = None
+):
+    """Utilization, idle time, unassigned work and miles summed per day or per crew"""
+    return {
+        "group_by": group_by,
+        "rows": analytics_store.summary(group_by, start and start.isoformat(), end and end.isoformat(), crew_id)
+    }
+
+@app.get("/api/model/training")
+def get_model_training_status():
+    """Live model version, feedback waiting to be trained on and the last retrain"""
+    return model_retrainer.status()
+
+@app.post("/api/model/retrain", status_code=202)
+def retrain_model():
+    """Retrain on the current feedback window in the background, requests keep using the old model until it's done
+    GET /api/model/training shows when the new version is live"""
+    model_retrainer.request_retrain()
+    return model_retrainer.status()
+
+@app.get("/api/model/prediction-cache")
+def get_prediction_cache_stats():
+    """Hit rate and size of the duration prediction cache"""
+    return duration_predictor.prediction_cache_stats()
+
+@app.get("/api/result-cache")
+def get_result_cache_stats():
+    """Hit rate, size in bytes and coalesced requests of the optimize-schedule result cache"""
+    return result_cache.stats()
+
+@app.get("/api/debug/profiles")
+def get_slow_profiles():
+    """Sampling profiles of the most recent slow optimizations, set PROFILE_SLOW_REQUEST_MS to collect them"""
+    return {
+        "enabled": settings.profile_slow_request_ms > 0,
+        "slow_request_ms": settings.profile_slow_request_ms,
+        "profiles": list(slow_profiles)
+    }
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
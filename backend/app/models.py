@@ -0,0 +1,228 @@
+from datetime import date
+from typing import Dict, List, Literal, Optional, Union
+from pydantic import BaseModel, ConfigDict, Field, field_validator, model_validator
+
+# Request and response shapes for the API, FastAPI validates requests against these before our code runs
+# Jobs and crews allow extra fields so anything the frontend sends (customer notes etc.) is passed through untouched
+
+
+class JobIn(BaseModel):
+    model_config = ConfigDict(extra="allow")
+
+    id: str
+    customer: str = ""
+    address: str = ""
+    service_type: str
+    estimated_duration: int = Field(gt=0, description="Human estimate in minutes")
+    priority: str = "medium"
+    crew_size_needed: int = Field(ge=1)
+    estimated_sqft: Optional[Union[int, float]] = Field(default=None, ge=0)
+    tree_count: Optional[int] = Field(default=None, ge=0)
+
+
+class CrewIn(BaseModel):
+    model_config = ConfigDict(extra="allow")
+
+    id: str
+    name: str
+    size: int = Field(ge=1)
+    skills: List[str] = []
+    available_hours: float = Field(ge=0)
+    start_location: str = ""
+
+
+class OptimizeRequest(BaseModel):
+    jobs: List[JobIn] = []
+    crews: List[CrewIn] = []
+    strategy: Literal["greedy", "local_search", "exact"] = "greedy"
+    time_budget_ms: Optional[float] = Field(default=None, gt=0)
+    partition_by_depot: bool = Field(default=False, description="Solve each depot's jobs and crews separately, in parallel")
+    rebalance: bool = Field(default=True, description="With partition_by_depot, give leftover jobs to crews of other depots")
+    risk_percentile: Optional[float] = Field(default=None, ge=50, le=95, description="Pack crews with this percentile of each job's predicted duration")
+
+    def job_records(self):
+        """Jobs as plain dicts for the scheduler, optional fields that weren't sent are left out"""
+        return [job.model_dump(exclude_none=True) for job in self.jobs]
+
+    def crew_records(self):
+        """Crews as plain dicts for the scheduler"""
+        return [crew.model_dump() for crew in self.crews]
+
+
+# Mid-day changes to a schedule session, everything is optional so a delta only carries what changed
+class ScheduleDelta(BaseModel):
+    add_jobs: List[JobIn] = []
+    update_jobs: List[JobIn] = Field(default=[], description="Replace these jobs, matched by id")
+    remove_job_ids: List[str] = []
+    offline_crew_ids: List[str] = []
+    available_hours: Dict[str, float] = Field(default={}, description="New available hours by crew id")
+
+    @field_validator("available_hours")
+    @classmethod
+    def hours_not_negative(cls, value):
+        if any(hours < 0 for hours in value.values()):
+            raise ValueError("available_hours must be >= 0")
+        return value
+
+    def as_delta(self):
+        """The delta as plain dicts for the session"""
+        return {
+            "add_jobs": [job.model_dump(exclude_none=True) for job in self.add_jobs],
+            "update_jobs": [job.model_dump(exclude_none=True) for job in self.update_jobs],
+            "remove_job_ids": self.remove_job_ids,
+            "offline_crew_ids": self.offline_crew_ids,
+            "available_hours": self.available_hours
+        }
+
+
+# A finished job and how long it really took, the model retrains on these
+class CompletedJobIn(JobIn):
+    actual_duration: float = Field(gt=0, description="Minutes the job really took")
+    predicted_duration: Optional[float] = Field(default=None, gt=0, description="What the model predicted, if known")
+
+
+class FeedbackRequest(BaseModel):
+    completed_jobs: List[CompletedJobIn] = Field(min_length=1)
+
+
+# How often a job comes back, weekdays are 0 (Monday) to 6, without them a weekly job repeats on its first day's weekday
+class RecurrenceRule(BaseModel):
+    frequency: Literal["daily", "weekly", "monthly"] = "weekly"
+    interval: int = Field(default=1, ge=1, description="Every interval days, weeks or months")
+    weekdays: Optional[List[int]] = None
+    starts_on: Optional[date] = None
+    until: Optional[date] = None
+
+    @field_validator("weekdays")
+    @classmethod
+    def valid_weekdays(cls, value):
+        if value is not None and any(day < 0 or day > 6 for day in value):
+            raise ValueError("weekdays go from 0 (Monday) to 6 (Sunday)")
+        return value
+
+
+class RecurringJobIn(JobIn):
+    recurrence: RecurrenceRule
+
+
+class OneOffJobIn(JobIn):
+    due_date: Optional[date] = Field(default=None, description="First day the job can be done, defaults to start_date")
+
+
+class HorizonRequest(BaseModel):
+    start_date: date
+    end_date: date
+    crews: List[CrewIn] = Field(description="Crews may list working_weekdays (0 is Monday), without it they work every day")
+    jobs: List[OneOffJobIn] = []
+    recurring_jobs: List[RecurringJobIn] = []
+    strategy: Literal["greedy", "local_search", "exact"] = "greedy"
+    time_budget_ms: Optional[float] = Field(default=None, gt=0, description="Solver time budget per day")
+    max_rollover_days: int = Field(default=6, ge=0, description="Days an unassigned job keeps rolling over before it expires")
+
+    @model_validator(mode="after")
+    def valid_range(self):
+        from app.services.horizon import MAX_HORIZON_DAYS
+        days = (self.end_date - self.start_date).days + 1
+        if days < 1 or days > MAX_HORIZON_DAYS:
+            raise ValueError(f"end_date must be on or after start_date and at most {MAX_HORIZON_DAYS} days later")
+        return self
+
+    def job_records(self):
+        """(due date, job dict) for the one-off jobs"""
+        return [(job.due_date, job.model_dump(exclude_none=True, exclude={"due_date"})) for job in self.jobs]
+
+    def recurring_records(self):
+        """(job dict, recurrence rule dict) for the recurring jobs"""
+        return [(job.model_dump(exclude_none=True, exclude={"recurrence"}), job.recurrence.model_dump()) for job in self.recurring_jobs]
+
+    def crew_records(self):
+        return [crew.model_dump() for crew in self.crews]
+
+
+class ScheduledJob(JobIn):
+    ml_predicted_duration: Optional[int] = None
+    prediction_confidence: Optional[str] = None
+    original_estimate: Optional[int] = None
+    duration_p10: Optional[int] = None
+    duration_p90: Optional[int] = None
+
+
+class Route(BaseModel):
+    crew_id: str
+    crew_name: str
+    jobs: List[ScheduledJob]
+    total_drive_time: str
+    total_work_time: str
+    efficiency_score: int
+    ml_optimized: bool
+    total_miles: Optional[float] = None
+    baseline_miles: Optional[float] = None
+
+
+class EfficiencyReport(BaseModel):
+    efficiency_gain: int
+    miles_saved: int
+    time_saved: float
+    extra_revenue: int
+    success_probability: int
+    ml_time_savings: float
+
+
+class CrewAnalytics(BaseModel):
+    crew_id: str
+    jobs: int
+    work_minutes: float
+    drive_minutes: float
+    available_minutes: float
+    idle_minutes: float
+    utilization: float = Field(description="Work and drive time as a share of the crew's available hours")
+    miles: float
+    baseline_miles: float = Field(description="Miles driving the jobs in assignment order")
+
+
+class AnalyticsTotals(BaseModel):
+    crews: int
+    crews_used: int
+    jobs: int
+    jobs_assigned: int
+    jobs_unassigned: int
+    jobs_over_hours: int = Field(default=0, description="Unassigned jobs that routing took off a crew whose real drive didn't fit its hours")
+    unassigned_minutes: float
+    work_minutes: float
+    drive_minutes: float
+    available_minutes: float
+    idle_minutes: float
+    utilization: float
+    miles: float
+    baseline_miles: float
+
+
+class ScheduleAnalyticsReport(BaseModel):
+    totals: AnalyticsTotals
+    crews: List[CrewAnalytics]
+
+
+class StrategyReport(BaseModel):
+    strategy: str
+    objective: float
+    greedy_objective: float
+    improvement_pct: float
+    optimal: bool
+    solve_time_ms: float
+    time_budget_ms: float
+    partitions: Optional[int] = None
+    parallel: Optional[bool] = None
+    rebalanced_jobs: Optional[int] = None
+    risk_percentile: Optional[float] = None
+    note: Optional[str] = Field(default=None, description="Set when the problem was too big for the strategy and a cheaper one ran")
+
+
+class OptimizeResponse(BaseModel):
+    status: str
+    routes: List[Route]
+    unassigned_job_ids: List[str] = Field(default=[], description="Jobs that didn't fit in any crew's day")
+    efficiency_report: EfficiencyReport
+    recommendations: List[str]
+    analytics: ScheduleAnalyticsReport
+    strategy_report: StrategyReport
+    ml_model_info: dict
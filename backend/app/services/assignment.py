@@ -0,0 +1,158 @@
+import numpy as np
+from .tables import as_crew_table, as_job_table
+
+# Maps each service_type to the skill we expect the crew doing it to have
+# Built once here instead of on every skill match check
+SERVICE_SKILLS = {
+    "weekly_mowing": "mowing",
+    "large_cleanup": "cleanup",
+    "tree_trimming": "tree_work"
+}
+# Service types we don't know about are treated as mowing
+DEFAULT_SKILL = "mowing"
+
+# Average travel time between jobs assumed when checking if a job still fits in a crew's day
+TRAVEL_MINUTES_PER_JOB = 25
+
+
+def required_skill(service_type):
+    """The crew skill a service type needs"""
+    return SERVICE_SKILLS.get(service_type, DEFAULT_SKILL)
+
+
+# Builds the skill match scores in one go with numpy, 1.0 when the crew has the skill a job needs and 0.5 when it doesn't,
+# same scores as the old per pair check. Scores are stored per crew x skill, crew c's score for job j is
+# match[c, job_skill[j]], so memory grows with crews x skills instead of crews x jobs
+def skill_match_matrix(jobs, crews):
+    """Return (match matrix of shape crews x skills, skill index of every job) for a JobTable and CrewTable"""
+    skills = {}
+    job_skill = np.array([skills.setdefault(required_skill(service_type), len(skills)) for service_type in jobs.service_types], dtype=np.intp)
+
+    # crew_has[c, s] is True when crew c has skill s
+    crew_has = np.zeros((len(crews), len(skills)), dtype=bool)
+    for c, crew_skills in enumerate(crews.skills):
+        for skill in crew_skills:
+            if skill in skills:
+                crew_has[c, skills[skill]] = True
+
+    return np.where(crew_has, 1.0, 0.5), job_skill
+
+
+# Min segment tree over the costs of one bucket's jobs, answers "first job at or after position p that costs
+# at most x" in O(log n). Assigned jobs are set to infinity so they are never found again
+class MinCostTree:
+    def __init__(self, costs):
+        self.n = len(costs)
+        self.size = 1
+        while self.size < max(1, self.n):
+            self.size *= 2
+        tree = [float("inf")] * (2 * self.size)
+        tree[self.size:self.size + self.n] = [float(cost) for cost in costs]
+        for i in range(self.size - 1, 0, -1):
+            tree[i] = min(tree[2 * i], tree[2 * i + 1])
+        self.tree = tree
+
+    def remove(self, position):
+        """Take a job out of the tree"""
+        tree = self.tree
+        i = position + self.size
+        tree[i] = float("inf")
+        i //= 2
+        while i:
+            tree[i] = min(tree[2 * i], tree[2 * i + 1])
+            i //= 2
+
+    def first_at_most(self, start, limit):
+        """First position >= start whose cost is <= limit, or -1"""
+        if start >= self.n:
+            return -1
+        tree, size = self.tree, self.size
+        i = start + size
+        while True:
+            if tree[i] <= limit:
+                # Something in this subtree fits, walk down to the leftmost leaf that does
+                while i < size:
+                    i = 2 * i if tree[2 * i] <= limit else 2 * i + 1
+                return i - size
+            # Move to the next subtree to the right, going up while we are a right child
+            while i & 1:
+                i >>= 1
+            if i == 0:
+                return -1
+            i += 1
+
+
+# Greedy crew by crew assignment, gives the same result as the original loop but with indexes instead of rescans
+# Jobs are grouped into buckets by (required skill, high priority, crew size needed), each bucket keeps input order.
+# A crew tries its buckets best skill match and high priority first, jobs with the same rank in input order,
+# which is the order the old stable sort produced. Instead of scanning every candidate, each bucket's segment tree
+# jumps straight to the next job that still fits, so a crew only touches the jobs it takes
+class AssignmentEngine:
+    def __init__(self, jobs, crews, travel_minutes=TRAVEL_MINUTES_PER_JOB):
+        # Works on JobTable / CrewTable columns, plain lists of dicts are converted once
+        self.jobs = as_job_table(jobs)
+        self.crews = as_crew_table(crews)
+        self.travel_minutes = travel_minutes
+
+        # Crews are packed with the planning duration, the mean prediction unless the plan is risk aware
+        self.durations = self.jobs.planning_duration
+        self.sizes = self.jobs.crew_size_needed
+        self.is_high = self.jobs.is_high
+        self.match, self.job_skill = skill_match_matrix(self.jobs, self.crews)
+
+        # (skill, is_high, size_needed) -> job indices in input order
+        self.buckets = {}
+        for j in range(len(self.jobs)):
+            key = (int(self.job_skill[j]), bool(self.is_high[j]), int(self.sizes[j]))
+            self.buckets.setdefault(key, []).append(j)
+
+    def _ranked_buckets(self, crew_index):
+        """The bucket keys the crew is big enough for, grouped by rank, best rank first"""
+        crew_size = self.crews.sizes[crew_index]
+        groups = {}
+        for key in self.buckets:
+            skill, is_high, size_needed = key
+            if size_needed > crew_size:
+                continue
+            # Smaller rank comes first: better skill match, then high priority
+            rank = (-self.match[crew_index, skill], -int(is_high))
+            groups.setdefault(rank, []).append(key)
+        return [groups[rank] for rank in sorted(groups)]
+
+    def assign(self):
+        """Return a list with the assigned job indices for each crew"""
+        costs = (self.durations + self.travel_minutes).tolist()
+        trees = {key: MinCostTree([costs[j] for j in job_indices]) for key, job_indices in self.buckets.items()}
+
+        assignments = []
+        for c in range(len(self.crews)):
+            crew_jobs = []
+            available_minutes = self.crews.available_minutes[c]
+            used_minutes = 0
+
+            for group in self._ranked_buckets(c):
+                # Where to resume searching in each bucket, everything before it was already too long for this crew
+                positions = dict.fromkeys(group, 0)
+                while True:
+                    # The next job in input order across this rank's buckets that still fits
+                    remaining = available_minutes - used_minutes
+                    best_key, best_position, best_job = None, -1, None
+                    for key in group:
+                        position = trees[key].first_at_most(positions[key], remaining)
+                        if position < 0:
+                            positions[key] = len(self.buckets[key])
+                            continue
+                        positions[key] = position
+                        j = self.buckets[key][position]
+                        if best_job is None or j < best_job:
+                            best_key, best_position, best_job = key, position, j
+                    if best_job is None:
+                        break
+                    crew_jobs.append(best_job)
+                    used_minutes += costs[best_job]
+                    # Removing the job from its tree is how it leaves the pool for every later crew
+                    trees[best_key].remove(best_position)
+                    positions[best_key] = best_position + 1
+
+            assignments.append(crew_jobs)
+        return assignments
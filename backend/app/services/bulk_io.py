@@ -0,0 +1,143 @@
+import csv
+import json
+
+# Columns that hold lists, in CSV they are written as one cell with the items separated by semicolons
+CSV_LIST_FIELDS = {"skills"}
+
+# No job or crew record comes close to this, a longer line (or CSV row) is a broken or hostile upload
+MAX_LINE_BYTES = 1 << 20
+
+
+# A line of an upload that can't be used, the API turns this into a 422 that names the line
+class BulkInputError(ValueError):
+    def __init__(self, line, message):
+        super().__init__(f"line {line}: {message}")
+        self.line = line
+
+
+# Uploads are read chunk by chunk as they arrive, only the current partial line is ever held,
+# never the whole body, so a big upload costs the parsed records and nothing more
+# Each chunk is scanned for newlines once and the pieces of a line that spans chunks are joined once when it ends,
+# so a long line split into many small chunks costs linear time, not a copy and a rescan per chunk
+async def iter_lines(chunks, max_line_bytes=MAX_LINE_BYTES):
+    """Complete lines (bytes, without the newline) from an async iterator of byte chunks,
+    raises BulkInputError for a line longer than max_line_bytes"""
+    parts = [] # The current line's pieces from earlier chunks
+    size = 0
+    number = 1
+    async for chunk in chunks:
+        start = 0
+        end = chunk.find(b"\n")
+        while end >= 0:
+            if size + end - start > max_line_bytes:
+                raise BulkInputError(number, f"line is longer than {max_line_bytes} bytes")
+            if parts:
+                parts.append(chunk[start:end])
+                yield b"".join(parts)
+                parts, size = [], 0
+            else:
+                yield chunk[start:end]
+            number += 1
+            start = end + 1
+            end = chunk.find(b"\n", start)
+        if start < len(chunk):
+            size += len(chunk) - start
+            # Checked as the line grows, a line without a newline mustn't get to fill memory first
+            if size > max_line_bytes:
+                raise BulkInputError(number, f"line is longer than {max_line_bytes} bytes")
+            parts.append(chunk[start:])
+    if parts:
+        yield b"".join(parts)
+
+
+def _decode(number, line):
+    try:
+        return line.decode("utf-8").rstrip("\r")
+    except UnicodeDecodeError:
+        raise BulkInputError(number, "not valid UTF-8")
+
+
+async def parse_ndjson(chunks):
+    """(line number, record dict) for every non blank line of an NDJSON upload"""
+    number = 0
+    async for line in iter_lines(chunks):
+        number += 1
+        text = _decode(number, line)
+        if not text.strip():
+            continue
+        try:
+            record = json.loads(text)
+        except ValueError as exc:
+            raise BulkInputError(number, f"invalid JSON ({exc})")
+        if not isinstance(record, dict):
+            raise BulkInputError(number, "expected a JSON object")
+        yield number, record
+
+
+# The first row is the header, empty cells are left out of the record so optional fields get their defaults
+# Values stay strings, the API's models convert them ("3" -> 3) when they validate each record
+async def parse_csv(chunks):
+    """(line number, record dict) for every data row of a CSV upload"""
+    header = None
+    pending = "" # A row whose quoted field continues on the next line
+    number = 0
+    async for line in iter_lines(chunks):
+        number += 1
+        text = pending + _decode(number, line).lstrip("\ufeff" if number == 1 else "")
+        # An odd number of quotes means a quoted field is still open
+        if text.count('"') % 2:
+            if len(text) > MAX_LINE_BYTES:
+                raise BulkInputError(number, f"row is longer than {MAX_LINE_BYTES} bytes")
+            pending = text + "\n"
+            continue
+        pending = ""
+        row = next(csv.reader([text]), [])
+        if header is None:
+            header = [name.strip() for name in row]
+            continue
+        if not any(cell.strip() for cell in row):
+            continue
+        if len(row) > len(header):
+            raise BulkInputError(number, f"{len(row)} cells but the header has {len(header)} columns")
+        yield number, {
+            name: value.split(";") if name in CSV_LIST_FIELDS else value
+            for name, value in zip(header, row) if value != ""
+        }
+    if pending:
+        raise BulkInputError(number, "unterminated quoted field")
+
+
+def parse_records(chunks, content_type):
+    """Parse an upload as CSV when the content type says so, NDJSON otherwise"""
+    return parse_csv(chunks) if "csv" in (content_type or "").lower() else parse_ndjson(chunks)
+
+
+def ndjson_lines(records):
+    """One JSON line per record"""
+    for record in records:
+        yield json.dumps(record) + "\n"
+
+
+def record_columns(records):
+    """Every key the records use, in the order they first show up"""
+    columns = {}
+    for record in records:
+        columns.update(dict.fromkeys(record))
+    return list(columns)
+
+
+def csv_lines(records, columns):
+    """The header and one CSV line per record, lists joined with semicolons like parse_csv expects them"""
+    writer = csv.writer(_LineBuffer(), lineterminator="\n")
+    yield writer.writerow(columns)
+    for record in records:
+        yield writer.writerow([
+            ";".join(str(item) for item in value) if isinstance(value, (list, tuple)) else ("" if value is None else value)
+            for value in (record.get(column) for column in columns)
+        ])
+
+
+# csv.writer wants a file, this one hands each written line straight back so rows can be yielded one at a time
+class _LineBuffer:
+    def write(self, line):
+        return line
@@ -0,0 +1,100 @@
+import threading
+import time
+from collections import OrderedDict
+
+# Marks a missing entry in get_many, None can be a real cached value
+MISSING = object()
+
+
+# Small thread safe least recently used cache with hit and miss counters
+# Once it holds maxsize entries, adding one more drops the entry that was used longest ago
+# With ttl_seconds set, entries older than that count as missing and are dropped when looked up
+# With max_weight and weigh set, the oldest entries are also dropped while the weights (weigh(value), bytes for example)
+# add up to more than max_weight, a value heavier than max_weight on its own is never stored
+class LRUCache:
+    def __init__(self, maxsize=128, ttl_seconds=None, max_weight=None, weigh=None):
+        self.maxsize = maxsize
+        self.ttl_seconds = ttl_seconds or None
+        self.max_weight = max_weight if weigh is not None else None
+        self.weigh = weigh
+        self.hits = 0
+        self.misses = 0
+        self.weight = 0
+        self._data = OrderedDict() # key -> (value, time it was stored, weight)
+        self._lock = threading.Lock()
+
+    def _lookup(self, key, now):
+        # Callers hold the lock
+        entry = self._data.get(key)
+        if entry is not None and (self.ttl_seconds is None or now - entry[1] < self.ttl_seconds):
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+        if entry is not None:
+            self._drop(key)
+        self.misses += 1
+        return MISSING
+
+    def _drop(self, key):
+        # Callers hold the lock
+        self.weight -= self._data.pop(key)[2]
+
+    def _store(self, key, value, now):
+        # Callers hold the lock
+        weight = self.weigh(value) if self.weigh is not None else 0
+        if key in self._data:
+            self._drop(key)
+        if self.max_weight is not None and weight > self.max_weight:
+            return
+        self._data[key] = (value, now, weight)
+        self.weight += weight
+        while len(self._data) > self.maxsize or (self.max_weight is not None and self.weight > self.max_weight):
+            self._drop(next(iter(self._data)))
+
+    def get(self, key, default=None):
+        """Return the cached value and mark it as recently used"""
+        with self._lock:
+            value = self._lookup(key, time.monotonic())
+        return default if value is MISSING else value
+
+    def get_many(self, keys):
+        """Look up many keys under one lock, missing ones come back as MISSING"""
+        with self._lock:
+            now = time.monotonic()
+            return [self._lookup(key, now) for key in keys]
+
+    def set(self, key, value):
+        """Add or replace a value, evicting the oldest entries if the cache is full"""
+        with self._lock:
+            self._store(key, value, time.monotonic())
+
+    def set_many(self, items):
+        """Add or replace many (key, value) pairs under one lock"""
+        with self._lock:
+            now = time.monotonic()
+            for key, value in items:
+                self._store(key, value, now)
+
+    def clear(self):
+        """Drop every entry, the counters are kept"""
+        with self._lock:
+            self._data.clear()
+            self.weight = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        """Hit and miss counts plus the current size"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            weights = {"weight": self.weight, "max_weight": self.max_weight} if self.weigh is not None else {}
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "ttl_seconds": self.ttl_seconds,
+                **weights
+            }
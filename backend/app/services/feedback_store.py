@@ -0,0 +1,93 @@
+import os
+import sqlite3
+import threading
+import time
+import numpy as np
+from ..config import settings
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS job_feedback (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    job_id TEXT NOT NULL,
+    property_sqft REAL NOT NULL,
+    tree_count REAL NOT NULL,
+    complexity_score REAL NOT NULL,
+    crew_size REAL NOT NULL,
+    predicted_duration REAL,
+    actual_duration REAL NOT NULL,
+    recorded_at REAL NOT NULL
+)
+"""
+
+
+# Append only SQLite table of how long completed jobs really took, the model retrains on it
+# Rows are never updated or deleted, the newest rows are simply the last ids, which makes the sliding window a cheap tail read
+class FeedbackStore:
+    def __init__(self, db_path=None):
+        self.db_path = db_path or settings.feedback_db
+        self._connection = None
+        self._lock = threading.Lock() # One connection shared between the API threads and the retrain thread
+
+    def _connect(self):
+        # Callers hold the lock
+        if self._connection is None:
+            os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+            self._connection = sqlite3.connect(self.db_path, check_same_thread=False)
+            # WAL lets other workers read while one of them appends
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute(SCHEMA)
+        return self._connection
+
+    def _exists(self):
+        return self._connection is not None or os.path.exists(self.db_path)
+
+    def append(self, rows):
+        """Store (job_id, features, predicted_duration, actual_duration) rows, returns the id of the last one"""
+        now = time.time()
+        records = [
+            (job_id, *(float(value) for value in features), None if predicted is None else float(predicted), float(actual), now)
+            for job_id, features, predicted, actual in rows
+        ]
+        with self._lock:
+            connection = self._connect()
+            with connection:
+                connection.executemany(
+                    "INSERT INTO job_feedback (job_id, property_sqft, tree_count, complexity_score, crew_size, "
+                    "predicted_duration, actual_duration, recorded_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    records
+                )
+            return self._last_id(connection)
+
+    def _last_id(self, connection):
+        return connection.execute("SELECT COALESCE(MAX(id), 0) FROM job_feedback").fetchone()[0]
+
+    def last_id(self):
+        """Id of the newest row, 0 when there is none, rows since a training run are last_id() minus the id it saw"""
+        if not self._exists():
+            return 0
+        with self._lock:
+            return self._last_id(self._connect())
+
+    def window(self, limit):
+        """(X, y, last id) for the newest limit rows, oldest first, so training cost stays bounded as history grows"""
+        if not self._exists():
+            return np.zeros((0, 4)), np.zeros(0), 0
+        with self._lock:
+            rows = self._connect().execute(
+                "SELECT id, property_sqft, tree_count, complexity_score, crew_size, actual_duration "
+                "FROM job_feedback ORDER BY id DESC LIMIT ?", (int(limit),)
+            ).fetchall()
+        if not rows:
+            return np.zeros((0, 4)), np.zeros(0), 0
+        data = np.array(rows[::-1], dtype=float)
+        return data[:, 1:5], data[:, 5], int(data[-1, 0])
+
+    def close(self):
+        with self._lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
+
+
+# Global instance
+feedback_store = FeedbackStore()
@@ -0,0 +1,168 @@
+import calendar
+import heapq
+from datetime import timedelta
+from itertools import count
+from .tables import CrewTable
+
+# Plans longer than this are refused, a season is about half of it
+MAX_HORIZON_DAYS = 366
+
+
+def _add_months(day, months):
+    """The same day of the month, months later, or None if that month is too short (the 31st in April)"""
+    month = day.month - 1 + months
+    year = day.year + month // 12
+    month = month % 12 + 1
+    if day.day > calendar.monthrange(year, month)[1]:
+        return None
+    return day.replace(year=year, month=month)
+
+
+# Yields the dates a recurrence rule falls on between start and end, one at a time, so a year of weekly
+# jobs is never held in memory. rule has frequency (daily, weekly or monthly), interval, weekdays (0 is Monday),
+# starts_on and until, the last three optional
+def recurrence_dates(rule, start, end):
+    """Dates from start to end (inclusive) the rule falls on, in order"""
+    anchor = rule.get("starts_on") or start
+    last = min(end, rule.get("until") or end)
+    interval = rule.get("interval", 1)
+    weekdays = set(rule["weekdays"]) if rule.get("weekdays") else None
+    frequency = rule.get("frequency", "weekly")
+
+    if frequency == "monthly":
+        step = 0
+        while _add_months(anchor.replace(day=1), step) <= last:
+            day = _add_months(anchor, step)
+            step += interval
+            if day is not None and start <= day <= last:
+                yield day
+    elif frequency == "daily":
+        # Jump straight to the first occurrence on or after start instead of walking from the anchor
+        day = anchor if anchor >= start else anchor + timedelta(days=-(-(start - anchor).days // interval) * interval)
+        while day <= last:
+            if weekdays is None or day.weekday() in weekdays:
+                yield day
+            day += timedelta(days=interval)
+    else:
+        # Weekly: the rule's weekdays (or the anchor's weekday) in every interval-th week counted from the anchor's week
+        weekdays = weekdays or {anchor.weekday()}
+        week = anchor - timedelta(days=anchor.weekday())
+        if week + timedelta(days=7) <= start:
+            skip_weeks = (start - week).days // 7
+            week += timedelta(weeks=skip_weeks - skip_weeks % interval)
+        while week <= last:
+            for weekday in sorted(weekdays):
+                day = week + timedelta(days=weekday)
+                if max(start, anchor) <= day <= last:
+                    yield day
+            week += timedelta(weeks=interval)
+
+
+def expand_recurring_job(job, rule, start, end):
+    """One job dict per occurrence, with its own id, the date it's due and the id of the job it recurs from"""
+    for day in recurrence_dates(rule, start, end):
+        occurrence = dict(job)
+        occurrence["id"] = f"{job['id']}@{day.isoformat()}"
+        occurrence["recurrence_id"] = job["id"]
+        occurrence["scheduled_date"] = day.isoformat()
+        yield day, occurrence
+
+
+# Plans a date range one day at a time and yields each day's result as soon as it is computed
+# Recurring jobs are expanded lazily and merged by date, so memory holds one day's jobs plus the rollover backlog,
+# no matter how long the horizon is. Jobs that don't fit roll over to the next day (first in line there)
+# for up to max_rollover_days, after that, or once a newer occurrence of the same recurring job comes due, they expire
+# optimize is ScheduleOptimizer.optimize_schedule or anything that takes the same arguments, the API passes one that
+# runs each day on the optimization pool
+class HorizonPlanner:
+    def __init__(self, optimize, strategy="greedy", time_budget_ms=None, max_rollover_days=6):
+        self.optimize = optimize
+        self.strategy = strategy
+        self.time_budget_ms = time_budget_ms
+        self.max_rollover_days = max_rollover_days
+
+    def plan(self, start, end, crews, jobs=(), recurring_jobs=()):
+        """Yield a result dict per day, then a summary. jobs are (due date or None, job dict),
+        recurring_jobs are (job dict, recurrence rule dict)"""
+        # heapq.merge pulls from every recurring job's generator lazily, the counter keeps equal dates in input order
+        order = count()
+        # One-off jobs due after the range can't be planned in it, they are listed in the summary instead of dropped
+        out_of_horizon = [job["id"] for due, job in jobs if due is not None and due > end]
+        one_off = sorted(((due or start, next(order), job) for due, job in jobs if due is None or due <= end), key=lambda item: item[:2])
+        streams = [
+            ((day, next(order), occurrence) for day, occurrence in expand_recurring_job(job, rule, start, end))
+            for job, rule in recurring_jobs
+        ]
+        due_jobs = heapq.merge(iter(one_off), *streams, key=lambda item: item[:2])
+        upcoming = next(due_jobs, None)
+
+        crew_tables = {} # weekday -> CrewTable of the crews working that day
+        backlog = [] # (first due date, job dict) waiting since an earlier day, oldest first
+        totals = {"days": 0, "scheduled_jobs": 0, "expired_jobs": 0}
+
+        day = start
+        while day <= end:
+            todays = []
+            while upcoming is not None and upcoming[0] <= day:
+                todays.append((upcoming[0], upcoming[2]))
+                upcoming = next(due_jobs, None)
+
+            # A recurring job that comes due again replaces its older occurrence still waiting in the backlog
+            recurring_today = {job["recurrence_id"] for _, job in todays if "recurrence_id" in job}
+            expired = [job["id"] for _, job in backlog if job.get("recurrence_id") in recurring_today]
+            backlog = [(due, job) for due, job in backlog if job.get("recurrence_id") not in recurring_today]
+
+            candidates = backlog + todays
+            result = self._plan_day(day, candidates, self._crews_for(day, crews, crew_tables))
+
+            backlog = []
+            unassigned = set(result["unassigned_job_ids"])
+            for due, job in candidates:
+                if job["id"] not in unassigned:
+                    continue
+                if (day - due).days < self.max_rollover_days and day < end:
+                    backlog.append((due, job))
+                else:
+                    expired.append(job["id"])
+            result["expired_job_ids"] = expired
+            result["rolled_over_job_ids"] = [job["id"] for _, job in backlog]
+
+            totals["days"] += 1
+            totals["scheduled_jobs"] += result["scheduled_job_count"]
+            totals["expired_jobs"] += len(expired)
+            yield result
+            day += timedelta(days=1)
+
+        yield {
+            "type": "summary", "start_date": start.isoformat(), "end_date": end.isoformat(), **totals,
+            "out_of_horizon_jobs": len(out_of_horizon), "out_of_horizon_job_ids": out_of_horizon
+        }
+
+    def _crews_for(self, day, crews, crew_tables):
+        # Crews may list working_weekdays (0 is Monday), without it they work every day
+        weekday = day.weekday()
+        if weekday not in crew_tables:
+            crew_tables[weekday] = CrewTable([crew for crew in crews if weekday in crew.get("working_weekdays", range(7))])
+        return crew_tables[weekday]
+
+    def _plan_day(self, day, candidates, crews):
+        jobs = [job for _, job in candidates]
+        if not jobs or not len(crews):
+            return {
+                "type": "day",
+                "date": day.isoformat(),
+                "routes": [],
+                "scheduled_job_count": 0,
+                "unassigned_job_ids": [job["id"] for job in jobs]
+            }
+        # The backlog comes first in the job list, so at equal rank the greedy gives waiting jobs their slot first
+        response = self.optimize(jobs, crews, strategy=self.strategy, time_budget_ms=self.time_budget_ms)
+        return {
+            "type": "day",
+            "date": day.isoformat(),
+            "routes": response["routes"],
+            "scheduled_job_count": sum(len(route["jobs"]) for route in response["routes"]),
+            "unassigned_job_ids": response["unassigned_job_ids"],
+            "efficiency_report": response["efficiency_report"],
+            "analytics": response["analytics"]
+        }
@@ -0,0 +1,154 @@
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from concurrent.futures import wait
+from .worker_pool import optimization_pool
+
+
+# The interface every job store backend implements, a backend missing a method fails when it's created instead of
+# on the first request that needs it, so the in-memory store can later be swapped for Redis or a database
+class JobStoreBackend(ABC):
+    @abstractmethod
+    def create(self, job_id, record):
+        """Store a new job record"""
+
+    @abstractmethod
+    def update(self, job_id, **fields):
+        """Change fields on an existing job record"""
+
+    @abstractmethod
+    def append_event(self, job_id, event):
+        """Add a progress event to the job's event log"""
+
+    @abstractmethod
+    def get(self, job_id):
+        """Return a copy of the job record, or None if it doesn't exist"""
+
+    @abstractmethod
+    def get_events(self, job_id, start=0):
+        """Return the job's events from index start onwards"""
+
+
+# Keeps everything in a dict in this process, good for one worker and for tests
+class InMemoryJobStore(JobStoreBackend):
+    def __init__(self, max_jobs=1000):
+        self.max_jobs = max_jobs # Oldest finished jobs are dropped once we hold more than this
+        self._jobs = OrderedDict()
+        self._events = {}
+        self._lock = threading.Lock() # Jobs are updated from worker threads and read from the event loop
+
+    def create(self, job_id, record):
+        with self._lock:
+            self._jobs[job_id] = dict(record)
+            self._events[job_id] = []
+            self._evict()
+
+    def update(self, job_id, **fields):
+        with self._lock:
+            if job_id in self._jobs:
+                self._jobs[job_id].update(fields)
+
+    def append_event(self, job_id, event):
+        with self._lock:
+            if job_id in self._events:
+                self._events[job_id].append(event)
+
+    def get(self, job_id):
+        with self._lock:
+            record = self._jobs.get(job_id)
+            return dict(record) if record is not None else None
+
+    def get_events(self, job_id, start=0):
+        with self._lock:
+            return list(self._events.get(job_id, [])[start:])
+
+    def _evict(self):
+        # Only finished jobs are evicted, someone may still be waiting on a running one
+        if len(self._jobs) <= self.max_jobs:
+            return
+        for job_id in list(self._jobs):
+            if len(self._jobs) <= self.max_jobs:
+                break
+            if self._jobs[job_id]["status"] in ("completed", "failed"):
+                del self._jobs[job_id]
+                del self._events[job_id]
+
+
+# Runs submitted optimizations in the background and records their progress and result in the store
+# Jobs go through the optimization pool like every other optimization: each holds one of its places from submit
+# until it finishes, so jobs and optimize-schedule share the same limits (and 503s), and OPTIMIZER_EXECUTOR decides
+# where they run. The pool's threads wait on the job, in process mode the optimization itself runs in a worker process
+class OptimizationJobManager:
+    def __init__(self, store=None, pool=None):
+        self.store = store or InMemoryJobStore()
+        self.pool = pool or optimization_pool
+        self._futures = set() # Jobs queued or running, shutdown waits for them
+        self._lock = threading.Lock()
+
+    def submit(self, optimize, jobs, crews, on_result=None):
+        """Queue optimize(jobs, crews) and return the new job id, raises PoolSaturatedError when the pool is full
+        on_result(result) runs in this process once the optimization is done, before the job shows as completed"""
+        self.pool.reserve()
+        job_id = uuid.uuid4().hex
+        self.store.create(job_id, {
+            "job_id": job_id,
+            "status": "queued",
+            "phase": None,
+            "percent": 0,
+            "job_count": len(jobs),
+            "crew_count": len(crews),
+            "submitted_at": time.time(),
+            "result": None,
+            "error": None
+        })
+        try:
+            future = self.pool.local_executor.submit(self._run, job_id, optimize, jobs, crews, on_result)
+        except Exception:
+            self.pool.release()
+            raise
+        with self._lock:
+            self._futures.add(future)
+        future.add_done_callback(self._forget)
+        return job_id
+
+    def _forget(self, future):
+        with self._lock:
+            self._futures.discard(future)
+
+    def _run(self, job_id, optimize, jobs, crews, on_result):
+        def on_progress(event):
+            # Every phase change is recorded both as an event (for streaming) and on the record (for polling)
+            self.store.append_event(job_id, event)
+            self.store.update(job_id, phase=event["phase"], percent=event["percent"])
+
+        try:
+            self.store.update(job_id, status="running", started_at=time.time())
+            if self.pool.executor_type == "process":
+                # A worker process can't call back into this one, the events go straight from running to complete
+                on_progress({"phase": "optimizing", "percent": 0, "message": "Optimizing in a worker process"})
+                result = self.pool.run_in_worker(optimize, jobs, crews)
+            else:
+                result = optimize(jobs, crews, progress_callback=on_progress)
+            if on_result is not None:
+                on_result(result)
+            self.store.update(job_id, result=result)
+            on_progress({"phase": "complete", "percent": 100, "message": "Optimization complete"})
+            self.store.update(job_id, status="completed", finished_at=time.time())
+        except Exception as exc:
+            self.store.append_event(job_id, {"phase": "failed", "percent": 100, "message": str(exc)})
+            self.store.update(job_id, status="failed", error=str(exc), finished_at=time.time())
+        finally:
+            self.pool.release()
+
+    def shutdown(self):
+        """Wait for queued and running jobs, call it before the pool shuts down. Nothing here stops for good,
+        the pool creates its executors again when the app starts up again"""
+        with self._lock:
+            futures = list(self._futures)
+        wait(futures)
+
+
+# Global instance
+optimization_jobs = OptimizationJobManager()
@@ -0,0 +1,184 @@
+import csv
+import re
+import threading
+import numpy as np
+from functools import lru_cache
+from .cache import LRUCache
+from ..config import settings
+
+# Used for any pair of locations we know nothing about, 25 minutes is the average travel time the scheduler always assumed
+DEFAULT_LEG = {"miles": 8.0, "minutes": 25}
+
+# Roads are never straight, straight line miles are multiplied by this to estimate driving miles
+ROAD_FACTOR = 1.3
+# Average city driving speed used to turn estimated miles into minutes
+AVERAGE_SPEED_MPH = 25
+EARTH_RADIUS_MILES = 3958.8
+
+# Common street suffixes so "Oak Street" and "Oak St." end up with the same id
+STREET_ABBREVIATIONS = {
+    "street": "st",
+    "avenue": "ave",
+    "drive": "dr",
+    "road": "rd",
+    "lane": "ln",
+    "boulevard": "blvd",
+    "court": "ct",
+    "place": "pl",
+    "parkway": "pkwy",
+    "highway": "hwy"
+}
+
+
+# Turns an address into a stable id, "1234 Oak Street, Austin TX" and "1234 oak st" both become "1234 oak st"
+# Everything after the first comma (city, state, zip) is dropped since all our customers are in one metro area
+@lru_cache(maxsize=65536)
+def normalize_address(address):
+    """Stable location id for an address"""
+    street = (address or "").split(",")[0].lower()
+    words = re.sub(r"[^a-z0-9 ]+", " ", street).split()
+    return " ".join(STREET_ABBREVIATIONS.get(word, word) for word in words)
+
+
+# Straight line distance in miles between every pair of points, all at once with numpy
+def haversine_matrix(latitudes, longitudes):
+    """All pairs great circle distances in miles"""
+    lat = np.radians(latitudes)
+    lon = np.radians(longitudes)
+    dlat = lat[:, None] - lat[None, :]
+    dlon = lon[:, None] - lon[None, :]
+    a = np.sin(dlat / 2) ** 2 + np.cos(lat[:, None]) * np.cos(lat[None, :]) * np.sin(dlon / 2) ** 2
+    return 2 * EARTH_RADIUS_MILES * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+# Knows where every location is and how long it takes to drive between them
+# Coordinates come from a local CSV file, measured legs (like the scheduler's distance matrix) override the estimates,
+# and every other pair is estimated from the haversine distance. Matrices are cached per set of locations,
+# so optimizing the same customer base again skips building them
+class LocationIndex:
+    def __init__(self, locations_file=None, cache_size=4096):
+        self.locations_file = locations_file or settings.locations_file
+        self.coordinates = None # location id -> (latitude, longitude), loaded on first use
+        self.known_legs = {} # (id, id) -> {"miles", "minutes"} measured in both directions
+        self.matrix_cache = LRUCache(maxsize=cache_size)
+        self._lock = threading.Lock()
+
+    def _load(self):
+        if self.coordinates is not None:
+            return
+        with self._lock:
+            if self.coordinates is not None:
+                return
+            coordinates = {}
+            try:
+                with open(self.locations_file, newline="") as f:
+                    for row in csv.DictReader(f):
+                        coordinates[normalize_address(row["address"])] = (float(row["latitude"]), float(row["longitude"]))
+            except FileNotFoundError:
+                pass # No coordinates just means every pair uses the default leg
+            self.coordinates = coordinates
+
+    def location_id(self, address):
+        """Stable id for an address"""
+        return normalize_address(address)
+
+    def add_location(self, address, latitude, longitude):
+        """Add or move a location"""
+        self._load()
+        location_id = normalize_address(address)
+        with self._lock:
+            if self.coordinates.get(location_id) != (latitude, longitude):
+                self.coordinates[location_id] = (latitude, longitude)
+                self.matrix_cache.clear()
+        return location_id
+
+    def add_known_legs(self, distance_matrix):
+        """Register measured travel legs, {(from, to): {"miles", "minutes"}}, they win over estimates"""
+        legs = {}
+        for (origin, destination), leg in distance_matrix.items():
+            a, b = normalize_address(origin), normalize_address(destination)
+            legs[(a, b)] = legs[(b, a)] = {"miles": leg["miles"], "minutes": leg["minutes"]}
+        with self._lock:
+            # Calling this again with the same legs is cheap and keeps the cache
+            changed = any(self.known_legs.get(key) != leg for key, leg in legs.items())
+            if changed:
+                self.known_legs.update(legs)
+                self.matrix_cache.clear()
+
+    def travel_matrices(self, location_ids):
+        """Return (index, minutes, miles) for a set of location ids, index maps each id to its row"""
+        self._load()
+        key = tuple(sorted(set(location_ids)))
+        cached = self.matrix_cache.get(key)
+        if cached is None:
+            cached = self._build(key)
+            self.matrix_cache.set(key, cached)
+        return cached
+
+    def legs_from(self, origin, destinations):
+        """Estimated (minutes, miles) from one location id to each of many, without building a full matrix"""
+        minutes, miles = self.legs_between([origin], destinations)
+        return minutes[0], miles[0]
+
+    def legs_between(self, origins, destinations):
+        """Estimated (minutes, miles) from each of a few origins to each of many destinations, one row per origin"""
+        self._load()
+        origin_coords = np.array([self.coordinates.get(location_id, (np.nan, np.nan)) for location_id in origins], dtype=float).reshape(-1, 2)
+        coords = np.array([self.coordinates.get(location_id, (np.nan, np.nan)) for location_id in destinations], dtype=float).reshape(-1, 2)
+        lat, lon = np.radians(coords[:, 0])[None, :], np.radians(coords[:, 1])[None, :]
+        origin_lat, origin_lon = np.radians(origin_coords[:, 0])[:, None], np.radians(origin_coords[:, 1])[:, None]
+        # Same estimate _build makes, only for the origins' rows of the matrix
+        a = np.sin((lat - origin_lat) / 2) ** 2 + np.cos(origin_lat) * np.cos(lat) * np.sin((lon - origin_lon) / 2) ** 2
+        miles = 2 * EARTH_RADIUS_MILES * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0))) * ROAD_FACTOR
+        minutes = miles / AVERAGE_SPEED_MPH * 60
+        unknown = np.isnan(miles)
+        miles[unknown] = DEFAULT_LEG["miles"]
+        minutes[unknown] = DEFAULT_LEG["minutes"]
+
+        # Measured legs and staying put, looked up from the few origins instead of walking every destination
+        positions = {}
+        for i, location_id in enumerate(destinations):
+            positions.setdefault(location_id, []).append(i)
+        for row, origin in enumerate(origins):
+            for i in positions.get(origin, ()):
+                miles[row, i] = minutes[row, i] = 0.0
+        if self.known_legs:
+            rows = {origin: row for row, origin in enumerate(origins)}
+            for (a, b), leg in self.known_legs.items():
+                if a in rows and b in positions:
+                    for i in positions[b]:
+                        miles[rows[a], i] = leg["miles"]
+                        minutes[rows[a], i] = leg["minutes"]
+        return minutes, miles
+
+    def _build(self, ids):
+        n = len(ids)
+        coords = np.array([self.coordinates.get(location_id, (np.nan, np.nan)) for location_id in ids], dtype=float).reshape(n, 2)
+
+        # Estimate every pair from coordinates, pairs with an unknown location fall back to the default leg
+        miles = haversine_matrix(coords[:, 0], coords[:, 1]) * ROAD_FACTOR
+        minutes = miles / AVERAGE_SPEED_MPH * 60
+        unknown = np.isnan(miles)
+        miles[unknown] = DEFAULT_LEG["miles"]
+        minutes[unknown] = DEFAULT_LEG["minutes"]
+
+        # Measured legs replace the estimates
+        if self.known_legs:
+            index = {location_id: i for i, location_id in enumerate(ids)}
+            for (a, b), leg in self.known_legs.items():
+                i = index.get(a)
+                j = index.get(b)
+                if i is not None and j is not None:
+                    miles[i, j] = leg["miles"]
+                    minutes[i, j] = leg["minutes"]
+
+        np.fill_diagonal(miles, 0.0)
+        np.fill_diagonal(minutes, 0.0)
+        # Cached matrices are shared between requests, make sure nobody changes them by accident
+        miles.setflags(write=False)
+        minutes.setflags(write=False)
+        return {location_id: i for i, location_id in enumerate(ids)}, minutes, miles
+
+
+# Global instance
+location_index = LocationIndex()
@@ -0,0 +1,274 @@
+import math
+import multiprocessing
+import sys
+import threading
+import time
+from collections import Counter as _TallyCounter, deque
+from contextlib import contextmanager
+
+# Histogram buckets in seconds, from a millisecond up to ten seconds
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape_label_value(value):
+    # The text format only allows these three escapes in a label value, the backslash has to go first
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labelnames, values, extra=None):
+    pairs = list(zip(labelnames, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    escaped = [f'{name}="{_escape_label_value(value)}"' for name, value in pairs]
+    return "{" + ",".join(escaped) + "}"
+
+
+def _format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+# A number that only goes up, optionally split by labels
+class Counter:
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        # A counter without labels starts at 0 so it shows up before the first inc
+        self._values = {} if self.labelnames else {(): 0}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        return self._values.get(key, 0)
+
+    def drain(self):
+        """Every value counted so far, the counter starts over from zero"""
+        with self._lock:
+            values, self._values = self._values, ({} if self.labelnames else {(): 0})
+        return values
+
+    def merge(self, values):
+        """Add values drained from the same counter in another process"""
+        with self._lock:
+            for key, value in values.items():
+                self._values[key] = self._values.get(key, 0) + value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return lines
+
+
+# Counts observations into cumulative buckets, Prometheus style, plus their sum and count
+class Histogram:
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        self._series = {} # label values -> [bucket counts, sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+            series[1] += value
+            series[2] += 1
+
+    def count(self, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        series = self._series.get(key)
+        return series[2] if series else 0
+
+    def drain(self):
+        """Every series observed so far, the histogram starts over empty"""
+        with self._lock:
+            series, self._series = self._series, {}
+        return series
+
+    def merge(self, series):
+        """Add series drained from the same histogram (same buckets) in another process"""
+        with self._lock:
+            for key, (counts, total, count) in series.items():
+                mine = self._series.get(key)
+                if mine is None:
+                    mine = self._series[key] = [[0] * len(self.buckets), 0.0, 0]
+                mine[0] = [a + b for a, b in zip(mine[0], counts)]
+                mine[1] += total
+                mine[2] += count
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe how long the with block took"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, (counts, total, count) in sorted(self._series.items()):
+                for bound, bucket_count in zip(self.buckets, counts):
+                    lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, ('le', _format_value(bound)))} {bucket_count}")
+                lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(total)}")
+                lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {count}")
+        return lines
+
+
+# Holds every metric of this process and renders them in the Prometheus text format
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric):
+        with self._lock:
+            return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self):
+        """Every metric in the Prometheus text exposition format"""
+        lines = []
+        for metric in list(self._metrics.values()):
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+# Global instance and the metrics the app records
+metrics = MetricsRegistry()
+
+STAGE_SECONDS = metrics.histogram("scheduler_stage_seconds", "Time spent in each optimize_schedule stage", ["stage"])
+OPTIMIZATIONS = metrics.counter("scheduler_optimizations_total", "Schedule optimizations run", ["strategy"])
+JOBS_IN = metrics.counter("scheduler_jobs_in_total", "Jobs submitted for optimization")
+JOBS_ASSIGNED = metrics.counter("scheduler_jobs_assigned_total", "Jobs assigned to a crew")
+MODEL_OPERATION_SECONDS = metrics.histogram("model_operation_seconds", "Time spent in duration model operations", ["operation"])
+MODEL_RETRAINS = metrics.counter("model_retrains_total", "Times the duration model was trained")
+MODEL_PREDICTIONS = metrics.counter("model_predictions_total", "Job durations predicted", ["path"])
+FEEDBACK_ROWS = metrics.counter("model_feedback_rows_total", "Completed job durations recorded for retraining")
+PREDICTION_CACHE_LOOKUPS = metrics.counter("model_prediction_cache_lookups_total", "Prediction cache lookups by distinct feature vector", ["result"])
+RESULT_CACHE_LOOKUPS = metrics.counter("optimization_result_cache_lookups_total", "Optimize requests served from the result cache, coalesced onto a running one or computed", ["result"])
+SESSION_DELTA_SECONDS = metrics.histogram("schedule_session_delta_seconds", "Time to apply a delta to a schedule session")
+HTTP_REQUESTS = metrics.counter("http_requests_total", "HTTP requests handled", ["method", "route", "status"])
+HTTP_REQUEST_SECONDS = metrics.histogram("http_request_duration_seconds", "HTTP request latency", ["method", "route"])
+
+# Recorded wherever the model runs. With OPTIMIZER_EXECUTOR=process that is a worker process whose registry
+# /metrics never sees, so the worker hands them back with the result like the stage timings
+WORKER_METRICS = (MODEL_OPERATION_SECONDS, MODEL_RETRAINS, MODEL_PREDICTIONS, PREDICTION_CACHE_LOOKUPS)
+
+
+def drain_worker_metrics():
+    """In a worker process, what WORKER_METRICS recorded since the last call (warm up included), None in the API process"""
+    if multiprocessing.parent_process() is None:
+        return None
+    return {metric.name: metric.drain() for metric in WORKER_METRICS}
+
+
+def merge_worker_metrics(samples):
+    """Add the metrics a worker process handed back to this process's registry"""
+    for metric in WORKER_METRICS:
+        metric.merge(samples.get(metric.name, {}))
+
+
+# Collects how long each stage of one optimization took, the result carries these back to the API
+# so they can be recorded in the parent process even when the work ran in a process pool
+class StageTimer:
+    def __init__(self):
+        self.timings = {}
+
+    @contextmanager
+    def stage(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[name] = self.timings.get(name, 0.0) + (time.perf_counter() - started)
+
+    def as_milliseconds(self):
+        return {name: round(seconds * 1000, 3) for name, seconds in self.timings.items()}
+
+
+def record_optimization(result, job_count, strategy="greedy"):
+    """Record a finished optimization's stage timings and job counts"""
+    worker_metrics = result.pop("worker_metrics", None)
+    if worker_metrics:
+        merge_worker_metrics(worker_metrics)
+    for stage, milliseconds in result.get("timings", {}).items():
+        STAGE_SECONDS.observe(milliseconds / 1000, stage=stage)
+    OPTIMIZATIONS.inc(strategy=strategy)
+    JOBS_IN.inc(job_count)
+    # Streamed results carry no routes, every result lists the jobs that weren't assigned
+    JOBS_ASSIGNED.inc(job_count - len(result.get("unassigned_job_ids", ())))
+
+
+# Samples one thread's call stack every few milliseconds from a background thread, no outside profiler needed
+# The result is collapsed stacks ("module:function;module:function" -> sample count), the flame graph input format
+class SamplingProfiler:
+    def __init__(self, interval_ms=5, thread_id=None):
+        self.interval = interval_ms / 1000
+        self.thread_id = thread_id or threading.get_ident()
+        self.samples = _TallyCounter()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def __enter__(self):
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{frame.f_globals.get('__name__', '?')}:{code.co_name}")
+                frame = frame.f_back
+            if stack:
+                self.samples[";".join(reversed(stack))] += 1
+
+    def top(self, limit=25):
+        """The most sampled stacks"""
+        return [{"stack": stack, "samples": count} for stack, count in self.samples.most_common(limit)]
+
+
+# Most recent slow request profiles, newest last
+slow_profiles = deque(maxlen=20)
+
+
+def run_profiled(func, slow_ms, interval_ms, *args):
+    """Run func(*args) under the sampling profiler and attach the profile to the result if it was slow"""
+    started = time.perf_counter()
+    with SamplingProfiler(interval_ms=interval_ms) as profiler:
+        result = func(*args)
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    if elapsed_ms >= slow_ms and isinstance(result, dict):
+        result["profile"] = {"elapsed_ms": round(elapsed_ms, 1), "interval_ms": interval_ms, "stacks": profiler.top()}
+    return result
@@ -1,24 +1,102 @@
+import threading
+import time
 import numpy as np
-from sklearn.ensemble import RandomForestRegressor
-from sklearn.model_selection import train_test_split
-from sklearn.metrics import mean_absolute_error
 import logging
+from .model_registry import model_registry, training_data_hash
+from .feedback_store import feedback_store
+from .cache import LRUCache, MISSING
+from .metrics import MODEL_OPERATION_SECONDS, MODEL_PREDICTIONS, MODEL_RETRAINS, PREDICTION_CACHE_LOOKUPS
+from ..config import settings
+
+# The features the model is trained on, in the same order get_job_features returns them
+MODEL_FEATURES = ['property_sqft', 'tree_count', 'complexity_score', 'crew_size']
+
+# Percentiles of the trees' predictions kept for every job, every 5th so any percentile is a short interpolation away
+# The 10th, 50th and 90th are on the grid exactly
+QUANTILE_GRID = np.arange(0, 101, 5)
+
+# One trained model and what we know about it. The predictor swaps the whole thing in one assignment,
+# so a request that started on the old model finishes on it and nobody ever sees a half trained forest
+class ModelState:
+    __slots__ = ("model", "training_results", "version", "feedback_last_id", "trained_at")
+
+    def __init__(self, model, training_results, version, feedback_last_id=0):
+        self.model = model
+        self.training_results = training_results
+        self.version = version # Hash of the training data the model was trained on
+        self.feedback_last_id = feedback_last_id # Newest feedback row the training data included
+        self.trained_at = time.time()
+
+
+# Every tree's prediction in one pass over model.estimators_, rows are converted to float32 once instead of once per tree
+# The mean is summed tree by tree in the same order RandomForestRegressor.predict does, so it matches predict exactly
+def forest_quantiles(model, rows):
+    """One row per input row, the mean prediction followed by the QUANTILE_GRID percentiles of the trees' predictions"""
+    rows = np.ascontiguousarray(rows, dtype=np.float32)
+    tree_predictions = np.empty((len(model.estimators_), len(rows)))
+    mean = np.zeros(len(rows))
+    for t, tree in enumerate(model.estimators_):
+        tree_predictions[t] = tree.predict(rows, check_input=False)
+        mean += tree_predictions[t]
+    mean /= len(model.estimators_)
+    return np.column_stack([mean, np.percentile(tree_predictions, QUANTILE_GRID, axis=0).T])
+
+
+def quantile_at(quantiles, percentile):
+    """The percentile of each row, interpolated on the QUANTILE_GRID columns"""
+    position = percentile / 5
+    lower = min(int(position), len(QUANTILE_GRID) - 2)
+    weight = position - lower
+    return quantiles[:, lower] * (1 - weight) + quantiles[:, lower + 1] * weight
+
+
+def interval_confidence(prediction, p10, p90):
+    """100 minus half the 80% interval as a percentage of the prediction, kept between 50 and 99"""
+    return np.clip(100 - 50 * (p90 - p10) / np.maximum(prediction, 1), 50, 99)
+
 
 # Using sklean random forest regressor to predict job duration, we are just initializing the model here 
 class JobDurationPredictor:
-    def __init__(self):
-        # n_estimators=50 sets the number of trees in the forest to 50 more trees often better accuracy, but slower training/prediction
-        self.model = RandomForestRegressor(n_estimators=50, random_state=42)
-        self.is_trained = False # We will set this to true when the model is trained
-        self.training_results = None # We will store the training results here
+    def __init__(self, registry=None, feedback=None):
+        self.state = None # The current ModelState, None until the model is trained or loaded
+        self.registry = registry or model_registry # Where trained models are saved and loaded from
+        self.feedback = feedback or feedback_store # Actual durations of completed jobs, added to the training data
+        self.data_service = None # Created once on first use instead of on every training run
+        # Raw forest outputs keyed by (model_version, feature tuple), recurring jobs have the same features every week
+        self.prediction_cache = LRUCache(maxsize=settings.prediction_cache_size, ttl_seconds=settings.prediction_cache_ttl_seconds)
+        # Only one training at a time, predictions never take this lock so they never wait on a retrain
+        self._training_lock = threading.Lock()
+
+    # These read the current state, kept as attributes so the rest of the code reads like before
+    @property
+    def is_trained(self):
+        return self.state is not None
+
+    @property
+    def model(self):
+        return self.state.model if self.state is not None else None
+
+    @property
+    def training_results(self):
+        return self.state.training_results if self.state is not None else None
+
+    @property
+    def model_version(self):
+        return self.state.version if self.state is not None else None
 
     # Load training data from the mock data service, we will use this to train the model
     def prepare_training_data(self):
         """Prepare training data from historical jobs"""
+        X, y, _ = self._training_set()
+        return X, y
+
+    def _training_set(self):
+        """(X, y, newest feedback row id) for the seed history plus the newest completed job feedback"""
         from .mock_data import MockDataService
         
-        mock_service = MockDataService()
-        historical_data = mock_service.get_historical_data()
+        if self.data_service is None:
+            self.data_service = MockDataService()
+        historical_data = self.data_service.get_historical_data()
         
         # X are features, y are target values which are job durations
         X = []
@@ -28,73 +106,237 @@ class JobDurationPredictor:
             X.append(features)
             y.append(duration)
         # here we use numpy to convert the lists to numpy arrays for sklearn to use
-        return np.array(X), np.array(y)
+        X, y = np.array(X), np.array(y)
+
+        # Only a sliding window of the newest feedback is used, so training cost stays bounded as feedback piles up
+        feedback_X, feedback_y, feedback_last_id = self.feedback.window(settings.retrain_window_rows)
+        if len(feedback_y):
+            X = np.vstack([X, feedback_X])
+            y = np.concatenate([y, feedback_y])
+        return X, y, feedback_last_id
     
     # We train the model here, I went for a 70/30 split for training and testing
-    def train_model(self):
+    def train_model(self, X=None, y=None):
         """Train the duration prediction model"""
-        X, y = self.prepare_training_data()
-        
+        # Same lock as load_or_train, so this never races the background retrainer
+        with self._training_lock:
+            feedback_last_id = 0
+            if X is None or y is None:
+                X, y, feedback_last_id = self._training_set()
+            self._swap(self._fit(X, y, feedback_last_id))
+            return self.training_results  # Now returning the stored results
+
+    def _fit(self, X, y, feedback_last_id=0):
+        """Train a new forest on the side and return its ModelState, the live model is untouched"""
+        # sklearn takes longer to import than the rest of the app together, only training needs it here
+        # (unpickling a saved forest imports the parts it needs on its own)
+        from sklearn.ensemble import RandomForestRegressor
+        from sklearn.model_selection import train_test_split
+        from sklearn.metrics import mean_absolute_error
+
         # Split data
         X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.3, random_state=42)
         
         # Train model, uses sklearn .fit()
-        self.model.fit(X_train, y_train)
+        # n_estimators=50 sets the number of trees in the forest to 50 more trees often better accuracy, but slower training/prediction
+        # A new forest every time, fitting the live one in place would change it under running requests
+        model = RandomForestRegressor(n_estimators=50, random_state=42)
+        with MODEL_OPERATION_SECONDS.time(operation="train"):
+            model.fit(X_train, y_train)
+        MODEL_RETRAINS.inc()
         
         # Evaluate
-        predictions = self.model.predict(X_test)
+        predictions = model.predict(X_test)
         # here we are running MAE on predictions vs actual values(y_test)
         #mean_absolute_error returns the average absolute difference between predicted and true values; a lower MAE means better average accuracy in the same units as y.
         mae = mean_absolute_error(y_test, predictions)
         
-        self.is_trained = True
-        
         # Here we are calculating the model accuracy using a rough formula 
         # 1 - mae/mean(y_test) is fraction of how big the error is compared to the average target multiply by 100 to express as percent
         accuracy_percentage = max(0, (1 - mae/np.mean(y_test)) * 100)
         
         # returns a dict with rounded MAE, accuracy percent, and number of training samples
-        self.training_results = {
+        training_results = {
             'mean_absolute_error': round(mae, 1),
             'accuracy': f"{accuracy_percentage:.1f}%",
             'training_samples': len(X)
         }
-        return self.training_results  # Now returning the stored results
+        return ModelState(model, training_results, training_data_hash(X, y), feedback_last_id)
+
+    def _swap(self, state):
+        """Make state the live model, a single assignment so readers see either the old or the new model"""
+        self.state = state
+        # The version is part of every cache key already, clearing just frees the old model's entries
+        self.prediction_cache.clear()
+
+    # Loads the saved model for the current training data, only training (and saving) when there is none yet
+    # This way only the first worker after a data change pays for training, the rest just load the file
+    # The background retrainer calls this too, when the feedback window hasn't changed it does nothing
+    def load_or_train(self):
+        """Load the model from the registry or train and save it"""
+        with self._training_lock:
+            X, y, feedback_last_id = self._training_set()
+            data_hash = training_data_hash(X, y)
+            if self.state is not None and self.state.version == data_hash:
+                return self.training_results
+
+            with MODEL_OPERATION_SECONDS.time(operation="load"):
+                artifact = self.registry.load(data_hash)
+            if artifact is not None:
+                self._swap(ModelState(artifact['model'], artifact['training_results'], artifact['data_hash'], feedback_last_id))
+                return self.training_results
+
+            state = self._fit(X, y, feedback_last_id)
+            try:
+                self.registry.save(state.model, state.training_results, MODEL_FEATURES, data_hash)
+            except OSError:
+                # Not being able to save only means the next worker retrains too, the model itself is fine
+                logging.getLogger(__name__).warning("Could not save model artifact", exc_info=True)
+            self._swap(state)
+            # Every retrain writes a new artifact, only the newest few stay so the model folder doesn't grow forever
+            try:
+                self.registry.prune(settings.model_artifacts_keep, data_hash)
+            except OSError:
+                logging.getLogger(__name__).warning("Could not prune old model artifacts", exc_info=True)
+            return self.training_results
+
+    # Worker processes have their own copy of the model and a retrain only swaps the API process's one,
+    # so each job sent to a worker carries the version the API is serving and the worker loads it when it differs
+    def load_version(self, version):
+        """Make the saved model with this version the live one, falls back to load_or_train when it isn't saved"""
+        if version is None or self.model_version == version:
+            return
+        with self._training_lock:
+            with MODEL_OPERATION_SECONDS.time(operation="load"):
+                artifact = self.registry.load(version)
+            if artifact is not None:
+                self._swap(ModelState(artifact['model'], artifact['training_results'], artifact['data_hash']))
+                return
+        self.load_or_train()
+
+    def _current_state(self):
+        """The live ModelState, loading or training it first if there is none yet"""
+        state = self.state
+        if state is None:
+            self.load_or_train()
+            state = self.state
+        return state
+
+    # Called once when the app starts so the first real request doesn't pay for loading or training
+    def warm_up(self):
+        """Make sure the model is ready before serving requests"""
+        if not self.is_trained:
+            self.load_or_train()
+        return self.get_model_info()
     
     # Here we are predicting the duration of a job based on the features
     def predict_duration(self, job_features):
         """Predict job duration based on features"""
-        if not self.is_trained:
-            self.train_model()
+        # Read the state once, a retrain swapping it halfway through doesn't affect this prediction
+        state = self._current_state()
         
         # Here I am using the trained ml model to predict the job duration
         # [job_features] wraps the features in a list because the model expects a 2D array
         # [0] is the first and only prediction from the model
-        prediction = self.model.predict([job_features])[0]
-        
-        # Add realistic variance
-        # for example, if the job might take plus or minus10% more or less time than predicted.
-        variance = prediction * 0.1
+        means, quantiles = self._predict_raw(state, np.asarray([job_features], dtype=float), "single")
+        prediction = means[0]
+        p10, p50, p90 = (float(quantile_at(quantiles, percentile)[0]) for percentile in (10, 50, 90))
 
-        confidence = max(75, min(95, 90 - abs(prediction - 150) / 50))
+        # How much the trees disagree is the uncertainty, half the 10th to 90th percentile spread either way
+        variance = (p90 - p10) / 2
+        confidence = interval_confidence(prediction, p10, p90)
         # here we return the predicted duration, confidence, and variance range
         return {
             'predicted_duration': max(30, int(prediction)),
             'confidence': f"{confidence:.0f}%",
-            'variance_range': f"±{variance:.0f} minutes"
+            'variance_range': f"±{variance:.0f} minutes",
+            'prediction_interval': {'p10': round(p10, 1), 'p50': round(p50, 1), 'p90': round(p90, 1)}
         }
     
+    # Batch version of predict_duration, one forest traversal for the whole job list instead of one per job
+    # With risk_percentile (say 80) the result also has risk_duration, the duration 80% of the trees stay under,
+    # which the scheduler can pack crews with instead of the mean
+    def predict_durations(self, feature_matrix, risk_percentile=None):
+        """Predict durations for many jobs at once from a 2D feature matrix"""
+        state = self._current_state()
+
+        # feature_matrix has one row per job in the same order as get_job_features returns them
+        feature_matrix = np.asarray(feature_matrix, dtype=float)
+        if len(feature_matrix) == 0:
+            # sklearn refuses to predict on an empty matrix so we short-circuit here
+            empty = np.zeros(0)
+            result = {'predicted_duration': empty.astype(int), 'confidence': empty, 'variance': empty, 'p10': empty, 'p50': empty, 'p90': empty, 'model_version': state.version}
+            if risk_percentile is not None:
+                result['risk_duration'] = empty.astype(int)
+            return result
+
+        # One pass over the trees for every row the cache doesn't know yet, this is where the batching pays off
+        predictions, quantiles = self._predict_raw(state, feature_matrix, "batch")
+        p10, p50, p90 = (quantile_at(quantiles, percentile) for percentile in (10, 50, 90))
+
+        # Same formulas as predict_duration but applied to whole arrays at once
+        # astype(int) truncates like int() does for the positive durations we get here
+        result = {
+            'predicted_duration': np.maximum(30, predictions.astype(int)),
+            'confidence': interval_confidence(predictions, p10, p90),
+            'variance': (p90 - p10) / 2,
+            'p10': p10,
+            'p50': p50,
+            'p90': p90,
+            # The version these came from, a retrain can swap the live model while a caller is still using them
+            'model_version': state.version
+        }
+        if risk_percentile is not None:
+            # Rounded up, a risk aware plan would rather have a minute too many than too few
+            result['risk_duration'] = np.maximum(30, np.ceil(quantile_at(quantiles, risk_percentile))).astype(int)
+        return result
+
+    # The forest's raw outputs for a feature matrix, only feature vectors the cache hasn't seen go to the model
+    # Every row is predicted on its own by each tree, so a cached value is exactly what predict would return again
+    def _predict_raw(self, state, feature_matrix, path):
+        """(mean prediction, QUANTILE_GRID percentiles) for each row, served from the prediction cache where possible"""
+        # Recurring jobs repeat feature vectors, so we look up each distinct row once and spread the answers back
+        # Viewing each row as one opaque block of bytes makes np.unique a plain 1D sort, a lot faster than axis=0
+        feature_matrix = np.ascontiguousarray(feature_matrix)
+        row_bytes = feature_matrix.view(np.dtype((np.void, feature_matrix.dtype.itemsize * feature_matrix.shape[1]))).ravel()
+        _, first_index, inverse = np.unique(row_bytes, return_index=True, return_inverse=True)
+        unique_rows = feature_matrix[first_index]
+        keys = [(state.version, row) for row in map(tuple, unique_rows.tolist())]
+        cached = self.prediction_cache.get_many(keys)
+        missing = [i for i, value in enumerate(cached) if value is MISSING]
+        PREDICTION_CACHE_LOOKUPS.inc(len(keys) - len(missing), result="hit")
+        PREDICTION_CACHE_LOOKUPS.inc(len(missing), result="miss")
+
+        # Each cached value is one array, the mean followed by the quantile grid
+        unique_values = np.zeros((len(keys), 1 + len(QUANTILE_GRID)))
+        hits = [i for i, value in enumerate(cached) if value is not MISSING]
+        if hits:
+            unique_values[hits] = [cached[i] for i in hits]
+        if missing:
+            with MODEL_OPERATION_SECONDS.time(operation=f"predict_{path}"):
+                fresh = forest_quantiles(state.model, unique_rows[missing])
+            # Cached rows are shared between requests, make sure nobody changes them by accident
+            fresh.setflags(write=False)
+            unique_values[missing] = fresh
+            self.prediction_cache.set_many(zip([keys[i] for i in missing], fresh))
+        MODEL_PREDICTIONS.inc(len(feature_matrix), path=path)
+        values = unique_values[inverse.reshape(-1)]
+        return values[:, 0], values[:, 1:]
+
+    def prediction_cache_stats(self):
+        """Hit and miss counts of the prediction cache"""
+        return {'model_version': self.model_version, **self.prediction_cache.stats()}
+
     def get_model_info(self):
         """Get information about the trained model"""
-        if not self.is_trained or self.training_results is None:
-            self.train_model()
+        training_results = self._current_state().training_results
             
         return {
             'model_type': 'Random Forest Regressor',
-            'features': ['property_sqft', 'tree_count', 'complexity_score', 'crew_size'],
-            'training_accuracy': self.training_results['accuracy'],
-            'training_samples': self.training_results['training_samples'],
-            'mean_absolute_error': self.training_results['mean_absolute_error'],
+            'features': MODEL_FEATURES,
+            'training_accuracy': training_results['accuracy'],
+            'training_samples': training_results['training_samples'],
+            'mean_absolute_error': training_results['mean_absolute_error'],
             'model_status': 'Trained and Ready',
             'cost_savings': '$200/month vs API costs'
         }
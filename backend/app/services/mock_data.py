@@ -159,4 +159,12 @@ def get_job_features(job):
     # here we are getting the complexity of the job, if not provided we assume 2
     complexity = service_complexity.get(job['service_type'], 2)
     # We return the list of 4 values that we will use to train the model, they need to be in this specific order
-    return [estimated_sqft, estimated_trees, complexity, job['crew_size_needed']]
\ No newline at end of file
+    return [estimated_sqft, estimated_trees, complexity, job['crew_size_needed']]
+
+# Builds the features for a whole list of jobs at once, one row per job, so the model can predict them in a single call
+def get_job_feature_matrix(jobs):
+    """Extract a 2D feature matrix for a list of jobs"""
+    import numpy as np
+
+    # reshape keeps the matrix 2D (0 rows, 4 columns) even when there are no jobs
+    return np.array([get_job_features(job) for job in jobs], dtype=float).reshape(-1, 4)
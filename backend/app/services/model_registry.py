@@ -0,0 +1,99 @@
+import glob
+import hashlib
+import logging
+import os
+import tempfile
+import numpy as np
+from ..config import settings
+
+logger = logging.getLogger(__name__)
+
+# Bump this whenever the layout of the saved artifact changes, older files are then ignored and the model is retrained
+ARTIFACT_FORMAT_VERSION = 1
+
+
+# Fingerprint of the training data, if the data changes the hash changes and we know the saved model is stale
+def training_data_hash(X, y):
+    """Hash the training features and targets"""
+    digest = hashlib.sha256()
+    # Fixed dtypes so the same numbers always give the same bytes
+    digest.update(np.ascontiguousarray(X, dtype=np.float64).tobytes())
+    digest.update(np.ascontiguousarray(y, dtype=np.float64).tobytes())
+    return digest.hexdigest()[:16]
+
+
+# Saves and loads trained models on disk so a worker starting up can skip training the forest
+class ModelRegistry:
+    def __init__(self, model_dir=None):
+        self.model_dir = model_dir or settings.model_dir
+
+    def artifact_path(self, data_hash):
+        """Path of the artifact trained on data with this hash"""
+        return os.path.join(self.model_dir, f"duration_model-{data_hash}.joblib")
+
+    def save(self, model, training_results, features, data_hash):
+        """Save a trained model with its metadata"""
+        import joblib # Imported when needed, like sklearn in the predictor
+
+        os.makedirs(self.model_dir, exist_ok=True)
+        artifact = {
+            'format_version': ARTIFACT_FORMAT_VERSION,
+            'model': model,
+            'training_results': training_results,
+            'features': features,
+            'data_hash': data_hash
+        }
+        path = self.artifact_path(data_hash)
+        # Write to a temp file first then rename, so another worker never loads a half written file
+        # No compression, compressed arrays can't be memory mapped
+        fd, tmp_path = tempfile.mkstemp(dir=self.model_dir, suffix='.tmp')
+        os.close(fd)
+        try:
+            joblib.dump(artifact, tmp_path)
+            os.replace(tmp_path, path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return path
+
+    def prune(self, keep, current_hash):
+        """Delete all but the newest keep artifacts, never the one for current_hash, returns the deleted paths"""
+        paths = sorted(glob.glob(os.path.join(self.model_dir, "duration_model-*.joblib")), key=os.path.getmtime, reverse=True)
+        current = self.artifact_path(current_hash)
+        kept = [current] if current in paths else []
+        deleted = []
+        for path in paths:
+            if path in kept:
+                continue
+            if len(kept) < keep:
+                kept.append(path)
+                continue
+            # Another worker may still have the old model mapped, on POSIX its pages stay valid after the file is gone
+            try:
+                os.remove(path)
+                deleted.append(path)
+            except OSError:
+                logger.warning("Could not delete old model artifact %s", path, exc_info=True)
+        return deleted
+
+    def load(self, data_hash):
+        """Load the artifact for this training data hash, or None if there isn't a usable one"""
+        path = self.artifact_path(data_hash)
+        if not os.path.exists(path):
+            return None
+        import joblib
+        try:
+            # mmap_mode='r' maps the stored arrays from the file (shared through the OS page cache) instead of reading a private copy
+            # sklearn still copies each tree into its own buffers when unpickling, but loading stays far cheaper than training
+            artifact = joblib.load(path, mmap_mode='r')
+        except Exception:
+            logger.warning("Could not load model artifact %s, retraining", path, exc_info=True)
+            return None
+        if artifact.get('format_version') != ARTIFACT_FORMAT_VERSION or artifact.get('data_hash') != data_hash:
+            return None
+        return artifact
+
+
+# Global instance
+model_registry = ModelRegistry()
@@ -0,0 +1,225 @@
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from .assignment import TRAVEL_MINUTES_PER_JOB
+from .locations import location_index
+from .solvers import AssignmentSolver
+from .tables import CrewTable, JobTable, RoutePlan
+from ..config import settings
+
+
+# Splits a day into one subproblem per depot. Crews are grouped by the location they start from and
+# every job goes to the nearest depot that has a crew big enough for it. Jobs that are equally far from
+# several depots (usually because their address has no coordinates) go to the one with the least work per crew minute
+def partition_by_depot(jobs, crews):
+    """List of (job indices, crew indices), one per depot in the order the depots first show up in the crews"""
+    crew_groups = {}
+    for c, address in enumerate(crews.start_locations):
+        crew_groups.setdefault(location_index.location_id(address), []).append(c)
+    crew_indices = [np.array(group, dtype=np.intp) for group in crew_groups.values()]
+    if len(crew_indices) <= 1 or not len(jobs):
+        return [(np.arange(len(jobs), dtype=np.intp), np.arange(len(crews), dtype=np.intp))]
+
+    # Distances are computed once per distinct job location, recurring customers share a row
+    positions = {}
+    inverse = np.array([positions.setdefault(location_index.location_id(address), len(positions)) for address in jobs.addresses], dtype=np.intp)
+    locations = list(positions)
+    minutes = location_index.legs_between(list(crew_groups), locations)[0][:, inverse]
+
+    # A depot whose biggest crew is too small for the job is out, unless no depot can do it (it ends up unassigned anyway)
+    largest = np.array([crews.sizes[group].max() for group in crew_indices])
+    able = largest[:, None] >= jobs.crew_size_needed[None, :]
+    minutes = np.where(able | ~able.any(axis=0), minutes, np.inf)
+
+    nearest = minutes.min(axis=0)
+    ties = minutes <= nearest + 1e-9
+    depot_of = np.argmax(ties, axis=0)
+    tied = np.flatnonzero(ties.sum(axis=0) > 1)
+    if tied.size:
+        demand = (jobs.planning_duration + TRAVEL_MINUTES_PER_JOB).astype(float)
+        capacity = [max(float(crews.available_minutes[group].sum()), 1.0) for group in crew_indices]
+        load = np.bincount(np.delete(depot_of, tied), weights=np.delete(demand, tied), minlength=len(crew_indices)).tolist()
+        for j in tied.tolist():
+            d = min(np.flatnonzero(ties[:, j]).tolist(), key=lambda d: load[d] / capacity[d])
+            depot_of[j] = d
+            load[d] += demand[j]
+
+    order = np.argsort(depot_of, kind="stable")
+    bounds = np.searchsorted(depot_of[order], np.arange(len(crew_indices) + 1))
+    return [(order[bounds[d]:bounds[d + 1]], crew_indices[d]) for d in range(len(crew_indices))]
+
+
+# Runs in a worker process (or in line when there is only one), assigns and routes one depot's jobs
+# Everything it needs travels with the task, so the result doesn't depend on what the worker process happened to load
+def solve_partition(task):
+    """Return (strategy report, [(crew, job indices, drive minutes, miles, baseline miles)]), indices local to the partition"""
+    from .scheduler import ScheduleOptimizer
+
+    if task["locations"] is not None:
+        # Locations added at runtime in the parent (synthetic data, geocoded addresses) aren't in the worker's CSV
+        for location_id, (latitude, longitude) in task["locations"].items():
+            location_index.add_location(location_id, latitude, longitude)
+        location_index.add_known_legs(task["known_legs"])
+
+    jobs = JobTable(task["jobs"])
+    jobs.set_predictions(task["predicted_duration"], task["confidence"], task["interval"], task["planning_duration"])
+    crews = CrewTable(task["crews"])
+    assignments, report = AssignmentSolver(jobs, crews).solve(task["strategy"], task["time_budget_ms"])
+    plans = [RoutePlan(c, job_indices) for c, job_indices in enumerate(assignments)]
+    ScheduleOptimizer()._optimize_routes(jobs, crews, plans)
+    return report, [(plan.crew, plan.jobs, plan.drive_minutes, plan.miles, plan.baseline_miles, plan.dropped) for plan in plans]
+
+
+def _ready():
+    # Submitted once per worker by start(), importing this module is the warm up
+    return True
+
+
+# Solves each depot's jobs and crews as its own problem, in parallel on a process pool, and merges the plans back
+# Predictions are made once in the parent, workers only assign and route. Each partition is solved exactly the same
+# way whether it runs in a worker or in line, so a parallel run gives the same routes as a serial one for the same seed
+class PartitionedSolver:
+    def __init__(self, max_workers=None):
+        self.max_workers = settings.partition_workers if max_workers is None else max_workers
+        self._executor = None # Created by start() when the server starts, never inside a request
+
+    def start(self):
+        """Start the worker processes, the API calls this once at startup"""
+        if self._executor is None and self.max_workers > 1 and multiprocessing.parent_process() is None:
+            # Spawned, not forked: the server already runs the optimizer threads and the retrainer by now, a fork taken
+            # while one of them holds a lock (location index, prediction cache) would leave that lock held forever in the child
+            self._executor = ProcessPoolExecutor(max_workers=self.max_workers, mp_context=multiprocessing.get_context("spawn"))
+            # Spawning a worker means a fresh interpreter importing numpy and the solvers, pay for it now instead of
+            # on the first partitioned request
+            for future in [self._executor.submit(_ready) for _ in range(self.max_workers)]:
+                future.result()
+        return self
+
+    def _parallel(self, partitions):
+        # Without a started pool (and inside an optimizer worker process, where the optimizer pool already uses the cores)
+        # the partitions are solved one after another
+        return self._executor is not None and len(partitions) > 1 and multiprocessing.parent_process() is None
+
+    def solve(self, jobs, crews, strategy="greedy", time_budget_ms=None, rebalance=True):
+        """Return (route plans for every crew in crew order, strategy report), jobs must already have predictions"""
+        started = time.perf_counter()
+        if time_budget_ms is None:
+            time_budget_ms = settings.solver_time_budget_ms
+        partitions = [(job_indices, crew_indices) for job_indices, crew_indices in partition_by_depot(jobs, crews) if len(crew_indices)]
+        parallel = self._parallel(partitions)
+        tasks = [self._task(jobs, crews, job_indices, crew_indices, strategy, time_budget_ms, parallel) for job_indices, crew_indices in partitions]
+        # Biggest partitions are submitted first so a large depot doesn't start last, results are read back in depot order
+        if parallel:
+            sizes = [len(job_indices) for job_indices, _ in partitions]
+            by_size = sorted(range(len(tasks)), key=lambda i: -sizes[i])
+            futures = {i: self._executor.submit(solve_partition, tasks[i]) for i in by_size}
+            results = [futures[i].result() for i in range(len(tasks))]
+        else:
+            results = [solve_partition(task) for task in tasks]
+
+        # Partition local indices back to the full tables, plans come back in crew order like the unpartitioned run
+        plans = [RoutePlan(c, []) for c in range(len(crews))]
+        for (job_indices, crew_indices), (_, partition_plans) in zip(partitions, results):
+            for crew, job_positions, drive_minutes, miles, baseline_miles, dropped in partition_plans:
+                plan = plans[crew_indices[crew]]
+                plan.jobs = job_indices[job_positions].tolist()
+                plan.dropped = job_indices[dropped].tolist()
+                plan.drive_minutes, plan.miles, plan.baseline_miles = drive_minutes, miles, baseline_miles
+
+        rebalanced, rebalanced_value = self._rebalance(jobs, crews, plans) if rebalance and len(partitions) > 1 else (0, 0.0)
+        # Rebalancing is a greedy pass, its value counts towards both objectives
+        reports = [report for report, _ in results]
+        objective = sum(report["objective"] for report in reports) + rebalanced_value
+        greedy_objective = sum(report["greedy_objective"] for report in reports) + rebalanced_value
+        report = {
+            "strategy": strategy,
+            "objective": round(objective, 1),
+            "greedy_objective": round(greedy_objective, 1),
+            "improvement_pct": round((objective - greedy_objective) / greedy_objective * 100, 1) if greedy_objective else 0.0,
+            # Splitting by depot restricts the problem, only a single partition can be proven optimal for the whole day
+            "optimal": len(reports) == 1 and reports[0]["optimal"],
+            "solve_time_ms": round((time.perf_counter() - started) * 1000, 1),
+            "time_budget_ms": time_budget_ms,
+            "partitions": len(partitions),
+            "parallel": parallel,
+            "rebalanced_jobs": rebalanced
+        }
+        notes = sorted({report["note"] for report in reports if "note" in report})
+        if notes:
+            report["note"] = "; ".join(notes)
+        return plans, report
+
+    def _task(self, jobs, crews, job_indices, crew_indices, strategy, time_budget_ms, parallel):
+        task = {
+            "jobs": [jobs.records[j] for j in job_indices],
+            "predicted_duration": jobs.predicted_duration[job_indices],
+            "confidence": jobs.confidence[job_indices],
+            "interval": (jobs.duration_p10[job_indices], jobs.duration_p90[job_indices]),
+            "planning_duration": jobs.planning_duration[job_indices],
+            "crews": [crews.records[c] for c in crew_indices],
+            "strategy": strategy,
+            "time_budget_ms": time_budget_ms,
+            "locations": None,
+            "known_legs": None
+        }
+        if parallel:
+            location_ids = {location_index.location_id(jobs.addresses[j]) for j in job_indices}
+            location_ids.update(location_index.location_id(crews.start_locations[c]) for c in crew_indices)
+            task["locations"] = {location_id: location_index.coordinates[location_id] for location_id in location_ids if location_id in location_index.coordinates}
+            task["known_legs"] = dict(location_index.known_legs)
+        return task
+
+    def _rebalance(self, jobs, crews, plans):
+        """Give jobs left over in one depot to crews anywhere with time to spare, returns (jobs placed, their value)"""
+        assigned = np.zeros(len(jobs), dtype=bool)
+        used = np.zeros(len(crews))
+        for plan in plans:
+            assigned[plan.jobs] = True
+            # Routed plans count their real drive, the flat allowance is only for plans that weren't routed
+            drive = plan.drive_minutes if plan.drive_minutes is not None else len(plan.jobs) * TRAVEL_MINUTES_PER_JOB
+            used[plan.crew] = float(jobs.planning_duration[plan.jobs].sum()) + drive
+        spare = crews.available_minutes - used
+        # Jobs longer than the most time any crew has left can't be placed, no need to hand them to the engine
+        demand = (jobs.planning_duration + TRAVEL_MINUTES_PER_JOB).astype(float)
+        leftover = np.flatnonzero(~assigned & (demand <= spare.max(initial=0.0)))
+        open_crews = np.flatnonzero(spare >= demand[leftover].min(initial=np.inf))
+        if not leftover.size or not open_crews.size:
+            return 0, 0.0
+
+        # Same greedy pass as a normal run, on the leftover jobs and the time each crew still has
+        residual = CrewTable([{**crews.records[c], "available_hours": spare[c] / 60} for c in open_crews])
+        solver = AssignmentSolver(jobs.take(leftover), residual)
+        extra = solver.engine.assign()
+
+        from .scheduler import ScheduleOptimizer
+        changed = []
+        for position, job_positions in enumerate(extra):
+            if job_positions:
+                plan = plans[open_crews[position]]
+                changed.append((plan, plan.jobs, plan.drive_minutes, plan.miles, plan.baseline_miles, plan.dropped))
+                plan.jobs = plan.jobs + leftover[job_positions].tolist()
+        # Only the crews that picked up work are routed again
+        ScheduleOptimizer()._optimize_routes(jobs, crews, [plan for plan, *_ in changed])
+
+        # The engine packed the leftovers with the flat travel allowance, re-fitting to the real drive can take some off again.
+        # Those just go back to unassigned, they were never on this crew's route. If the re-fit took off a job the crew
+        # already had, the crew keeps its old route instead, rebalancing should never cost a crew one of its own jobs
+        routed = set()
+        for plan, jobs_before, drive_minutes, miles, baseline_miles, dropped in changed:
+            if not set(jobs_before) <= set(plan.jobs):
+                plan.jobs, plan.drive_minutes, plan.miles, plan.baseline_miles = jobs_before, drive_minutes, miles, baseline_miles
+            plan.dropped = dropped
+            routed.update(plan.jobs)
+        placed = [[p for p in job_positions if leftover[p] in routed] for job_positions in extra]
+        return sum(len(job_positions) for job_positions in placed), solver.objective(placed)
+
+    def shutdown(self):
+        """Stop the workers, waits for running partitions to finish"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+
+# Global instance
+partition_solver = PartitionedSolver()
@@ -0,0 +1,81 @@
+import asyncio
+import hashlib
+import json
+from .cache import LRUCache
+from .metrics import RESULT_CACHE_LOOKUPS
+from ..config import settings
+
+
+def request_key(jobs, crews, options, model_version):
+    """Hex SHA-256 of everything that decides an optimization's result, in a canonical JSON form"""
+    # Sorted keys and no whitespace, so the same jobs sent with their fields in another order hash the same
+    # The order of the jobs themselves stays, it breaks ties in the assignment
+    payload = json.dumps(
+        {"jobs": jobs, "crews": crews, "options": options, "model_version": model_version},
+        sort_keys=True, separators=(",", ":"), default=str
+    )
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def etag_matches(if_none_match, etag):
+    """Whether an If-None-Match header lists etag (or is *), weak validators count as a match"""
+    if not if_none_match:
+        return False
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in tags or etag in (tag[2:] if tag.startswith("W/") else tag for tag in tags)
+
+
+# Finished optimization responses, already encoded as JSON, keyed by the hash of their inputs
+# The frontend re-sends the demo jobs again and again and dispatchers often optimize the same day at the same time,
+# a hit returns the stored bytes without touching the worker pool. Identical requests that arrive while the first
+# one is still running wait for its result instead of starting their own, so N at once cost one optimization
+class OptimizationResultCache:
+    def __init__(self, maxsize=None, max_bytes=None):
+        maxsize = settings.result_cache_size if maxsize is None else maxsize
+        max_bytes = settings.result_cache_max_bytes if max_bytes is None else max_bytes
+        # Bounded by entry count and by the bytes of the stored bodies, big fleets would fill memory long before maxsize
+        self.results = LRUCache(maxsize=maxsize, max_weight=max_bytes, weigh=lambda entry: len(entry[0]))
+        self._in_flight = {} # key -> asyncio.Task, only touched from the event loop
+        self.coalesced = 0
+
+    async def get_or_compute(self, key, compute, keep=None):
+        """(JSON body bytes, ETag, "hit" | "miss" | "coalesced") for key, awaiting compute() for the response dict on a miss.
+        keep(result) is asked after computing whether the result may be stored, one from another model than the key's shouldn't be"""
+        cached = self.results.get(key)
+        if cached is not None:
+            RESULT_CACHE_LOOKUPS.inc(result="hit")
+            return (*cached, "hit")
+        task = self._in_flight.get(key)
+        if task is None:
+            how = "miss"
+            # A task of its own, so a client that disconnects doesn't cancel the work others are waiting for
+            task = self._in_flight[key] = asyncio.ensure_future(self._compute(key, compute, keep))
+        else:
+            how = "coalesced"
+            self.coalesced += 1
+        RESULT_CACHE_LOOKUPS.inc(result=how)
+        body, etag = await asyncio.shield(task)
+        return body, etag, how
+
+    async def _compute(self, key, compute, keep):
+        try:
+            result = await compute()
+            body = json.dumps(result).encode()
+            # The ETag is the body's own hash, a result computed again after eviction only matches if it's the same
+            etag = f'"{hashlib.sha256(body).hexdigest()[:32]}"'
+            if keep is None or keep(result):
+                self.results.set(key, (body, etag))
+            return body, etag
+        finally:
+            del self._in_flight[key]
+
+    def stats(self):
+        """Hit and miss counts, stored bytes and requests that waited on a running optimization"""
+        return {**self.results.stats(), "coalesced": self.coalesced, "in_flight": len(self._in_flight)}
+
+    def clear(self):
+        self.results.clear()
+
+
+# Global instance
+result_cache = OptimizationResultCache()
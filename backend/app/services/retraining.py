@@ -0,0 +1,140 @@
+import logging
+import threading
+import time
+from ..config import settings
+
+logger = logging.getLogger(__name__)
+
+
+# Retrains the duration model in a background thread once enough completed job feedback came in,
+# or on an interval when there is any new feedback at all. Training happens on the side and the predictor
+# swaps the finished model in with one assignment, requests keep predicting with the old model meanwhile
+class ModelRetrainer:
+    def __init__(self, predictor=None, store=None, min_new_rows=None, interval_seconds=None):
+        self.predictor = predictor
+        self.store = store
+        self.min_new_rows = min_new_rows if min_new_rows is not None else settings.retrain_min_new_rows
+        self.interval_seconds = interval_seconds if interval_seconds is not None else settings.retrain_interval_seconds
+        self.last_run = None # Summary of the most recent retrain, for the status endpoint
+        self.running = False
+        self._requested = threading.Event() # A retrain was asked for through the API, run it whatever the thresholds say
+        self._run_lock = threading.Lock() # One retrain at a time, the API's one-off thread and the background thread share it
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _resolve(self):
+        # Filled in on first use so importing this module doesn't load the model
+        if self.predictor is None:
+            from .ml_model import duration_predictor
+            self.predictor = duration_predictor
+        if self.store is None:
+            self.store = self.predictor.feedback
+
+    def start(self):
+        """Start the background thread"""
+        self._resolve()
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="model-retrainer", daemon=True)
+            self._thread.start()
+
+    def notify(self):
+        """New feedback was stored, check the threshold now instead of at the next interval"""
+        self._wake.set()
+
+    def rows_since_training(self):
+        """Feedback rows the live model hasn't been trained on"""
+        self._resolve()
+        state = self.predictor.state
+        return self.store.last_id() - (state.feedback_last_id if state is not None else 0)
+
+    def should_retrain(self):
+        """True once min_new_rows arrived, or any rows arrived and interval_seconds passed since the last training"""
+        state = self.predictor.state
+        if state is None:
+            return False # The first load happens at startup or on the first request, not here
+        new_rows = self.rows_since_training()
+        if new_rows >= self.min_new_rows:
+            return True
+        return new_rows > 0 and time.time() - state.trained_at >= self.interval_seconds
+
+    def _run(self):
+        while not self._stop.is_set():
+            # Wake up on new feedback, and at least once a minute for the interval check
+            self._wake.wait(timeout=min(60.0, self.interval_seconds))
+            self._wake.clear()
+            if self._stop.is_set():
+                break
+            try:
+                requested = self._requested.is_set()
+                self._requested.clear()
+                if requested or self.should_retrain():
+                    self.retrain()
+            except Exception:
+                logger.exception("Background model retrain failed, keeping the current model")
+
+    def request_retrain(self):
+        """Retrain soon in the background, returns right away, status() says when it's done"""
+        self._resolve()
+        if self._thread is not None:
+            self._requested.set()
+            self._wake.set()
+        else:
+            # RETRAIN_ENABLED=0 has no background thread, a one-off thread keeps the request from waiting on training
+            threading.Thread(target=self._retrain_logged, name="model-retrain", daemon=True).start()
+
+    def _retrain_logged(self):
+        try:
+            self.retrain()
+        except Exception:
+            logger.exception("Requested model retrain failed, keeping the current model")
+
+    def retrain(self):
+        """Retrain on the current feedback window now, in the calling thread"""
+        self._resolve()
+        with self._run_lock:
+            started = time.time()
+            rows = self.rows_since_training()
+            self.running = True
+            try:
+                # load_or_train holds the predictor's training lock
+                self.predictor.load_or_train()
+            finally:
+                self.running = False
+            self.last_run = {
+                'started_at': started,
+                'duration_seconds': round(time.time() - started, 3),
+                'new_rows': rows,
+                'model_version': self.predictor.model_version
+            }
+            return self.last_run
+
+    def status(self):
+        """What the live model was trained on and what is waiting"""
+        self._resolve()
+        state = self.predictor.state
+        return {
+            'model_version': state.version if state is not None else None,
+            'trained_at': state.trained_at if state is not None else None,
+            'training_samples': state.training_results['training_samples'] if state is not None else None,
+            'feedback_rows': self.store.last_id(),
+            'rows_since_training': self.rows_since_training(),
+            'min_new_rows': self.min_new_rows,
+            'interval_seconds': self.interval_seconds,
+            'window_rows': settings.retrain_window_rows,
+            'running': self.running,
+            'last_run': self.last_run
+        }
+
+    def stop(self):
+        """Stop the background thread, a retrain in progress finishes first"""
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+
+# Global instance
+model_retrainer = ModelRetrainer()
@@ -0,0 +1,126 @@
+import time
+import numpy as np
+
+def path_cost(matrix, path):
+    """Total cost of visiting the path in order, path[0] is the start"""
+    path = np.asarray(path, dtype=np.intp)
+    if len(path) < 2:
+        return 0.0
+    return float(matrix[path[:-1], path[1:]].sum())
+
+
+# Orders the stops of one crew's day starting from its depot
+# Routes are open paths, the crew starts at the depot and the day ends at the last job
+# Nearest neighbor gives a decent first route, then 2-opt and Or-opt moves improve it until nothing helps or time runs out
+# The moves assume travel is symmetric, which is how LocationIndex builds its matrices
+class RouteOptimizer:
+    def __init__(self, time_budget_ms=20):
+        self.time_budget_ms = time_budget_ms
+
+    def solve(self, matrix, start, stops):
+        """Return the stops in the order to visit them, starting from start"""
+        stops = list(stops)
+        if len(stops) < 2:
+            return stops
+
+        deadline = time.perf_counter() + self.time_budget_ms / 1000
+        path = self._nearest_neighbor(matrix, start, stops)
+        return self._local_search(matrix, path, deadline)
+
+    def improve(self, matrix, start, stops):
+        """Improve an existing visiting order with local moves only, for repairing a route after a small change"""
+        stops = list(stops)
+        if len(stops) < 2:
+            return stops
+        deadline = time.perf_counter() + self.time_budget_ms / 1000
+        return self._local_search(matrix, [start] + stops, deadline)
+
+    def _local_search(self, matrix, path, deadline):
+        # Plain lists are much faster than numpy for the one value at a time lookups the local search does
+        dist = matrix.tolist()
+
+        improved = True
+        while improved and time.perf_counter() < deadline:
+            improved = self._two_opt(dist, path, deadline)
+            improved = self._or_opt(dist, path, deadline) or improved
+        return path[1:]
+
+    def _nearest_neighbor(self, matrix, start, stops):
+        """Always drive to the closest stop we haven't visited yet"""
+        stops = np.asarray(stops, dtype=np.intp)
+        visited = np.zeros(len(stops), dtype=bool)
+        path = [start]
+        current = start
+        for _ in range(len(stops)):
+            # Visited stops get infinity so argmin skips them, ties go to the earliest stop
+            costs = np.where(visited, np.inf, matrix[current, stops])
+            nearest = int(np.argmin(costs))
+            visited[nearest] = True
+            current = int(stops[nearest])
+            path.append(current)
+        return path
+
+    def _two_opt(self, dist, path, deadline):
+        """Reverse segments of the path while that makes it shorter, changes path in place"""
+        improved = False
+        n = len(path)
+        for i in range(1, n - 1):
+            if time.perf_counter() >= deadline:
+                break
+            for k in range(i + 1, n):
+                # Reversing path[i..k] swaps the edges (i-1, i) and (k, k+1) for (i-1, k) and (i, k+1)
+                # On the last stop there is no edge after k, the route is open
+                before = dist[path[i - 1]][path[i]]
+                after = dist[path[i - 1]][path[k]]
+                if k + 1 < n:
+                    before += dist[path[k]][path[k + 1]]
+                    after += dist[path[i]][path[k + 1]]
+                if after < before - 1e-9:
+                    path[i:k + 1] = path[i:k + 1][::-1]
+                    improved = True
+        return improved
+
+    def _or_opt(self, dist, path, deadline):
+        """Move runs of 1 to 3 stops to a better spot in the path, changes path in place"""
+        improved = False
+        for length in (1, 2, 3):
+            i = 1
+            while i + length <= len(path):
+                if time.perf_counter() >= deadline:
+                    return improved
+                if self._move_segment(dist, path, i, length):
+                    improved = True
+                else:
+                    i += 1
+        return improved
+
+    def _move_segment(self, dist, path, i, length):
+        """Try to move path[i:i+length] to the cheapest other position, returns True if it moved"""
+        n = len(path)
+        first, last = path[i], path[i + length - 1]
+        prev = path[i - 1]
+        nxt = path[i + length] if i + length < n else None
+
+        # What we save by cutting the segment out and joining its neighbors
+        removed = dist[prev][first]
+        if nxt is not None:
+            removed += dist[last][nxt] - dist[prev][nxt]
+
+        rest = path[:i] + path[i + length:]
+        best_gain, best_position = 1e-9, None
+        for p in range(len(rest)):
+            if p == i - 1:
+                continue # That's where it came from
+            a = rest[p]
+            b = rest[p + 1] if p + 1 < len(rest) else None
+            # Cost of putting the segment between a and b
+            added = dist[a][first]
+            if b is not None:
+                added += dist[last][b] - dist[a][b]
+            gain = removed - added
+            if gain > best_gain:
+                best_gain, best_position = gain, p
+        if best_position is None:
+            return False
+        path[:] = rest[:best_position + 1] + path[i:i + length] + rest[best_position + 1:]
+        return True
@@ -1,7 +1,15 @@
 import random
-import time
 from typing import List, Dict
 import numpy as np
+from .assignment import AssignmentEngine, TRAVEL_MINUTES_PER_JOB, required_skill
+from .solvers import AssignmentSolver, PRIORITY_WEIGHTS
+from .routing import RouteOptimizer, path_cost
+from .locations import location_index
+from .partitioning import partition_solver
+from .tables import RoutePlan, as_crew_table, as_job_table
+from .metrics import StageTimer, drain_worker_metrics
+from .analytics import ScheduleAnalytics
+from ..config import settings
 
 class ScheduleOptimizer:
     def __init__(self):
@@ -19,216 +27,205 @@ class ScheduleOptimizer:
             ("North Depot", "5678 Pine Avenue"): {"miles": 2.3, "minutes": 9},
         }
     
-    def optimize_schedule(self, jobs, crews):
+    def optimize_schedule(self, jobs, crews, progress_callback=None, strategy="greedy", time_budget_ms=None, partition_by_depot=False, rebalance=True, risk_percentile=None):
         """Enhanced optimization with ML predictions"""
+        return self._optimize(jobs, crews, progress_callback, strategy, time_budget_ms, partition_by_depot, rebalance, risk_percentile)[0]
+    
+    # Does the work of optimize_schedule and also hands back the tables and plans, schedule sessions keep those to repair later
+    # risk_percentile packs crews with that percentile of each job's predicted duration instead of the mean,
+    # 80 plans days that 80% of the forest's trees think will fit
+    # With serialize_routes=False the response has no routes, streaming callers serialize the plans one crew at a time
+    def _optimize(self, jobs, crews, progress_callback=None, strategy="greedy", time_budget_ms=None, partition_by_depot=False, rebalance=True, risk_percentile=None, serialize_routes=True):
+        """Return (response, job table, crew table, route plans)"""
         
         # Import here to avoid circular imports, that’s when two files try to import each other and cause an error.
         from .ml_model import duration_predictor
-        from .mock_data import get_job_features
         
-        time.sleep(2)
+        # Each stage is timed, the timings travel back with the result so the API can record them
+        # even when this ran in a worker process
+        timer = StageTimer()
+        
+        # Everything below works on columns (numpy arrays) instead of copying and re-reading job dicts
+        # jobs and crews can be plain lists of dicts or tables that were already built
+        with timer.stage("build_tables"):
+            jobs = as_job_table(jobs)
+            crews = as_crew_table(crews)
         
         # Use ML to improve duration estimates
-        ml_enhanced_jobs = []
-        for job in jobs:
-            # uses the method from mock.data.py to convert to numerical features for the model to use
-            features = get_job_features(job)
-            # uses the method from ml.model.py to predict the duration of the job using the traiend ML model
-            ml_prediction = duration_predictor.predict_duration(features)
-            
-            # Create enhanced job with ML prediction
-            # This is important, we are making a copy of the job dict so we can alter it without making changes to the original
-            enhanced_job = job.copy()
-            # Here I am adding a new key value pair to the job dict. So if ml_prediction['predicted_duration'] is 135, the dictionary becomes:
-            # {'estimated_duration': 120, 'ml_predicted_duration': 135}
-            enhanced_job['ml_predicted_duration'] = ml_prediction['predicted_duration']
-            #Adds another new field showing how confident the ML model was: {'estimated_duration': 120, 'ml_predicted_duration': 135, 'prediction_confidence': '90%'}
-            enhanced_job['prediction_confidence'] = ml_prediction['confidence']
-            # Keeps track of the original estimate from before the ML enhancement. That way, you can later compare: the old human estimate to the ML prediction
-            """Now the dictionary looks like:
-                {
-                'estimated_duration': 120,
-                'ml_predicted_duration': 135,
-                'prediction_confidence': '90%',
-                'original_estimate': 120
-                }"""
-            enhanced_job['original_estimate'] = job['estimated_duration']
-            # This list will hold all jobs that have been processed and now include ML data.
-            # it will be a list of dicts like the one I just created above
-            ml_enhanced_jobs.append(enhanced_job)
+        self._report_progress(progress_callback, "ml_enhancement", 0, f"Predicting durations for {len(jobs)} jobs")
+        with timer.stage("ml_enhancement"):
+            # uses the method from ml.model.py to predict all job durations with a single call to the trained ML model
+            # The table already holds every job's features as one matrix, in the order the model expects
+            ml_predictions = duration_predictor.predict_durations(jobs.features, risk_percentile)
+            # The predictions are kept as numbers, they only get turned into "90%" style strings when the response is built
+            jobs.set_predictions(
+                ml_predictions['predicted_duration'], ml_predictions['confidence'],
+                (ml_predictions['p10'], ml_predictions['p90']), ml_predictions.get('risk_duration')
+            )
         
         # Use ML predictions for optimization, uses help functions below
-        optimized_routes = self._assign_jobs_to_crews(ml_enhanced_jobs, crews)
-        efficiency_report = self._calculate_efficiency_gains(ml_enhanced_jobs, crews, optimized_routes)
-        recommendations = self._generate_ml_recommendations(ml_enhanced_jobs, crews, optimized_routes)
-        
-        return {
+        self._report_progress(progress_callback, "assign_jobs_to_crews", 40, f"Assigning jobs to {len(crews)} crews")
+        # greedy is the fast crew by crew pass, local_search and exact spend up to time_budget_ms looking for a better schedule
+        if time_budget_ms is None:
+            time_budget_ms = settings.solver_time_budget_ms
+        if partition_by_depot:
+            # Every depot is its own smaller problem, solved (assigned and routed) in parallel worker processes
+            with timer.stage("solve_partitions"):
+                plans, strategy_report = partition_solver.solve(jobs, crews, strategy, time_budget_ms, rebalance)
+        else:
+            with timer.stage("assign_jobs_to_crews"):
+                assignments, strategy_report = AssignmentSolver(jobs, crews).solve(strategy, time_budget_ms)
+                plans = [RoutePlan(c, job_indices) for c, job_indices in enumerate(assignments)]
+            self._report_progress(progress_callback, "optimize_routes", 60, "Optimizing crew routes")
+            with timer.stage("optimize_routes"):
+                self._optimize_routes(jobs, crews, plans)
+        strategy_report["risk_percentile"] = risk_percentile
+        # One pass over the tables and plans gives the report, the recommendations and the per crew numbers
+        # the analytics store aggregates across runs
+        self._report_progress(progress_callback, "analytics", 75, "Calculating efficiency gains")
+        with timer.stage("analytics"):
+            analytics = ScheduleAnalytics(jobs, crews, plans)
+            efficiency_report = analytics.efficiency_report()
+            recommendations = analytics.recommendations()
+            analytics_report = {"totals": analytics.totals(), "crews": analytics.crew_rows()}
+        with timer.stage("serialize_routes"):
+            routes = self._serialize_routes(jobs, crews, plans) if serialize_routes else None
+            # Jobs that didn't fit in any crew's day used to just disappear from the response
+            unassigned_job_ids = [jobs.ids[j] for j in np.flatnonzero(~analytics.assigned)]
+        
+        with timer.stage("model_info"):
+            # The version the predictions above came from, not whatever is live by now, the result cache keys on it
+            model_info = {**duration_predictor.get_model_info(), 'model_version': ml_predictions['model_version']}
+        
+        # timings (milliseconds per stage) feed /metrics, the API only shows timings in debug mode
+        response = {
             "status": "success",
-            "routes": optimized_routes,
+            "routes": routes,
+            "unassigned_job_ids": unassigned_job_ids,
             "efficiency_report": efficiency_report,
             "recommendations": recommendations,
-            "ml_model_info": duration_predictor.get_model_info()
+            "analytics": analytics_report,
+            "strategy_report": strategy_report,
+            "ml_model_info": model_info,
+            "timings": timer.as_milliseconds()
         }
+        if routes is None:
+            del response["routes"]
+        # Only set in a process pool worker, record_optimization merges these into the API's registry
+        worker_metrics = drain_worker_metrics()
+        if worker_metrics is not None:
+            response["worker_metrics"] = worker_metrics
+        return response, jobs, crews, plans
+    
+    def _report_progress(self, progress_callback, phase, percent, message):
+        """Tell the caller which phase we are in, if they asked to know"""
+        if progress_callback is not None:
+            progress_callback({"phase": phase, "percent": percent, "message": message})
     
     def _assign_jobs_to_crews(self, jobs, crews):
         """I am trying to assign jobs to crews efficiently using the ML predictions"""
+        jobs = as_job_table(jobs)
+        crews = as_crew_table(crews)
+        # The engine indexes jobs by skill and crew size and returns the job indices each crew gets
+        assignments = AssignmentEngine(jobs, crews).assign()
+        return self._serialize_routes(jobs, crews, [RoutePlan(c, job_indices) for c, job_indices in enumerate(assignments)])
+    
+    # ids_only lists the crew's job ids in route order instead of a full copy of every job
+    def _serialize_routes(self, jobs, crews, plans, ids_only=False):
+        """Turn the route plans into the route summaries the API returns"""
         # routes will hold the final crew to job assignments 
         routes = []
-        # starts as a copy of all the jobs so we dont alter the real data, they will be removed from this list as we assign them
-        unassigned_jobs = jobs.copy()
-        
 
-        for crew in crews:
-            # Holds all jobs the current crew will be assigned
-            crew_jobs = []
-            available_hours = crew["available_hours"] * 60  # Convert to minutes
-            # Tracks how much time this crew's day is already filled
-            used_minutes = 0
-            
-            # Sort jobs by priority and crew skill match
-            suitable_jobs = []
-            for job in unassigned_jobs:
-                if job["crew_size_needed"] <= crew["size"]:
-                    skill_match = self._calculate_skill_match(job, crew)
-                    suitable_jobs.append((job, skill_match))
-            
-            # Sort by skill match and priority
-            # Jobs with higher skill_match come first
-            suitable_jobs.sort(key=lambda x: (x[1], x[0]["priority"] == "high"), reverse=True)
-            
-            # Assign jobs using ML predictions
-            for job, _ in suitable_jobs:
-                # Use ML predicted duration instead of manual estimate
-                job_duration = job.get('ml_predicted_duration', job['estimated_duration'])
-                travel_time = 25  # Average travel time between jobs assumed
-                
-                # check if there is still enough time in the crews schedule 
-                if used_minutes + job_duration + travel_time <= available_hours:
-                    crew_jobs.append(job)
-                    used_minutes += job_duration + travel_time
-                    unassigned_jobs.remove(job)
-            
+        for plan in plans:
             # Calculate route metrics
-            total_drive_time = len(crew_jobs) * 25  # Average 25 min between jobs
-            # Adds up how long all assigned jobs take, again use ML and then human estimate as fallback
-            total_work_time = sum(job.get('ml_predicted_duration', job['estimated_duration']) for job in crew_jobs)
+            # Before routing has run we fall back to the old 25 min average between jobs
+            total_drive_time = plan.drive_minutes if plan.drive_minutes is not None else len(plan.jobs) * TRAVEL_MINUTES_PER_JOB
+            # Adds up how long all assigned jobs take, the table holds the ML prediction or the human estimate as fallback
+            total_work_time = int(jobs.predicted_duration[plan.jobs].sum())
             
-            # Create a summary dict for the current crew
-            routes.append({
-                "crew_id": crew["id"],
-                "crew_name": crew["name"],
-                "jobs": crew_jobs,
+            # Create a summary dict for the current crew, this is the only place job dicts get copied
+            route = {
+                "crew_id": crews.ids[plan.crew],
+                "crew_name": crews.names[plan.crew],
+                **({"job_ids": [jobs.ids[j] for j in plan.jobs]} if ids_only else {"jobs": [jobs.to_dict(j) for j in plan.jobs]}),
                 "total_drive_time": f"{total_drive_time} minutes",
                 "total_work_time": f"{total_work_time//60}h {total_work_time%60}m",
-                "efficiency_score": min(95, 70 + len(crew_jobs) * 8),
+                "efficiency_score": min(95, 70 + len(plan.jobs) * 8),
                 "ml_optimized": True
-            })
+            }
+            if plan.miles is not None:
+                route["total_miles"] = plan.miles
+                route["baseline_miles"] = plan.baseline_miles
+            routes.append(route)
         
         # We will end up with a list of summary dicts for each crew like the one above
         return routes
     
+    def _optimize_routes(self, jobs, crews, plans):
+        """Order each crew's jobs into a short drive and record the real drive time and miles on the plans"""
+        # Our measured legs win over the coordinate estimates, registering the same legs again is a no-op
+        location_index.add_known_legs(self.distance_matrix)
+
+        # Each crew gets a matrix for just its depot and stops, one matrix over every location in the problem
+        # would grow with the square of the job count. Matrices are cached per location set,
+        # so optimizing the same customer base again doesn't rebuild them
+        route_optimizer = RouteOptimizer(time_budget_ms=settings.route_time_budget_ms)
+        for plan in plans:
+            crew_location = location_index.location_id(crews.start_locations[plan.crew])
+            job_locations = [location_index.location_id(jobs.addresses[j]) for j in plan.jobs]
+            locations, minutes, miles = location_index.travel_matrices([crew_location] + job_locations)
+            start = locations[crew_location]
+            stops = [locations[location_id] for location_id in job_locations]
+
+            # Solve on positions in a small per stop matrix, so two jobs at the same address stay separate stops
+            local = [start] + stops
+            local_minutes = minutes[np.ix_(local, local)]
+            order = route_optimizer.solve(local_minutes, 0, range(1, len(local)))
+
+            # Assignment only allowed the flat 25 minutes per job for driving, the real legs can add up to more
+            # than the crew's hours. Those jobs come off the route and show up as unassigned instead of silently
+            # making the day too long
+            kept = self._fit_to_hours(jobs, crews.available_minutes[plan.crew], plan.jobs, order, local_minutes)
+            kept_positions = set(kept)
+            assigned_order = [position for position in range(1, len(local)) if position in kept_positions]
+            plan.dropped = plan.dropped + [plan.jobs[position - 1] for position in order if position not in kept_positions]
+
+            # The order the jobs were assigned in is what a dispatcher would have driven without routing
+            plan.baseline_miles = round(path_cost(miles, [start] + [stops[position - 1] for position in assigned_order]), 1)
+            plan.jobs = [plan.jobs[position - 1] for position in kept]
+
+            tour = [start] + [stops[position - 1] for position in kept]
+            plan.drive_minutes = int(round(path_cost(minutes, tour)))
+            plan.miles = round(path_cost(miles, tour), 1)
+        return plans
+
+    def _fit_to_hours(self, jobs, available_minutes, job_indices, order, local_minutes):
+        """The route (positions into local_minutes) with stops taken off until work plus real driving fits the crew's hours
+        Lowest priority goes first, then whichever stop gives back the most time, its work plus the detour to reach it"""
+        route = list(order)
+        work = {position: float(jobs.planning_duration[job_indices[position - 1]]) for position in route}
+        weight = {position: PRIORITY_WEIGHTS.get(jobs.priorities[job_indices[position - 1]], 1.0) for position in route}
+        drive = path_cost(local_minutes, [0] + route)
+        total = sum(work.values()) + drive
+        while route and total > available_minutes + 1e-9:
+            path = [0] + route
+            best, best_key, best_saved = None, None, 0.0
+            for i, position in enumerate(route):
+                before, after = path[i], path[i + 2] if i + 2 < len(path) else None
+                detour = local_minutes[before, position]
+                if after is not None:
+                    detour += local_minutes[position, after] - local_minutes[before, after]
+                saved = work[position] + detour
+                key = (-weight[position], saved)
+                if best_key is None or key > best_key:
+                    best, best_key, best_saved = i, key, saved
+            route.pop(best)
+            total -= best_saved
+        return route
+    
     def _calculate_skill_match(self, job, crew):
         """Calculate how well crew skills match job requirements"""
-        job_type = job["service_type"]
-
-        # This maps the service_type name to the skill name we expect the crew to have
-        skill_mapping = {
-            "weekly_mowing": "mowing",
-            "large_cleanup": "cleanup", 
-            "tree_trimming": "tree_work"
-        }
-        
-        # Looks up the required skill in the map, if it DNE then default to mowing
-        required_skill = skill_mapping.get(job_type, "mowing")
+        # Looks up the required skill in the shared map, if it DNE then default to mowing
+        skill = required_skill(job["service_type"])
         # If the required skill is found in the crews skills we return 1, else 0.5
-        return 1.0 if required_skill in crew["skills"] else 0.5
-    
-    def _calculate_efficiency_gains(self, jobs, crews, routes):
-        """Calculate efficiency improvements with ML insights"""
-        
-        # Base calculations
-        total_jobs = len(jobs)
-        # how many jobs actually got assigned to crews
-        assigned_jobs = sum(len(route["jobs"]) for route in routes)
-        
-        # ML vs Manual human time comparison
-        # This sums all the AI ML predicted durations
-        ml_total_time = sum(job.get('ml_predicted_duration', job['estimated_duration']) for job in jobs)
-        # This sums the human estimated durations
-        manual_total_time = sum(job['estimated_duration'] for job in jobs)
-        # This calculates the difference between the two
-        ml_time_savings = max(0, manual_total_time - ml_total_time)
-        
-        # Enhanced efficiency calculation (0-45) to describe how optimized the schedule is
-        base_efficiency = 20  # Higher base due to ML
-        ml_bonus = min(25, (ml_time_savings / 60) * 2)  # Bonus from ML accuracy, for every hour saved it adds 2 points
-        job_bonus = min(10, (assigned_jobs - 4) * 2)  # More jobs handled, add 2 points per extra job
-        
-        # Combine all the metrics above
-        efficiency_gain = int(base_efficiency + ml_bonus + job_bonus)
-        
-        # Miles saved (enhanced with ML routing), calls helper function
-        miles_saved = self._calculate_miles_saved(jobs, routes)
-        
-        # Time saved (ML + optimization)
-        base_time_saved = ml_time_savings / 60  # ML time savings
-        optimization_time_saved = assigned_jobs * 0.2  # 12min per job from optimization
-        time_saved = round(base_time_saved + optimization_time_saved, 1)
-        
-        # Revenue calculation (more aggressive with ML)
-        jobs_per_crew_improvement = max(0, assigned_jobs - (len(crews) * 2))
-        avg_job_revenue = 90  # Higher average
-        efficiency_revenue = jobs_per_crew_improvement * avg_job_revenue # money earned from completing more jobs
-        time_value_revenue = int(time_saved * 40)  # Owner time is valuable, about 40$ an hour
-        fuel_savings = int(miles_saved * 0.70)  # Gas savings, about 0.70$ per mile
-        
-        # combine all for the extra revenue calculation
-        extra_revenue = efficiency_revenue + time_value_revenue + fuel_savings
-        
-        # Ensure impressive minimum
-        if extra_revenue < 150:
-            extra_revenue = 150 + (assigned_jobs * 20)
-        
-        return {
-            "efficiency_gain": min(45, efficiency_gain),
-            "miles_saved": miles_saved,
-            "time_saved": time_saved,
-            "extra_revenue": int(extra_revenue),
-            "success_probability": min(96, 88 + efficiency_gain // 5),
-            "ml_time_savings": round(ml_time_savings / 60, 1)
-        }
-    
-    
-    def _calculate_miles_saved(self, jobs, routes):
-        """Calculate miles saved through ML-enhanced optimization"""
-        total_locations = len(jobs)
-        estimated_manual_miles = total_locations * 9  # Manual routing is inefficient
-        optimized_miles = total_locations * 5.8  # ML-optimized routing
-        
-        return int(estimated_manual_miles - optimized_miles)
-    
-    def _generate_ml_recommendations(self, jobs, crews, routes):
-        """Generate ML-enhanced recommendations"""
-        recommendations = []
-        
-        # ML-specific insights
-        ml_jobs = [j for j in jobs if 'ml_predicted_duration' in j]
-        if ml_jobs:
-            avg_confidence = np.mean([float(job['prediction_confidence'].replace('%', '')) for job in ml_jobs])
-            recommendations.append(f"Custom ML model predicts job durations with {avg_confidence:.0f}% accuracy, enabling precise resource allocation")
-        
-        # Time optimization insights
-        time_optimized = [j for j in jobs if j.get('ml_predicted_duration', 0) < j.get('original_estimate', 0)]
-        if time_optimized:
-            total_time_saved = sum(j['original_estimate'] - j['ml_predicted_duration'] for j in time_optimized)
-            recommendations.append(f"AI duration modeling identifies {total_time_saved} minutes of daily scheduling buffer, allowing for additional service capacity")
-        
-        # Cost advantage
-        recommendations.append("Proprietary ML model delivers enterprise-grade optimization at $0 ongoing cost vs $200+/month for commercial AI APIs")
-        
-        # Business intelligence insight
-        high_efficiency_crews = [r for r in routes if len(r['jobs']) >= 3]
-        if high_efficiency_crews:
-            recommendations.append(f"ML analysis shows {len(high_efficiency_crews)} crew(s) operating at optimal capacity - consider expansion to capture additional market demand")
-        
-        return recommendations
\ No newline at end of file
+        return 1.0 if skill in crew["skills"] else 0.5
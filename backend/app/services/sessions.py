@@ -0,0 +1,414 @@
+import bisect
+import threading
+import time
+import uuid
+from collections import OrderedDict
+import numpy as np
+from .assignment import TRAVEL_MINUTES_PER_JOB, required_skill
+from .locations import location_index
+from .mock_data import get_job_feature_matrix
+from .metrics import SESSION_DELTA_SECONDS
+from .routing import RouteOptimizer, path_cost
+from .tables import CrewTable, JobTable, RoutePlan
+from ..config import settings
+
+# A new job only gets the exact cheapest insertion check on this many crews, the rest are ruled out
+# by skill match and how far their depot is from the job, so placing one job doesn't touch every route
+INSERTION_CANDIDATES = 4
+
+# Lower comes first when placing jobs and last when a crew has to give jobs up
+PRIORITY_RANK = {"high": 0, "medium": 1, "low": 2}
+
+# When a crew frees up time we try at most this many waiting jobs that don't end up fitting (crew size) before giving up
+MAX_FAILED_REFILLS = 16
+
+# Sorts after every job id, so bisecting for (room, LAST_ID) lands after every job that takes exactly room minutes
+LAST_ID = chr(0x10FFFF)
+
+
+class UnknownIdError(KeyError):
+    """A delta names a job or crew the session doesn't have"""
+
+
+class DuplicateIdError(ValueError):
+    """A delta adds a job id the session already has"""
+
+
+# One optimized day that dispatchers keep changing. The session keeps every job's prediction and every crew's route,
+# so a delta only re-predicts the jobs it touches and only repairs the routes of the crews it touches
+# The capacity checks are the scheduler's: jobs are placed with planned minutes plus the 25 minute travel allowance per job,
+# and a repaired route gives stops back to the waiting list when the real drive time doesn't fit the crew's hours. The day keeps
+# the options it was optimized with, a session opened with risk_percentile plans new jobs at that percentile too
+# and one opened with partition_by_depot keeps new jobs at their nearest depot
+class ScheduleSession:
+    def __init__(self, optimizer, jobs, crews, plans, risk_percentile=None, partition_by_depot=False, rebalance=True):
+        self.session_id = uuid.uuid4().hex
+        self.version = 1
+        self.optimizer = optimizer # Used for its route serialization, so routes look exactly like /api/optimize-schedule's
+        self.risk_percentile = risk_percentile
+        self.partition_by_depot = partition_by_depot
+        self.rebalance = rebalance
+
+        if len(set(jobs.ids)) != len(jobs.ids):
+            raise DuplicateIdError("Job ids must be unique within a session")
+        self.crews = crews
+        self.crew_positions = {crew_id: c for c, crew_id in enumerate(crews.ids)}
+        self.available_minutes = crews.available_minutes.copy()
+        self.used_minutes = np.zeros(len(crews))
+        self.online = np.ones(len(crews), dtype=bool)
+        self.depots = [location_index.location_id(location) for location in crews.start_locations]
+        # Distinct depots, which one each crew starts from and the biggest crew there, for partition_by_depot placement
+        depot_positions = {}
+        self.crew_depot = np.array([depot_positions.setdefault(depot, len(depot_positions)) for depot in self.depots], dtype=np.intp)
+        self.depot_ids = list(depot_positions)
+        self.depot_largest = np.zeros(len(self.depot_ids))
+        np.maximum.at(self.depot_largest, self.crew_depot, crews.sizes)
+
+        self.jobs = {} # job id -> job record
+        self.predictions = {} # job id -> (predicted minutes, confidence, p10, p90, planned minutes)
+        for j, job_id in enumerate(jobs.ids):
+            self.jobs[job_id] = jobs.records[j]
+            self.predictions[job_id] = (
+                int(jobs.predicted_duration[j]), float(jobs.confidence[j]), float(jobs.duration_p10[j]), float(jobs.duration_p90[j]),
+                int(jobs.planning_duration[j])
+            )
+
+        self.routes = [[] for _ in range(len(crews))] # job ids per crew in visiting order
+        self.route_stats = [(0, 0.0, 0.0)] * len(crews) # (drive minutes, miles, baseline miles) per crew
+        self.job_crew = {} # job id -> crew position, for assigned jobs
+        for plan in plans:
+            self.routes[plan.crew] = [jobs.ids[j] for j in plan.jobs]
+            self.route_stats[plan.crew] = (plan.drive_minutes, plan.miles, plan.baseline_miles)
+            for job_id in self.routes[plan.crew]:
+                self.job_crew[job_id] = plan.crew
+                self.used_minutes[plan.crew] += self._cost(job_id)
+        # A dict keeps the order jobs became unassigned in and removes in O(1)
+        self.unassigned = {}
+        # The same jobs as sorted (cost, job id) lists per priority rank, so refilling freed time only looks at jobs that fit
+        self.waiting = {rank: [] for rank in sorted(set(PRIORITY_RANK.values()))}
+        for job_id in jobs.ids:
+            if job_id not in self.job_crew:
+                self._add_unassigned(job_id)
+
+        self.updated_at = time.time()
+        self._lock = threading.Lock()
+
+    def _cost(self, job_id):
+        return self.predictions[job_id][4] + TRAVEL_MINUTES_PER_JOB
+
+    def _rank(self, job_id):
+        return PRIORITY_RANK.get(self.jobs[job_id].get("priority", "medium"), 1)
+
+    def _add_unassigned(self, job_id):
+        self.unassigned[job_id] = None
+        bisect.insort(self.waiting[self._rank(job_id)], (self._cost(job_id), job_id))
+
+    def _remove_unassigned(self, job_id):
+        # Called before the job's record or prediction changes, so its rank and cost still find it
+        if job_id in self.unassigned:
+            del self.unassigned[job_id]
+            waiting = self.waiting[self._rank(job_id)]
+            entry = (self._cost(job_id), job_id)
+            i = bisect.bisect_left(waiting, entry)
+            if i < len(waiting) and waiting[i] == entry:
+                del waiting[i]
+
+    def apply(self, delta):
+        """Apply a delta and return what changed, delta is a dict with add_jobs, update_jobs, remove_job_ids,
+        offline_crew_ids and available_hours ({crew id: hours})"""
+        started = time.perf_counter()
+        with self._lock:
+            self._validate(delta)
+            # Only new and changed jobs go to the model, before anything changes, so a prediction that fails
+            # leaves the session as it was just like a delta that doesn't validate
+            predictions = self._predict(list(delta.get("update_jobs", ())) + list(delta.get("add_jobs", ())))
+            before = {} # crew position -> its route before this delta, for every crew we touch
+            unassigned_before = {} # job id -> whether it was unassigned before this delta, for every job we touch
+            updated_ids = {job["id"] for job in delta.get("update_jobs", ())}
+            pending = []
+
+            for job_id in delta.get("remove_job_ids", ()):
+                self._take_job(job_id, before, unassigned_before)
+                del self.jobs[job_id]
+                del self.predictions[job_id]
+            for job in delta.get("update_jobs", ()):
+                # Taken off with its old prediction, that's the cost its crew and the waiting list have for it
+                self._take_job(job["id"], before, unassigned_before)
+                self.jobs[job["id"]] = job
+                self.predictions[job["id"]] = predictions[job["id"]]
+                pending.append(job["id"])
+            for job in delta.get("add_jobs", ()):
+                unassigned_before[job["id"]] = False
+                self.jobs[job["id"]] = job
+                self.predictions[job["id"]] = predictions[job["id"]]
+                pending.append(job["id"])
+
+            for crew_id in delta.get("offline_crew_ids", ()):
+                c = self.crew_positions[crew_id]
+                self.online[c] = False
+                for job_id in list(self.routes[c]):
+                    self._take_job(job_id, before, unassigned_before)
+                    pending.append(job_id)
+            for crew_id, hours in delta.get("available_hours", {}).items():
+                c = self.crew_positions[crew_id]
+                self.available_minutes[c] = hours * 60
+                pending.extend(self._trim_to_capacity(c, before, unassigned_before))
+
+            # High priority and long jobs first, they are the hardest to fit
+            pending.sort(key=lambda job_id: (self._rank(job_id), -self._cost(job_id)))
+            for job_id in pending:
+                if not self._place(job_id, before):
+                    self._add_unassigned(job_id)
+
+            # Crews that gave up work can take jobs that didn't fit anywhere before
+            freed = [c for c in before if self.online[c] and self.available_minutes[c] > self.used_minutes[c]]
+            if freed and self.unassigned:
+                self._fill_from_unassigned(freed, before, unassigned_before)
+
+            for c in list(before):
+                self._repair_route(c, before, unassigned_before)
+            self.version += 1
+            self.updated_at = time.time()
+            diff = self._diff(before, unassigned_before, updated_ids)
+        elapsed = time.perf_counter() - started
+        SESSION_DELTA_SECONDS.observe(elapsed)
+        diff["elapsed_ms"] = round(elapsed * 1000, 2)
+        return diff
+
+    def _validate(self, delta):
+        # Everything is checked before anything changes, a bad delta leaves the session as it was
+        for job_id in list(delta.get("remove_job_ids", ())) + [job["id"] for job in delta.get("update_jobs", ())]:
+            if job_id not in self.jobs:
+                raise UnknownIdError(f"Unknown job id {job_id}")
+        touched = list(delta.get("remove_job_ids", ())) + [job["id"] for job in delta.get("update_jobs", ())]
+        if len(set(touched)) != len(touched):
+            raise DuplicateIdError("A job can only be removed or updated once per delta")
+        added = [job["id"] for job in delta.get("add_jobs", ())]
+        if len(set(added)) != len(added) or any(job_id in self.jobs for job_id in added):
+            raise DuplicateIdError("Added jobs need ids the session doesn't have yet")
+        for crew_id in list(delta.get("offline_crew_ids", ())) + list(delta.get("available_hours", {})):
+            if crew_id not in self.crew_positions:
+                raise UnknownIdError(f"Unknown crew id {crew_id}")
+
+    def _take_job(self, job_id, before, unassigned_before):
+        """Take a job off its crew's route or out of the unassigned list"""
+        unassigned_before.setdefault(job_id, job_id in self.unassigned)
+        self._remove_unassigned(job_id)
+        c = self.job_crew.pop(job_id, None)
+        if c is not None:
+            before.setdefault(c, list(self.routes[c]))
+            self.routes[c].remove(job_id)
+            self.used_minutes[c] -= self._cost(job_id)
+
+    def _predict(self, jobs):
+        """job id -> (predicted minutes, confidence, p10, p90, planned minutes) for job records, nothing is stored"""
+        # Import here like the scheduler does, the model is only needed once a delta brings new jobs
+        from .ml_model import duration_predictor
+
+        if not jobs:
+            return {}
+        features = get_job_feature_matrix(jobs)
+        predictions = duration_predictor.predict_durations(features, self.risk_percentile)
+        # Same durations the day was packed with, the mean or the session's risk percentile
+        planned = predictions.get('risk_duration', predictions['predicted_duration'])
+        return {
+            job["id"]: (
+                int(predictions['predicted_duration'][i]), float(predictions['confidence'][i]),
+                float(predictions['p10'][i]), float(predictions['p90'][i]), int(planned[i])
+            )
+            for i, job in enumerate(jobs)
+        }
+
+    def _trim_to_capacity(self, c, before, unassigned_before):
+        """Drop jobs from a crew whose hours went down until its day fits again, lowest priority and longest first"""
+        dropped = []
+        while self.used_minutes[c] > self.available_minutes[c] + 1e-9 and self.routes[c]:
+            job_id = max(self.routes[c], key=lambda job_id: (self._rank(job_id), self._cost(job_id)))
+            self._take_job(job_id, before, unassigned_before)
+            dropped.append(job_id)
+        return dropped
+
+    def _place(self, job_id, before):
+        """Put a job on the crew and route position where it adds the least driving, returns False if no crew has room"""
+        job = self.jobs[job_id]
+        cost = self._cost(job_id)
+        fits = self.online & (self.crews.sizes >= job["crew_size_needed"]) & (self.available_minutes - self.used_minutes >= cost)
+        candidates = np.flatnonzero(fits)
+        location = location_index.location_id(job.get("address", ""))
+        if self.partition_by_depot and len(candidates):
+            # Like the partitioned run, crews of the job's own depot first, other depots only when rebalancing is on
+            home = np.isin(self.crew_depot[candidates], self._home_depots(location, job["crew_size_needed"]))
+            if home.any() or not self.rebalance:
+                candidates = candidates[home]
+        if len(candidates) == 0:
+            return False
+
+        # Shortlist by skill match first (like the greedy), then by how far the crew's depot is from the job
+        skill = required_skill(job["service_type"])
+        match = np.array([1.0 if skill in self.crews.skills[c] else 0.5 for c in candidates])
+        depot_minutes, _ = location_index.legs_from(location, [self.depots[c] for c in candidates])
+        shortlist = candidates[np.lexsort((depot_minutes, -match))[:INSERTION_CANDIDATES]]
+
+        best = None
+        for c in shortlist:
+            position, added_minutes = self._cheapest_insertion(c, location)
+            key = (-(1.0 if skill in self.crews.skills[c] else 0.5), added_minutes)
+            if best is None or key < best[0]:
+                best = (key, c, position)
+        _, c, position = best
+        before.setdefault(c, list(self.routes[c]))
+        self.routes[c].insert(position, job_id)
+        self.job_crew[job_id] = c
+        self.used_minutes[c] += cost
+        return True
+
+    def _home_depots(self, location, size_needed):
+        """Positions of the nearest depots with a crew big enough for the job, the same rule partition_by_depot uses"""
+        minutes, _ = location_index.legs_from(location, self.depot_ids)
+        # No depot big enough means every depot counts, the job just won't fit anywhere
+        able = self.depot_largest >= size_needed
+        minutes = np.where(able | ~able.any(), minutes, np.inf)
+        return np.flatnonzero(minutes <= minutes.min() + 1e-9)
+
+    def _cheapest_insertion(self, c, location):
+        """(position in the crew's route, extra drive minutes) for the cheapest place to add a stop"""
+        stops = [location_index.location_id(self.jobs[job_id].get("address", "")) for job_id in self.routes[c]]
+        index, minutes, _ = location_index.travel_matrices([self.depots[c], location] + stops)
+        path = np.array([index[self.depots[c]]] + [index[stop] for stop in stops], dtype=np.intp)
+        new = index[location]
+        # Inserting after path[p] adds the legs path[p] -> new -> path[p + 1] and drops path[p] -> path[p + 1]
+        # after the last stop there is nothing to drop, routes are open
+        added = minutes[path, new].copy()
+        added[:-1] += minutes[new, path[1:]] - minutes[path[:-1], path[1:]]
+        p = int(np.argmin(added))
+        return p, float(added[p])
+
+    def _fill_from_unassigned(self, freed, before, unassigned_before):
+        """Give crews that freed up time the waiting jobs that now fit, highest priority and longest first"""
+        room = max(self.available_minutes[c] - self.used_minutes[c] for c in freed)
+        failed = 0
+        for rank, waiting in self.waiting.items():
+            # Only jobs up to room minutes can fit, bisect skips straight past the longer ones
+            i = bisect.bisect_right(waiting, (room, LAST_ID)) - 1
+            while i >= 0 and failed < MAX_FAILED_REFILLS:
+                job_id = waiting[i][1]
+                if self._place(job_id, before):
+                    unassigned_before.setdefault(job_id, True)
+                    del self.unassigned[job_id]
+                    del waiting[i]
+                    room = max(self.available_minutes[c] - self.used_minutes[c] for c in freed)
+                    i = min(i, bisect.bisect_right(waiting, (room, LAST_ID))) - 1
+                else:
+                    failed += 1
+                    i -= 1
+
+    def _repair_route(self, c, before, unassigned_before):
+        """Improve a changed route with 2-opt and Or-opt from its current order, no rebuild from scratch,
+        then take stops off until the day fits the crew's hours with the real drive time"""
+        if not self.online[c] or not self.routes[c]:
+            self.route_stats[c] = (0, 0.0, 0.0)
+            return
+        stops = [location_index.location_id(self.jobs[job_id].get("address", "")) for job_id in self.routes[c]]
+        index, minutes, miles = location_index.travel_matrices([self.depots[c]] + stops)
+        start = index[self.depots[c]]
+        positions = [index[stop] for stop in stops]
+        # The order after inserting and removing is what the crew would drive without this repair
+        baseline_miles = round(path_cost(miles, [start] + positions), 1)
+
+        local = [start] + positions
+        local_minutes = minutes[np.ix_(local, local)]
+        order = RouteOptimizer(time_budget_ms=settings.route_time_budget_ms).improve(local_minutes, 0, range(1, len(local)))
+        # Jobs were placed with the flat travel allowance, same as the scheduler's assignment. The scheduler's own check
+        # decides which stops come off when the real drive doesn't fit, they go back to the waiting list
+        route = list(self.routes[c])
+        kept = self.optimizer._fit_to_hours(self._route_table(route), self.available_minutes[c], range(len(route)), order, local_minutes)
+        kept_positions = set(kept)
+        for position in order:
+            if position not in kept_positions:
+                self._take_job(route[position - 1], before, unassigned_before)
+                self._add_unassigned(route[position - 1])
+        self.routes[c] = [route[position - 1] for position in kept]
+        tour = [start] + [positions[position - 1] for position in kept]
+        self.route_stats[c] = (int(round(path_cost(minutes, tour))), round(path_cost(miles, tour), 1), baseline_miles)
+
+    def _route_table(self, job_ids):
+        """A JobTable of some of the session's jobs with their stored predictions"""
+        table = JobTable([self.jobs[job_id] for job_id in job_ids])
+        predicted, confidence, p10, p90, planned = zip(*(self.predictions[job_id] for job_id in job_ids)) if job_ids else ((), (), (), (), ())
+        table.set_predictions(predicted, confidence, (p10, p90), planned)
+        return table
+
+    def _serialize_route(self, c):
+        job_ids = self.routes[c]
+        table = self._route_table(job_ids)
+        plan = RoutePlan(0, range(len(job_ids)))
+        plan.drive_minutes, plan.miles, plan.baseline_miles = self.route_stats[c]
+        return self.optimizer._serialize_routes(table, CrewTable([self.crews.records[c]]), [plan])[0]
+
+    def _diff(self, before, unassigned_before, updated_ids):
+        changed_routes = []
+        for c in sorted(before):
+            old, new = before[c], self.routes[c]
+            old_ids, new_ids = set(old), set(new)
+            # The order of the jobs that stayed, to tell a reorder from a pure add or remove
+            kept_old = [job_id for job_id in old if job_id in new_ids]
+            kept_new = [job_id for job_id in new if job_id in old_ids]
+            changed_routes.append({
+                "crew_id": self.crews.ids[c],
+                "online": bool(self.online[c]),
+                "added_job_ids": [job_id for job_id in new if job_id not in old_ids],
+                "removed_job_ids": [job_id for job_id in old if job_id not in new_ids],
+                "updated_job_ids": [job_id for job_id in kept_new if job_id in updated_ids],
+                "reordered": kept_old != kept_new,
+                "route": self._serialize_route(c) if self.online[c] else None
+            })
+        return {
+            "session_id": self.session_id,
+            "version": self.version,
+            "changed_routes": changed_routes,
+            "newly_unassigned_job_ids": [job_id for job_id, was in unassigned_before.items() if not was and job_id in self.unassigned],
+            "newly_assigned_job_ids": [job_id for job_id, was in unassigned_before.items() if was and job_id in self.job_crew],
+            "unassigned_count": len(self.unassigned)
+        }
+
+    def snapshot(self):
+        """The whole current schedule"""
+        with self._lock:
+            return {
+                "session_id": self.session_id,
+                "version": self.version,
+                "routes": [self._serialize_route(c) for c in range(len(self.crews)) if self.online[c]],
+                "unassigned_job_ids": list(self.unassigned),
+                "offline_crew_ids": [self.crews.ids[c] for c in np.flatnonzero(~self.online)]
+            }
+
+
+# Keeps sessions in this process, least recently used ones are dropped once there are more than max_sessions
+class SessionStore:
+    def __init__(self, max_sessions=100):
+        self.max_sessions = max_sessions
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def create(self, optimizer, optimized, risk_percentile=None, partition_by_depot=False, rebalance=True):
+        """Open a session on a day optimizer._optimize already solved (its return value) with these options,
+        returns (session, optimize response)"""
+        response, job_table, crew_table, plans = optimized
+        session = ScheduleSession(optimizer, job_table, crew_table, plans, risk_percentile, partition_by_depot, rebalance)
+        with self._lock:
+            self._sessions[session.session_id] = session
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+        return session, response
+
+    def get(self, session_id):
+        """The session, or None if it doesn't exist or was evicted"""
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is not None:
+                self._sessions.move_to_end(session_id)
+            return session
+
+
+# Global instance
+schedule_sessions = SessionStore()
@@ -0,0 +1,290 @@
+import math
+import random
+import time
+from bisect import bisect_right
+import numpy as np
+from .assignment import AssignmentEngine, TRAVEL_MINUTES_PER_JOB
+from ..config import settings
+
+# The strategies optimize_schedule accepts
+STRATEGIES = ("greedy", "local_search", "exact")
+
+# How much a job of each priority is worth per minute of work, so high priority work is preferred when time is short
+PRIORITY_WEIGHTS = {"high": 1.5, "medium": 1.0, "low": 0.75}
+
+
+# Solves the capacitated crew assignment globally instead of crew by crew
+# Every job j given to crew c is worth duration * skill match * priority weight, the goal is the most total value
+# A crew's jobs plus travel must fit in its available hours and the crew must be big enough for each job
+# Both non greedy strategies start from the greedy answer and only ever keep something better, so stopping early is safe
+class AssignmentSolver:
+    def __init__(self, jobs, crews, travel_minutes=TRAVEL_MINUTES_PER_JOB, seed=42):
+        self.engine = AssignmentEngine(jobs, crews, travel_minutes)
+        jobs, crews = self.engine.jobs, self.engine.crews
+        self.num_jobs = len(jobs)
+        self.num_crews = len(crews)
+        self.costs = (self.engine.durations + travel_minutes).astype(float)
+        self.capacity = crews.available_minutes
+        self.weights = np.array([PRIORITY_WEIGHTS.get(priority, 1.0) for priority in jobs.priorities], dtype=float)
+        self.random = random.Random(seed)
+        # What job j is worth to a crew with the right skill, a crew without it gets match (0.5) times that
+        self.base_value = self.engine.durations * self.weights
+        # No crews x jobs matrix anywhere: a crew can do a job when it is big enough, and what the job is worth to it
+        # only depends on the crew's skill match. So jobs are grouped by (skill, crew size needed), the same keys the
+        # engine buckets by, and each group keeps the crews big enough for it, best skill match first.
+        # Memory grows with groups x crews, a handful of groups however many jobs there are
+        self._candidates = None
+        self._job_group = None
+        self._group_best_match = None
+
+    def _build_candidates(self):
+        if self._candidates is not None:
+            return
+        engine = self.engine
+        if self.num_jobs:
+            group_keys, job_group = np.unique(np.stack([engine.job_skill, engine.sizes]), axis=1, return_inverse=True)
+        else:
+            group_keys, job_group = np.zeros((2, 0), dtype=np.int64), np.zeros(0, dtype=np.intp)
+        # Some numpy versions hand the inverse back with an extra axis
+        self._job_group = np.asarray(job_group).reshape(-1)
+        candidates, best_match = [], []
+        for skill, size_needed in group_keys.T.tolist():
+            crews = np.flatnonzero(engine.crews.sizes >= size_needed)
+            # Stable, so crews with the same match stay in crew order
+            crews = crews[np.argsort(-engine.match[crews, skill], kind="stable")]
+            candidates.append(crews.tolist())
+            best_match.append(float(engine.match[crews[0], skill]) if crews.size else 0.0)
+        self._candidates = candidates
+        self._group_best_match = np.array(best_match)
+
+    def best_job_values(self):
+        """What each job is worth to the best crew that can do it, 0 when no crew is big enough"""
+        self._build_candidates()
+        if not self.num_jobs:
+            return np.zeros(0)
+        return self.base_value * self._group_best_match[self._job_group]
+
+    def objective(self, assignments):
+        """Total value of a list of job indices per crew"""
+        total = 0.0
+        for c, crew_jobs in enumerate(assignments):
+            crew_jobs = np.asarray(crew_jobs, dtype=np.intp)
+            match = self.engine.match[c, self.engine.job_skill[crew_jobs]]
+            total += float((self.engine.durations[crew_jobs] * match * self.weights[crew_jobs]).sum())
+        return total
+
+    def solve(self, strategy="greedy", time_budget_ms=500):
+        """Return (assignments, report) for the strategy"""
+        if strategy not in STRATEGIES:
+            raise ValueError(f"Unknown strategy: {strategy}")
+        started = time.perf_counter()
+        deadline = started + time_budget_ms / 1000
+
+        greedy = self.engine.assign()
+        greedy_value = self.objective(greedy)
+        owner = self._owner_from(greedy)
+        optimal = False
+        note = None
+
+        # The searches touch every job many times over, above these sizes the budget is gone before they
+        # improve anything, the greedy answer (or for exact, the annealing one) is what the caller gets
+        if strategy != "greedy" and self.num_jobs > settings.solver_max_search_jobs:
+            note = f"{self.num_jobs} jobs is more than SOLVER_MAX_SEARCH_JOBS ({settings.solver_max_search_jobs}), used the greedy assignment"
+        elif strategy == "local_search":
+            owner = self._simulated_annealing(owner, deadline)
+        elif strategy == "exact" and self.num_jobs > settings.solver_max_exact_jobs:
+            note = f"{self.num_jobs} jobs is more than SOLVER_MAX_EXACT_JOBS ({settings.solver_max_exact_jobs}), skipped branch and bound and used local_search"
+            owner = self._simulated_annealing(owner, deadline)
+        elif strategy == "exact":
+            # A quick annealing pass gives branch and bound a strong incumbent to prune against
+            owner = self._simulated_annealing(owner, started + (deadline - started) / 4)
+            owner, optimal = self._branch_and_bound(owner, deadline)
+
+        assignments = self._assignments_from(owner)
+        value = self.objective(assignments)
+        report = {
+            "strategy": strategy,
+            "objective": round(value, 1),
+            "greedy_objective": round(greedy_value, 1),
+            "improvement_pct": round((value - greedy_value) / greedy_value * 100, 1) if greedy_value else 0.0,
+            "optimal": optimal,
+            "solve_time_ms": round((time.perf_counter() - started) * 1000, 1),
+            "time_budget_ms": time_budget_ms
+        }
+        if note is not None:
+            report["note"] = note
+        return assignments, report
+
+    def _owner_from(self, assignments):
+        owner = np.full(self.num_jobs, -1, dtype=np.int64)
+        for c, crew_jobs in enumerate(assignments):
+            owner[crew_jobs] = c
+        return owner
+
+    def _assignments_from(self, owner):
+        assignments = [[] for _ in range(self.num_crews)]
+        for j, c in enumerate(owner.tolist()):
+            if c >= 0:
+                assignments[c].append(j)
+        return assignments
+
+    def _simulated_annealing(self, owner, deadline, max_iterations=200000):
+        """Random moves and swaps, sometimes accepting worse ones early on to escape local optima"""
+        if self.num_jobs == 0 or self.num_crews == 0:
+            return owner
+        owner = owner.copy()
+        load = np.zeros(self.num_crews)
+        np.add.at(load, owner[owner >= 0], self.costs[owner >= 0])
+        load = load.tolist()
+        owner_list = owner.tolist()
+        costs = self.costs.tolist()
+        capacity = self.capacity.tolist()
+        self._build_candidates()
+        candidates = self._candidates
+        job_group = self._job_group.tolist()
+        base_value = self.base_value.tolist()
+        job_skill = self.engine.job_skill.tolist()
+        size_needed = self.engine.sizes.tolist()
+        crew_sizes = self.engine.crews.sizes.tolist()
+        match = self.engine.match.tolist()
+
+        def job_value(c, j):
+            return base_value[j] * match[c][job_skill[j]] if c >= 0 else 0.0
+
+        current = sum(job_value(c, j) for j, c in enumerate(owner_list))
+        best, best_owner = current, list(owner_list)
+        # Start warm enough to accept losing a slice of a typical job's value, then cool down
+        best_values = self.best_job_values()
+        positive = best_values[best_values > 0]
+        start_temperature = max(1.0, 0.1 * float(positive.mean())) if positive.size else 1.0
+        rng = self.random
+        started = time.perf_counter()
+        total = max(deadline - started, 1e-6)
+
+        for iteration in range(max_iterations):
+            if iteration % 256 == 0:
+                now = time.perf_counter()
+                if now >= deadline:
+                    break
+                # Cool by whichever runs out first, the time budget or the iteration cap
+                progress = max((now - started) / total, iteration / max_iterations)
+                temperature = start_temperature * (0.001 ** progress)
+
+            j = rng.randrange(self.num_jobs)
+            a = owner_list[j]
+            if rng.random() < 0.5:
+                # Move job j to another crew big enough for it, or take it off the schedule
+                crews = candidates[job_group[j]]
+                pick = rng.randrange(len(crews) + 1)
+                b = crews[pick] if pick < len(crews) else -1
+                if b == a or (b >= 0 and load[b] + costs[j] > capacity[b]):
+                    continue
+                delta = job_value(b, j) - job_value(a, j)
+                if delta >= 0 or rng.random() < math.exp(delta / temperature):
+                    if a >= 0:
+                        load[a] -= costs[j]
+                    if b >= 0:
+                        load[b] += costs[j]
+                    owner_list[j] = b
+                    current += delta
+            else:
+                # Swap job j with a job k from a different crew
+                k = rng.randrange(self.num_jobs)
+                b = owner_list[k]
+                if a == b:
+                    continue
+                if a >= 0 and (crew_sizes[a] < size_needed[k] or load[a] - costs[j] + costs[k] > capacity[a]):
+                    continue
+                if b >= 0 and (crew_sizes[b] < size_needed[j] or load[b] - costs[k] + costs[j] > capacity[b]):
+                    continue
+                delta = job_value(a, k) + job_value(b, j) - job_value(a, j) - job_value(b, k)
+                if delta >= 0 or rng.random() < math.exp(delta / temperature):
+                    if a >= 0:
+                        load[a] += costs[k] - costs[j]
+                    if b >= 0:
+                        load[b] += costs[j] - costs[k]
+                    owner_list[j], owner_list[k] = b, a
+                    current += delta
+            if current > best + 1e-9:
+                best, best_owner = current, list(owner_list)
+
+        return np.array(best_owner, dtype=np.int64)
+
+    def _branch_and_bound(self, incumbent, deadline):
+        """Depth first search over job to crew choices, returns (owner, True if proven optimal)"""
+        best_owner = incumbent.copy()
+        best_value = self.objective(self._assignments_from(incumbent))
+        if self.num_jobs == 0 or self.num_crews == 0:
+            return best_owner, True
+
+        # Jobs with the most value per minute first, that order makes the fractional bound below valid and tight
+        best_job_value = self.best_job_values()
+        density = best_job_value / self.costs
+        order = np.argsort(-density, kind="stable").tolist()
+        prefix_cost = np.concatenate([[0.0], np.cumsum(self.costs[order])]).tolist()
+        prefix_value = np.concatenate([[0.0], np.cumsum(best_job_value[order])]).tolist()
+        density_sorted = density[order].tolist()
+        n = len(order)
+
+        def upper_bound(k, remaining_capacity):
+            # Fractional knapsack over the pooled remaining capacity, each job at its best crew's value
+            m = bisect_right(prefix_cost, prefix_cost[k] + remaining_capacity) - 1
+            bound = prefix_value[m] - prefix_value[k]
+            if m < n:
+                bound += (remaining_capacity - (prefix_cost[m] - prefix_cost[k])) * density_sorted[m]
+            return bound
+
+        costs = self.costs.tolist()
+        candidates = self._candidates
+        job_group = self._job_group.tolist()
+        base_value = self.base_value.tolist()
+        job_skill = self.engine.job_skill.tolist()
+        match = self.engine.match.tolist()
+        remaining = self.capacity.tolist()
+        total_remaining = sum(remaining)
+        owner = [-1] * self.num_jobs
+        current = 0.0
+
+        def choices_for(j):
+            # Crews that can still take the job, most valuable first (the candidates are kept in that order),
+            # leaving the job off is always the last option
+            return [c for c in candidates[job_group[j]] if remaining[c] >= costs[j]] + [-1]
+
+        def apply(j, c, sign):
+            nonlocal current, total_remaining
+            if c >= 0:
+                remaining[c] -= sign * costs[j]
+                total_remaining -= sign * costs[j]
+                current += sign * base_value[j] * match[c][job_skill[j]]
+                owner[j] = c if sign > 0 else -1
+
+        stack = [] # Frames of [depth, choices, index of the choice applied]
+        k = 0
+        nodes = 0
+        while True:
+            nodes += 1
+            if nodes % 1024 == 0 and time.perf_counter() >= deadline:
+                return best_owner, False
+
+            if k == n or current + upper_bound(k, total_remaining) <= best_value + 1e-9:
+                if k == n and current > best_value + 1e-9:
+                    best_value, best_owner = current, np.array(owner, dtype=np.int64)
+                # Backtrack to the deepest job that still has a choice left to try
+                while stack:
+                    frame = stack[-1]
+                    depth, choices, i = frame
+                    apply(order[depth], choices[i], -1)
+                    if i + 1 < len(choices):
+                        frame[2] = i + 1
+                        apply(order[depth], choices[i + 1], 1)
+                        k = depth + 1
+                        break
+                    stack.pop()
+                else:
+                    return best_owner, True
+            else:
+                j = order[k]
+                choices = choices_for(j)
+                stack.append([k, choices, 0])
+                apply(j, choices[0], 1)
+                k += 1
@@ -0,0 +1,127 @@
+import numpy as np
+from .mock_data import MockDataService
+
+# Austin city center, synthetic addresses are scattered around it
+CENTER_LATITUDE = 30.2672
+CENTER_LONGITUDE = -97.7431
+# Rough size of a degree in miles at Austin's latitude
+MILES_PER_DEGREE_LATITUDE = 69.0
+MILES_PER_DEGREE_LONGITUDE = 59.7
+
+# How often each service shows up, most of the book is recurring mowing
+SERVICE_MIX = {"weekly_mowing": 0.6, "tree_trimming": 0.25, "large_cleanup": 0.15}
+PRIORITY_MIX = {"low": 0.2, "medium": 0.6, "high": 0.2}
+# Same complexity scores get_job_features uses
+SERVICE_COMPLEXITY = {"weekly_mowing": 1, "large_cleanup": 3, "tree_trimming": 4}
+
+STREET_NAMES = ["Oak", "Pine", "Cedar", "Maple", "Elm", "Pecan", "Willow", "Juniper", "Mesquite", "Live Oak",
+                "Magnolia", "Cypress", "Bluebonnet", "Sage", "Agave", "Hill Country", "River", "Lakeview"]
+STREET_SUFFIXES = ["Street", "Avenue", "Lane", "Drive", "Road", "Court", "Boulevard"]
+SKILL_SETS = [
+    ["mowing", "cleanup", "tree_work", "landscaping"],
+    ["mowing", "cleanup", "basic_trimming"],
+    ["mowing", "landscaping"],
+    ["mowing", "tree_work"],
+    ["cleanup", "tree_work"]
+]
+DEPOTS = ["Main Office", "North Depot", "South Station"]
+
+
+# Same interface as MockDataService but with as many jobs, crews and historical rows as you ask for
+# Everything comes from one seeded random generator so the same seed always gives the same data
+class SyntheticDataService(MockDataService):
+    def __init__(self, num_jobs=100, num_crews=10, num_historical=500, seed=42, radius_miles=15):
+        super().__init__()
+        self.seed = seed
+        self.rng = np.random.default_rng(seed)
+        self.radius_miles = radius_miles
+        self.locations = {} # address -> (latitude, longitude) for every generated address and depot
+
+        self.sample_crews = self._generate_crews(num_crews)
+        self.sample_jobs = self._generate_jobs(num_jobs)
+        self.historical_job_data = self._generate_history(num_historical)
+
+    def get_locations(self):
+        """Coordinates of every generated address, for LocationIndex.add_location"""
+        return self.locations
+
+    def _random_points(self, n):
+        # Uniform over a disc around the center, sqrt keeps the density even
+        distance = self.radius_miles * np.sqrt(self.rng.random(n))
+        angle = self.rng.random(n) * 2 * np.pi
+        latitudes = CENTER_LATITUDE + distance * np.sin(angle) / MILES_PER_DEGREE_LATITUDE
+        longitudes = CENTER_LONGITUDE + distance * np.cos(angle) / MILES_PER_DEGREE_LONGITUDE
+        return np.round(latitudes, 5), np.round(longitudes, 5)
+
+    def _generate_crews(self, n):
+        # Extra depots once there are more crews than the three real ones can hold
+        num_depots = max(len(DEPOTS), n // 10)
+        depots = DEPOTS + [f"Depot {i}" for i in range(len(DEPOTS) + 1, num_depots + 1)]
+        latitudes, longitudes = self._random_points(len(depots))
+        for depot, latitude, longitude in zip(depots, latitudes, longitudes):
+            self.locations[depot] = (float(latitude), float(longitude))
+
+        sizes = self.rng.choice([2, 3, 4], size=n, p=[0.5, 0.35, 0.15])
+        hours = self.rng.choice([6, 8, 10], size=n, p=[0.2, 0.65, 0.15])
+        skills = self.rng.integers(0, len(SKILL_SETS), size=n)
+        depot_index = self.rng.integers(0, len(depots), size=n)
+        return [
+            {
+                "id": f"crew_{i}",
+                "name": f"Crew {i}",
+                "size": int(sizes[i]),
+                "skills": list(SKILL_SETS[skills[i]]),
+                "available_hours": int(hours[i]),
+                "start_location": depots[depot_index[i]]
+            }
+            for i in range(n)
+        ]
+
+    def _generate_jobs(self, n):
+        services = self.rng.choice(list(SERVICE_MIX), size=n, p=list(SERVICE_MIX.values()))
+        priorities = self.rng.choice(list(PRIORITY_MIX), size=n, p=list(PRIORITY_MIX.values()))
+        sqft = np.round(self.rng.lognormal(mean=7.3, sigma=0.45, size=n), -1).astype(int)
+        trees = self.rng.poisson(2, size=n)
+        # Tree trimming jobs have more trees by definition
+        trees = np.where(services == "tree_trimming", trees + self.rng.integers(3, 10, size=n), trees)
+        house_numbers = self.rng.integers(100, 9999, size=n)
+        streets = self.rng.integers(0, len(STREET_NAMES), size=n)
+        suffixes = self.rng.integers(0, len(STREET_SUFFIXES), size=n)
+        latitudes, longitudes = self._random_points(n)
+
+        complexity = np.array([SERVICE_COMPLEXITY[service] for service in services])
+        crew_size = np.where(services == "large_cleanup", 3, np.where(sqft < 1000, 1, 2))
+        # A human estimate is the "true" duration plus a fair bit of guessing error
+        estimate = self._true_duration(sqft, trees, complexity, crew_size) * self.rng.normal(1.0, 0.15, size=n)
+        estimate = np.clip(np.round(estimate / 15) * 15, 30, 480).astype(int)
+
+        jobs = []
+        for i in range(n):
+            address = f"{house_numbers[i]} {STREET_NAMES[streets[i]]} {STREET_SUFFIXES[suffixes[i]]}, Austin TX"
+            self.locations[address] = (float(latitudes[i]), float(longitudes[i]))
+            jobs.append({
+                "id": f"job_{i + 1}",
+                "customer": f"Customer {i + 1}",
+                "address": address,
+                "service_type": str(services[i]),
+                "estimated_duration": int(estimate[i]),
+                "priority": str(priorities[i]),
+                "crew_size_needed": int(crew_size[i]),
+                "estimated_sqft": int(sqft[i]),
+                "tree_count": int(trees[i])
+            })
+        return jobs
+
+    def _generate_history(self, n):
+        sqft = np.round(self.rng.lognormal(mean=7.3, sigma=0.45, size=n), -1)
+        trees = self.rng.poisson(3, size=n)
+        complexity = self.rng.choice([1, 2, 3, 4], size=n, p=[0.45, 0.15, 0.2, 0.2])
+        crew_size = self.rng.choice([1, 2, 3], size=n, p=[0.1, 0.6, 0.3])
+        duration = self._true_duration(sqft, trees, complexity, crew_size) * self.rng.normal(1.0, 0.08, size=n)
+        duration = np.clip(np.round(duration), 30, 600).astype(int)
+        # Same ([features], duration) layout as the hand written history
+        return [([int(sqft[i]), int(trees[i]), int(complexity[i]), int(crew_size[i])], int(duration[i])) for i in range(n)]
+
+    def _true_duration(self, sqft, trees, complexity, crew_size):
+        # Loosely fitted to the hand written history, bigger yards, more trees and harder work take longer, extra hands help
+        return (10 + sqft * 0.03 + trees * 10 + complexity * 22) * (1.25 - 0.1 * crew_size)
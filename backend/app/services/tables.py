@@ -0,0 +1,111 @@
+import numpy as np
+from .mock_data import get_job_feature_matrix
+
+
+# Column oriented view of a job list, the scheduler works on these arrays instead of copying job dicts around
+# records keeps the original dicts untouched, they are only copied when a response is serialized
+class JobTable:
+    __slots__ = (
+        "records", "ids", "addresses", "service_types", "priorities",
+        "estimated_duration", "crew_size_needed", "is_high", "features",
+        "predicted_duration", "confidence", "duration_p10", "duration_p90", "planning_duration"
+    )
+
+    def __init__(self, records):
+        self.records = list(records)
+        self.ids = [job["id"] for job in self.records]
+        self.addresses = [job.get("address", "") for job in self.records]
+        self.service_types = [job["service_type"] for job in self.records]
+        self.priorities = [job.get("priority", "medium") for job in self.records]
+        self.estimated_duration = np.array([job["estimated_duration"] for job in self.records], dtype=np.int64)
+        self.crew_size_needed = np.array([job["crew_size_needed"] for job in self.records], dtype=np.int64)
+        self.is_high = np.array([priority == "high" for priority in self.priorities], dtype=bool)
+        # The model's input features, one row per job
+        self.features = get_job_feature_matrix(self.records)
+        # Until predictions are set the scheduler falls back to the human estimate, like it always has
+        self.predicted_duration = np.array([job.get("ml_predicted_duration", job["estimated_duration"]) for job in self.records], dtype=np.int64)
+        self.confidence = np.full(len(self.records), np.nan)
+        # The 10th and 90th percentile of the forest's predictions, NaN when there are none
+        self.duration_p10 = np.full(len(self.records), np.nan)
+        self.duration_p90 = np.full(len(self.records), np.nan)
+        # What the assigner packs crews with, the prediction unless a risk aware plan asked for a higher percentile
+        self.planning_duration = self.predicted_duration
+
+    def __len__(self):
+        return len(self.records)
+
+    def set_predictions(self, predicted_duration, confidence, interval=None, planning_duration=None):
+        """Store the model's predicted durations and confidence for every job,
+        optionally the (p10, p90) interval and the durations to plan capacity with"""
+        self.predicted_duration = np.asarray(predicted_duration, dtype=np.int64)
+        self.confidence = np.asarray(confidence, dtype=float)
+        if interval is not None:
+            self.duration_p10 = np.asarray(interval[0], dtype=float)
+            self.duration_p90 = np.asarray(interval[1], dtype=float)
+        self.planning_duration = self.predicted_duration if planning_duration is None else np.asarray(planning_duration, dtype=np.int64)
+
+    def take(self, indices):
+        """A JobTable of some of the jobs, keeping their predictions"""
+        table = JobTable([self.records[j] for j in indices])
+        table.set_predictions(
+            self.predicted_duration[indices], self.confidence[indices],
+            (self.duration_p10[indices], self.duration_p90[indices]), self.planning_duration[indices]
+        )
+        return table
+
+    @property
+    def has_predictions(self):
+        return len(self.records) > 0 and not np.isnan(self.confidence).any()
+
+    def to_dict(self, i):
+        """The job as it appears in API responses, the original fields plus the ML fields"""
+        job = dict(self.records[i])
+        if not np.isnan(self.confidence[i]):
+            job['ml_predicted_duration'] = int(self.predicted_duration[i])
+            # Formatting only happens here, the scheduler itself only ever sees the numbers
+            job['prediction_confidence'] = f"{self.confidence[i]:.0f}%"
+            job['original_estimate'] = int(self.estimated_duration[i])
+        if not np.isnan(self.duration_p10[i]):
+            job['duration_p10'] = int(round(self.duration_p10[i]))
+            job['duration_p90'] = int(round(self.duration_p90[i]))
+        return job
+
+
+# Column oriented view of a crew list
+class CrewTable:
+    __slots__ = ("records", "ids", "names", "sizes", "available_minutes", "skills", "start_locations")
+
+    def __init__(self, records):
+        self.records = list(records)
+        self.ids = [crew["id"] for crew in self.records]
+        self.names = [crew.get("name", crew["id"]) for crew in self.records]
+        self.sizes = np.array([crew["size"] for crew in self.records], dtype=np.int64)
+        self.available_minutes = np.array([crew["available_hours"] * 60 for crew in self.records], dtype=float)
+        self.skills = [frozenset(crew.get("skills", ())) for crew in self.records]
+        self.start_locations = [crew.get("start_location", "") for crew in self.records]
+
+    def __len__(self):
+        return len(self.records)
+
+
+# One crew's planned day, job indices point into the JobTable
+class RoutePlan:
+    __slots__ = ("crew", "jobs", "drive_minutes", "miles", "baseline_miles", "dropped")
+
+    def __init__(self, crew, jobs):
+        self.crew = crew
+        self.jobs = list(jobs)
+        self.drive_minutes = None # Filled in by the routing stage
+        self.miles = None
+        self.baseline_miles = None
+        self.dropped = [] # Jobs the routing stage took off because the real drive didn't fit the crew's hours
+
+
+def as_job_table(jobs):
+    """Accept either a JobTable or a list of job dicts"""
+    return jobs if isinstance(jobs, JobTable) else JobTable(jobs)
+
+
+def as_crew_table(crews):
+    """Accept either a CrewTable or a list of crew dicts"""
+    return crews if isinstance(crews, CrewTable) else CrewTable(crews)
@@ -0,0 +1,123 @@
+import asyncio
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from ..config import settings
+
+
+# Raised when every worker is busy and the wait queue is full, the API turns this into a 503
+class PoolSaturatedError(Exception):
+    pass
+
+
+# Runs in each new worker process so the model is loaded before the first job arrives there
+def _warm_up_worker():
+    from .ml_model import duration_predictor
+    duration_predictor.warm_up()
+
+
+# What a worker process actually runs, the job's function after making sure the worker predicts with the same model
+# the API process is serving. Without this a worker kept the model it loaded at start through every retrain
+def _run_with_model(model_version, func, *args):
+    from .ml_model import duration_predictor
+    duration_predictor.load_version(model_version)
+    return func(*args)
+
+
+# Runs CPU heavy work off the event loop with a hard cap on how much work can pile up
+# max_workers jobs run at once, max_queue_depth more can wait, anything beyond that is rejected right away
+class OptimizationPool:
+    def __init__(self, max_workers=None, max_queue_depth=None, executor_type=None):
+        self.max_workers = max_workers or settings.optimizer_max_workers
+        self.max_queue_depth = settings.optimizer_max_queue if max_queue_depth is None else max_queue_depth
+        self.executor_type = executor_type or settings.optimizer_executor
+        if self.executor_type not in ("thread", "process"):
+            raise ValueError(f"Unknown executor type: {self.executor_type}")
+        self._executor = None # Created on first use so importing this module stays cheap
+        # Threads for work that has to stay in this process even when the optimizer runs in worker processes
+        self._local_executor = None
+        # Jobs running or waiting, optimization jobs take and give back places from their own threads
+        self.in_flight = 0
+        self._lock = threading.Lock()
+
+    @property
+    def executor(self):
+        if self._executor is None:
+            if self.executor_type == "process":
+                # Spawned rather than forked, a fork of this multithreaded server can inherit a lock some thread holds
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.max_workers, initializer=_warm_up_worker, mp_context=multiprocessing.get_context("spawn")
+                )
+            else:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="optimizer")
+        return self._executor
+
+    @property
+    def local_executor(self):
+        if self.executor_type == "thread":
+            return self.executor
+        if self._local_executor is None:
+            self._local_executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="optimizer-local")
+        return self._local_executor
+
+    def start(self):
+        """Create the executor up front, the API calls this at startup so no request pays for it"""
+        self.executor
+        return self
+
+    def reserve(self):
+        """Take a place among the running and queued jobs, raises PoolSaturatedError when there is none left"""
+        with self._lock:
+            if self.in_flight >= self.max_workers + self.max_queue_depth:
+                raise PoolSaturatedError(f"{self.in_flight} optimizations already running or queued")
+            self.in_flight += 1
+
+    def release(self):
+        """Give back a place taken with reserve()"""
+        with self._lock:
+            self.in_flight -= 1
+
+    def _in_worker(self, func, args):
+        # In process mode the job runs through _run_with_model, so the worker predicts with the model this process serves
+        if self.executor_type == "process":
+            from .ml_model import duration_predictor
+            return _run_with_model, (duration_predictor.model_version, func, *args)
+        return func, args
+
+    async def run(self, func, *args, in_process=False, reserved=False):
+        """Run func(*args) on the pool, raises PoolSaturatedError when the queue is full
+        in_process=True runs it on a thread of this process even in process mode, for work on state that lives here
+        (schedule sessions), it still counts against the same limit. reserved=True means the caller already holds
+        a place from reserve(), a horizon plan keeps one for all of its days"""
+        if not reserved:
+            self.reserve()
+        try:
+            loop = asyncio.get_running_loop()
+            if in_process:
+                return await loop.run_in_executor(self.local_executor, func, *args)
+            func, args = self._in_worker(func, args)
+            return await loop.run_in_executor(self.executor, func, *args)
+        finally:
+            if not reserved:
+                self.release()
+
+    def run_in_worker(self, func, *args):
+        """Blocking run of func(*args) for a thread of local_executor that already holds a place from reserve(),
+        optimization jobs wait on their optimization this way. In thread mode that thread is a pool worker already"""
+        if self.executor_type == "thread":
+            return func(*args)
+        func, args = self._in_worker(func, args)
+        return self.executor.submit(func, *args).result()
+
+    def shutdown(self):
+        """Stop the workers, waits for running jobs to finish"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+        if self._local_executor is not None:
+            self._local_executor.shutdown(wait=True)
+            self._local_executor = None
+
+
+# Global instance
+optimization_pool = OptimizationPool()
@@ -0,0 +1,176 @@
+"""Benchmark the scheduler and duration predictor on synthetic workloads.
+
+Run from the backend folder:
+
+    python -m benchmarks.bench_scheduler --sizes 10,1000,10000 --repeat 5
+    python -m benchmarks.bench_scheduler --compare benchmarks/results/<older>.json
+
+Results are written as JSON (one file per commit by default) so runs on different commits can be compared.
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+import numpy as np
+import sklearn
+
+from app.services.analytics import ScheduleAnalytics
+from app.services.assignment import AssignmentEngine
+from app.services.locations import location_index
+from app.services.ml_model import duration_predictor
+from app.services.mock_data import get_job_features
+from app.services.scheduler import ScheduleOptimizer
+from app.services.synthetic_data import SyntheticDataService
+from app.services.tables import CrewTable, JobTable, RoutePlan
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+
+
+def git_commit():
+    """Short hash of the current commit, or None outside a git checkout"""
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def measure(func, repeat, setup=None):
+    """Return (latencies in ms over repeat runs, peak traced memory in MB), setup() runs untimed before every run"""
+    # One untimed run with tracemalloc for memory, tracing slows everything down so it isn't part of the timings
+    if setup:
+        setup()
+    tracemalloc.start()
+    func()
+    peak_mb = tracemalloc.get_traced_memory()[1] / 2**20
+    tracemalloc.stop()
+
+    latencies = []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        started = time.perf_counter()
+        func()
+        latencies.append((time.perf_counter() - started) * 1000)
+    return latencies, peak_mb
+
+
+def summarize(latencies, peak_mb, num_jobs):
+    latencies = np.array(latencies)
+    median = float(np.percentile(latencies, 50))
+    return {
+        "runs": len(latencies),
+        "p50_ms": round(median, 3),
+        "p95_ms": round(float(np.percentile(latencies, 95)), 3),
+        "p99_ms": round(float(np.percentile(latencies, 99)), 3),
+        "mean_ms": round(float(latencies.mean()), 3),
+        "throughput_jobs_per_s": round(num_jobs / (median / 1000), 1) if median > 0 else None,
+        "peak_memory_mb": round(peak_mb, 2)
+    }
+
+
+def bench_size(num_jobs, num_crews, repeat, strategy, seed):
+    data = SyntheticDataService(num_jobs=num_jobs, num_crews=num_crews, seed=seed)
+    for address, (latitude, longitude) in data.get_locations().items():
+        location_index.add_location(address, latitude, longitude)
+    jobs, crews = data.get_sample_jobs(), data.get_sample_crews()
+    optimizer = ScheduleOptimizer()
+
+    job_table, crew_table = JobTable(jobs), CrewTable(crews)
+    job_table.set_predictions(**{
+        key: value for key, value in duration_predictor.predict_durations(job_table.features).items()
+        if key in ("predicted_duration", "confidence")
+    })
+    assignments = AssignmentEngine(job_table, crew_table).assign()
+    routed_plans = optimizer._optimize_routes(job_table, crew_table, [RoutePlan(c, job_indices) for c, job_indices in enumerate(assignments)])
+
+    # Stages that predict are timed cold, with the prediction cache emptied before each run, otherwise every run after
+    # the first is served from the cache and the forest is never timed. predict_durations_warm is the all hits case
+    cold = duration_predictor.prediction_cache.clear
+    predict = lambda: duration_predictor.predict_durations(job_table.features)
+    stages = {
+        "build_tables": lambda: (JobTable(jobs), CrewTable(crews)),
+        "predict_durations": (predict, cold),
+        "predict_durations_warm": (predict, predict),
+        "assign_jobs_to_crews": lambda: AssignmentEngine(job_table, crew_table).assign(),
+        "optimize_routes": lambda: optimizer._optimize_routes(
+            job_table, crew_table, [RoutePlan(c, job_indices) for c, job_indices in enumerate(assignments)]),
+        "analytics": lambda: ScheduleAnalytics(job_table, crew_table, routed_plans).efficiency_report(),
+        "optimize_schedule": (lambda: optimizer.optimize_schedule(jobs, crews, strategy=strategy), cold)
+    }
+    # The one row at a time path is far too slow to run on the big sizes
+    if num_jobs <= 1000:
+        stages["predict_duration_per_job"] = (lambda: [duration_predictor.predict_duration(get_job_features(job)) for job in jobs], cold)
+
+    results = {}
+    for name, stage in stages.items():
+        func, setup = stage if isinstance(stage, tuple) else (stage, None)
+        latencies, peak_mb = measure(func, repeat, setup)
+        results[name] = summarize(latencies, peak_mb, num_jobs)
+        print(f"  {name:<26} p50 {results[name]['p50_ms']:>10.2f} ms   p95 {results[name]['p95_ms']:>10.2f} ms   "
+              f"peak {results[name]['peak_memory_mb']:>8.2f} MB")
+    return {"num_jobs": num_jobs, "num_crews": num_crews, "stages": results}
+
+
+def compare(current, previous):
+    """Print how each stage's p50 moved against an older results file"""
+    print(f"\nCompared with {previous.get('commit') or 'previous run'}:")
+    for size, entry in current["results"].items():
+        old_entry = previous["results"].get(size)
+        if not old_entry:
+            continue
+        for stage, stats in entry["stages"].items():
+            old = old_entry["stages"].get(stage)
+            if not old or not old["p50_ms"]:
+                continue
+            change = (stats["p50_ms"] - old["p50_ms"]) / old["p50_ms"] * 100
+            print(f"  {size:>7} jobs  {stage:<26} {old['p50_ms']:>10.2f} -> {stats['p50_ms']:>10.2f} ms ({change:+.1f}%)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the scheduler and duration predictor")
+    parser.add_argument("--sizes", default="10,1000,10000,100000", help="comma separated job counts")
+    parser.add_argument("--jobs-per-crew", type=int, default=25, help="crews generated = jobs / this (at least 3)")
+    parser.add_argument("--repeat", type=int, default=5, help="runs per stage, percentiles are over these")
+    parser.add_argument("--strategy", default="greedy", choices=["greedy", "local_search", "exact"])
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="where to write the JSON results, defaults to benchmarks/results/<commit>.json")
+    parser.add_argument("--compare", help="an older results file to compare against")
+    args = parser.parse_args()
+
+    # Load or train the model up front so it isn't counted in any stage
+    duration_predictor.warm_up()
+
+    commit = git_commit()
+    report = {
+        "commit": commit,
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "sklearn": sklearn.__version__,
+        "strategy": args.strategy,
+        "repeat": args.repeat,
+        "results": {}
+    }
+    for num_jobs in [int(size) for size in args.sizes.split(",")]:
+        num_crews = max(3, num_jobs // args.jobs_per_crew)
+        print(f"{num_jobs} jobs, {num_crews} crews")
+        report["results"][str(num_jobs)] = bench_size(num_jobs, num_crews, args.repeat, args.strategy, args.seed)
+
+    output = args.output or os.path.join(RESULTS_DIR, f"{commit or datetime.now().strftime('%Y%m%d%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nWrote {output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(report, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+"""Measure how long the API takes to import and to answer its first requests.
+
+Run from the backend folder:
+
+    python -m benchmarks.bench_startup --repeat 3
+    python -m benchmarks.bench_startup --modes blocking,background,lazy --output startup.json
+
+Every run is a fresh interpreter: import time is `import app.main` in a new process, the server timings
+start the clock when uvicorn is spawned and stop it at the first good answer from /, /api/ready and
+/api/optimize-schedule (demo data). The model artifact is saved after the first run, so later runs load it.
+"""
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+
+import numpy as np
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+IMPORT_SCRIPT = (
+    "import sys, time\n"
+    "started = time.perf_counter()\n"
+    "import app.main\n"
+    "print(time.perf_counter() - started, 'sklearn' in sys.modules)\n"
+)
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def measure_import():
+    """(seconds to import app.main, whether that imported sklearn)"""
+    output = subprocess.check_output([sys.executable, "-c", IMPORT_SCRIPT], cwd=BACKEND_DIR, text=True)
+    seconds, sklearn_loaded = output.split()
+    return float(seconds), sklearn_loaded == "True"
+
+
+def request(url, body=None):
+    """Status code of a GET (or a POST with a JSON body), None while the server isn't listening yet"""
+    data = json.dumps(body).encode() if body is not None else None
+    req = urllib.request.Request(url, data=data, headers={"Content-Type": "application/json"} if data else {})
+    try:
+        with urllib.request.urlopen(req, timeout=60) as response:
+            response.read()
+            return response.status
+    except urllib.error.HTTPError as exc:
+        return exc.code
+    except (urllib.error.URLError, ConnectionError):
+        return None
+
+
+def wait_for(url, started, timeout, body=None, status=200, server=None):
+    """Seconds since started until url answers with status"""
+    deadline = started + timeout
+    while time.perf_counter() < deadline:
+        if server is not None and server.poll() is not None:
+            raise RuntimeError(f"The server exited with code {server.returncode} before answering")
+        if request(url, body) == status:
+            return time.perf_counter() - started
+        time.sleep(0.01)
+    raise TimeoutError(f"{url} did not answer {status} within {timeout}s")
+
+
+def measure_server(mode, timeout):
+    """Seconds from spawning uvicorn to the first answer of /, /api/ready and /api/optimize-schedule"""
+    port = free_port()
+    base = f"http://127.0.0.1:{port}"
+    env = {**os.environ, "STARTUP_WARM_UP": mode, "RETRAIN_ENABLED": "0"}
+    started = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=BACKEND_DIR, env=env
+    )
+    try:
+        first_response = wait_for(f"{base}/", started, timeout, server=server)
+        ready = wait_for(f"{base}/api/ready", started, timeout)
+        with urllib.request.urlopen(f"{base}/api/demo-data", timeout=60) as response:
+            demo = json.load(response)
+        optimize_started = time.perf_counter()
+        wait_for(f"{base}/api/optimize-schedule", optimize_started, timeout, body=demo)
+        first_optimize = time.perf_counter() - started
+        with urllib.request.urlopen(f"{base}/api/ready", timeout=60) as response:
+            reported = json.load(response)
+    finally:
+        server.terminate()
+        server.wait()
+    return {
+        "first_response_s": round(first_response, 3),
+        "ready_s": round(ready, 3),
+        "first_optimize_s": round(first_optimize, 3),
+        "reported": {key: reported[key] for key in ("import_seconds", "warm_up_seconds", "model_ready_seconds", "first_response_seconds")}
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure API import time and time to first response")
+    parser.add_argument("--repeat", type=int, default=3, help="fresh processes per measurement, the median is reported")
+    parser.add_argument("--modes", default="blocking,background,lazy", help="comma separated STARTUP_WARM_UP modes")
+    parser.add_argument("--timeout", type=float, default=120, help="seconds to wait for a server to answer")
+    parser.add_argument("--output", help="also write the results as JSON here")
+    args = parser.parse_args()
+
+    imports = [measure_import() for _ in range(args.repeat)]
+    report = {
+        "import_app_main_s": round(float(np.median([seconds for seconds, _ in imports])), 3),
+        "imports_sklearn": imports[0][1],
+        "modes": {}
+    }
+    print(f"import app.main   {report['import_app_main_s']:.3f} s   sklearn imported: {report['imports_sklearn']}")
+
+    for mode in args.modes.split(","):
+        runs = [measure_server(mode, args.timeout) for _ in range(args.repeat)]
+        summary = {key: round(float(np.median([run[key] for run in runs])), 3) for key in ("first_response_s", "ready_s", "first_optimize_s")}
+        summary["reported"] = runs[-1]["reported"]
+        report["modes"][mode] = summary
+        print(f"{mode:<11} first response {summary['first_response_s']:.3f} s   ready {summary['ready_s']:.3f} s   "
+              f"first optimization {summary['first_optimize_s']:.3f} s")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nWrote {args.output}")
+
+
+if __name__ == "__main__":
+    main()
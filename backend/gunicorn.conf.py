@@ -0,0 +1,27 @@
+# Production server config, run from the backend folder with:
+#     gunicorn -c gunicorn.conf.py app.main:app
+# preload_app imports the app once in the parent process, when_ready then loads the duration model there too.
+# The workers are forked after that, so they start with the model already in memory and share its pages
+# copy-on-write instead of each one loading (or training) its own copy
+import gc
+import os
+
+bind = os.getenv("BIND", "0.0.0.0:8000")
+workers = int(os.getenv("WEB_CONCURRENCY", str(min(4, os.cpu_count() or 1))))
+worker_class = "uvicorn.workers.UvicornWorker"
+preload_app = True
+# Loading the model happens before the fork, a worker only has to start its event loop
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "120"))
+
+
+def when_ready(server):
+    """Runs in the parent after the app is imported and before any worker is forked"""
+    from app.services.ml_model import duration_predictor
+    from app.services.feedback_store import feedback_store
+
+    duration_predictor.warm_up()
+    # A SQLite connection must not be shared across a fork, each worker opens its own on first use
+    feedback_store.close()
+    # Objects that exist now are never collected, so the garbage collector doesn't write to (and un-share) their pages
+    gc.freeze()
+    server.log.info("Duration model %s loaded before forking workers", duration_predictor.model_version)
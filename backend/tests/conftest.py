@@ -0,0 +1,12 @@
+import os
+import tempfile
+
+# Settings are read when app.config is imported, so the test run gets its own model, feedback and analytics files
+# before any test imports the app, and nothing retrains or spawns worker processes behind the tests' back
+_scratch = tempfile.mkdtemp(prefix="scheduler-tests-")
+os.environ.setdefault("MODEL_DIR", os.path.join(_scratch, "models"))
+os.environ.setdefault("FEEDBACK_DB", os.path.join(_scratch, "feedback.sqlite3"))
+os.environ.setdefault("ANALYTICS_DB", os.path.join(_scratch, "analytics.sqlite3"))
+os.environ.setdefault("RETRAIN_ENABLED", "0")
+os.environ.setdefault("PARTITION_WORKERS", "1")
+os.environ.setdefault("OPTIMIZER_EXECUTOR", "thread")
@@ -0,0 +1,44 @@
+import pytest
+
+from app.services.analytics import ScheduleAnalytics
+from app.services.tables import CrewTable, JobTable, RoutePlan
+
+
+def make_jobs(count):
+    return [
+        {"id": f"job_{j}", "service_type": "weekly_mowing", "estimated_duration": 60, "crew_size_needed": 1, "priority": "medium"}
+        for j in range(count)
+    ]
+
+
+@pytest.mark.parametrize("job_count", [0, 3])
+def test_report_without_crews(job_count):
+    analytics = ScheduleAnalytics(JobTable(make_jobs(job_count)), CrewTable([]), [])
+
+    report = analytics.efficiency_report()
+    assert report["efficiency_gain"] == 0 and report["miles_saved"] == 0 and report["success_probability"] == 100
+    assert analytics.totals()["jobs_unassigned"] == job_count
+    assert analytics.crew_rows() == []
+    assert isinstance(analytics.recommendations(), list)
+
+
+def test_report_for_crews_with_nothing_booked():
+    crews = [{"id": "crew_a", "name": "A", "size": 2, "skills": ["mowing"], "available_hours": 8}]
+    analytics = ScheduleAnalytics(JobTable([]), CrewTable(crews), [RoutePlan(0, [])])
+
+    assert analytics.efficiency_report()["time_saved"] == 0
+    assert analytics.crew_rows()[0]["jobs"] == 0
+
+
+@pytest.mark.parametrize("job_count", [0, 3])
+def test_optimize_schedule_without_crews(job_count):
+    from fastapi.testclient import TestClient
+    from app.main import app
+
+    with TestClient(app) as client:
+        demo = client.get("/api/demo-data").json()
+        response = client.post("/api/optimize-schedule", json={"jobs": demo["jobs"][:job_count], "crews": []})
+        assert response.status_code == 200
+        body = response.json()
+        assert body["routes"] == []
+        assert len(body["unassigned_job_ids"]) == job_count
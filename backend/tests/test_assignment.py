@@ -0,0 +1,84 @@
+import random
+
+import pytest
+
+from app.services.assignment import AssignmentEngine, MinCostTree, required_skill
+
+SERVICE_TYPES = ["weekly_mowing", "large_cleanup", "tree_trimming", "snow_removal"]
+SKILLS = ["mowing", "cleanup", "tree_work"]
+
+
+# The crew by crew loop AssignmentEngine replaced, kept here as the reference it has to match
+def rescanning_greedy(jobs, crews):
+    unassigned = list(range(len(jobs)))
+    assignments = []
+    for crew in crews:
+        crew_jobs = []
+        available_minutes = crew["available_hours"] * 60
+        used_minutes = 0
+        suitable = [
+            (j, 1.0 if required_skill(jobs[j]["service_type"]) in crew["skills"] else 0.5)
+            for j in unassigned if jobs[j]["crew_size_needed"] <= crew["size"]
+        ]
+        suitable.sort(key=lambda item: (item[1], jobs[item[0]]["priority"] == "high"), reverse=True)
+        for j, _ in suitable:
+            job_duration = jobs[j].get("ml_predicted_duration", jobs[j]["estimated_duration"])
+            if used_minutes + job_duration + 25 <= available_minutes:
+                crew_jobs.append(j)
+                used_minutes += job_duration + 25
+                unassigned.remove(j)
+        assignments.append(crew_jobs)
+    return assignments
+
+
+def random_instance(rng, num_jobs, num_crews):
+    jobs = [{
+        "id": f"job_{j}",
+        "service_type": rng.choice(SERVICE_TYPES),
+        "priority": rng.choice(["high", "medium", "low"]),
+        "crew_size_needed": rng.randint(1, 4),
+        # Few distinct durations, so ties in cost (and in rank) are common
+        "estimated_duration": rng.choice([30, 45, 60, 90, 120, 180, 240]),
+        "address": "",
+        "property_size": rng.choice(["small", "medium", "large"])
+    } for j in range(num_jobs)]
+    for job in jobs:
+        if rng.random() < 0.5:
+            job["ml_predicted_duration"] = max(30, job["estimated_duration"] + rng.randint(-40, 40))
+    crews = [{
+        "id": f"crew_{c}",
+        "size": rng.randint(1, 4),
+        "available_hours": rng.choice([2, 4, 6, 7.5, 8, 10]),
+        "skills": rng.sample(SKILLS, rng.randint(0, len(SKILLS)))
+    } for c in range(num_crews)]
+    return jobs, crews
+
+
+@pytest.mark.parametrize("seed", range(60))
+def test_engine_matches_rescanning_greedy(seed):
+    rng = random.Random(seed)
+    jobs, crews = random_instance(rng, rng.randint(0, 120), rng.randint(1, 12))
+    assert AssignmentEngine(jobs, crews).assign() == rescanning_greedy(jobs, crews)
+
+
+def test_engine_matches_rescanning_greedy_on_demo_data():
+    from app.services.mock_data import MockDataService
+
+    mock_data = MockDataService()
+    jobs, crews = mock_data.get_sample_jobs(), mock_data.get_sample_crews()
+    assert AssignmentEngine(jobs, crews).assign() == rescanning_greedy(jobs, crews)
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_min_cost_tree_finds_first_fitting_position(seed):
+    rng = random.Random(seed)
+    costs = [rng.randint(1, 50) for _ in range(rng.randint(1, 40))]
+    tree = MinCostTree(costs)
+    remaining = dict(enumerate(costs))
+    for _ in range(60):
+        start, limit = rng.randint(0, len(costs)), rng.randint(0, 60)
+        expected = next((p for p in range(start, len(costs)) if p in remaining and remaining[p] <= limit), -1)
+        assert tree.first_at_most(start, limit) == expected
+        if expected >= 0 and rng.random() < 0.5:
+            tree.remove(expected)
+            del remaining[expected]
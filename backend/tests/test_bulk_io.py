@@ -0,0 +1,87 @@
+import asyncio
+import json
+
+import pytest
+
+from app.services.bulk_io import BulkInputError, iter_lines, parse_csv, parse_ndjson
+
+
+async def chunked(data, size):
+    for start in range(0, len(data), size):
+        yield data[start:start + size]
+
+
+def collect(iterator):
+    async def drain():
+        return [item async for item in iterator]
+    return asyncio.run(drain())
+
+
+@pytest.mark.parametrize("size", [1, 2, 3, 7, 1000])
+def test_lines_split_across_chunks_come_back_whole(size):
+    data = b"first line\n" + b"x" * 50 + b"\n\nlast without newline"
+    assert collect(iter_lines(chunked(data, size))) == [b"first line", b"x" * 50, b"", b"last without newline"]
+
+
+@pytest.mark.parametrize("size", [1, 4, 100])
+def test_a_line_longer_than_the_cap_names_its_line(size):
+    # Ending in a newline, and without one, where only the growing partial line shows it's too long
+    for data in (b"ok\n" + b"y" * 17 + b"\nok\n", b"ok\n" + b"y" * 17):
+        with pytest.raises(BulkInputError) as error:
+            collect(iter_lines(chunked(data, size), max_line_bytes=16))
+        assert error.value.line == 2
+
+    assert collect(iter_lines(chunked(b"y" * 16 + b"\n", size), max_line_bytes=16)) == [b"y" * 16]
+
+
+def test_ndjson_numbers_records_by_line_and_skips_blank_lines():
+    data = b'{"type": "job", "id": "a"}\n\n{"type": "crew", "id": "b"}\r\n'
+    assert collect(parse_ndjson(chunked(data, 5))) == [(1, {"type": "job", "id": "a"}), (3, {"type": "crew", "id": "b"})]
+
+    for data, line in ((b'{"id": "a"}\n{"id": \n', 2), (b'{"id": "a"}\n[1, 2]\n', 2), (b'\n\xff\xfe\n', 2)):
+        with pytest.raises(BulkInputError) as error:
+            collect(parse_ndjson(chunked(data, 3)))
+        assert error.value.line == line
+
+
+def test_csv_reads_a_bom_quoted_cells_across_lines_and_list_columns():
+    data = (
+        "﻿type,id,notes,skills\n"
+        'job,a,"gate code 12, ring twice",\n'
+        'crew,b,"line one\nline two ""quoted""",mowing;cleanup\n'
+        ",,,\n"
+        "job,c,,\n"
+    ).encode()
+
+    assert collect(parse_csv(chunked(data, 4))) == [
+        (2, {"type": "job", "id": "a", "notes": "gate code 12, ring twice"}),
+        # A row is numbered by the line it ends on
+        (4, {"type": "crew", "id": "b", "notes": 'line one\nline two "quoted"', "skills": ["mowing", "cleanup"]}),
+        (6, {"type": "job", "id": "c"})
+    ]
+
+
+def test_csv_errors_name_their_line():
+    for data, line in (("type,id\njob,a\njob,b,extra\n", 3), ('type,id\njob,"open\nstill open\n', 3)):
+        with pytest.raises(BulkInputError) as error:
+            collect(parse_csv(chunked(data.encode(), 2)))
+        assert error.value.line == line
+
+
+def test_streaming_upload_rejects_a_bad_line_with_its_number():
+    from fastapi.testclient import TestClient
+    from app.main import app
+
+    lines = [
+        {"type": "crew", "id": "crew_a", "name": "Crew A", "size": 2, "skills": ["mowing"], "available_hours": 8},
+        {"type": "job", "id": "job_a", "service_type": "weekly_mowing", "estimated_duration": 60, "crew_size_needed": 1},
+        {"type": "truck", "id": "truck_a"}
+    ]
+    headers = {"Content-Type": "application/x-ndjson"}
+    with TestClient(app) as client:
+        body = "".join(json.dumps(line) + "\n" for line in lines[:2])
+        assert client.post("/api/stream/optimize-schedule", content=body, headers=headers).status_code == 200
+        body = "".join(json.dumps(line) + "\n" for line in lines)
+        response = client.post("/api/stream/optimize-schedule", content=body, headers=headers)
+    assert response.status_code == 422
+    assert response.json()["detail"].startswith("line 3:")
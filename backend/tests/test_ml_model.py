@@ -0,0 +1,80 @@
+import numpy as np
+import pytest
+
+from app.services.ml_model import JobDurationPredictor, duration_predictor, forest_quantiles, quantile_at
+
+
+def test_load_version_loads_the_saved_model_a_worker_was_sent():
+    duration_predictor.warm_up()
+    worker = JobDurationPredictor()
+
+    worker.load_version(None)
+    assert worker.model_version is None
+
+    worker.load_version(duration_predictor.model_version)
+    assert worker.model_version == duration_predictor.model_version
+    assert worker.training_results == duration_predictor.training_results
+
+
+def test_load_version_falls_back_to_load_or_train_when_the_version_is_not_saved():
+    duration_predictor.warm_up()
+    worker = JobDurationPredictor()
+
+    worker.load_version("no-such-version")
+    assert worker.model_version == duration_predictor.model_version
+
+
+def feature_rows(count, seed=0):
+    rng = np.random.default_rng(seed)
+    rows = np.column_stack([
+        rng.integers(1000, 40000, count), rng.integers(0, 15, count), rng.integers(1, 6, count), rng.integers(1, 5, count)
+    ]).astype(float)
+    # Recurring jobs repeat their features, the batch path predicts those once
+    return np.vstack([rows, rows[:5]])
+
+
+def test_batch_predictions_match_one_job_at_a_time():
+    duration_predictor.warm_up()
+    rows = feature_rows(40)
+
+    batch = duration_predictor.predict_durations(rows)
+
+    assert batch["model_version"] == duration_predictor.model_version
+    for j, row in enumerate(rows):
+        single = duration_predictor.predict_duration(row)
+        assert single["predicted_duration"] == batch["predicted_duration"][j]
+        assert single["confidence"] == f"{batch['confidence'][j]:.0f}%"
+        assert single["prediction_interval"] == {name: round(float(batch[name][j]), 1) for name in ("p10", "p50", "p90")}
+
+
+def test_forest_quantiles_are_ordered_and_the_mean_is_the_forest_prediction():
+    duration_predictor.warm_up()
+    rows = feature_rows(40, seed=1)
+    model = duration_predictor.model
+
+    values = forest_quantiles(model, rows)
+
+    assert values[:, 0] == pytest.approx(model.predict(rows))
+    assert (np.diff(values[:, 1:], axis=1) >= 0).all()
+    p10, p50, p90 = (quantile_at(values[:, 1:], percentile) for percentile in (10, 50, 90))
+    assert (p10 <= p50).all() and (p50 <= p90).all()
+    # The mean of the trees sits between the fastest and slowest of them
+    assert (values[:, 1] <= values[:, 0] + 1e-9).all() and (values[:, 0] <= values[:, -1] + 1e-9).all()
+
+
+def test_risk_duration_grows_with_the_risk_percentile():
+    duration_predictor.warm_up()
+    rows = feature_rows(40, seed=2)
+
+    assert "risk_duration" not in duration_predictor.predict_durations(rows)
+    risk = {
+        percentile: duration_predictor.predict_durations(rows, percentile)["risk_duration"]
+        for percentile in (50, 65, 80, 95)
+    }
+    for lower, higher in zip((50, 65, 80), (65, 80, 95)):
+        assert (risk[lower] <= risk[higher]).all()
+    assert (risk[95] > risk[50]).any()
+
+    # Rounded up from the interpolated percentile, and never under the 30 minute floor
+    p90 = duration_predictor.predict_durations(rows, 90)
+    assert (p90["risk_duration"] == np.maximum(30, np.ceil(p90["p90"]))).all()
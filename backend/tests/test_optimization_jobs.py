@@ -0,0 +1,52 @@
+import threading
+import time
+
+import pytest
+
+from app.services.job_store import OptimizationJobManager
+from app.services.worker_pool import OptimizationPool, PoolSaturatedError
+
+
+def wait_for(store, job_id, status, timeout=10):
+    deadline = time.monotonic() + timeout
+    while store.get(job_id)["status"] != status:
+        assert time.monotonic() < deadline, store.get(job_id)
+        time.sleep(0.01)
+    return store.get(job_id)
+
+
+def test_jobs_take_places_in_the_optimization_pool():
+    pool = OptimizationPool(max_workers=1, max_queue_depth=0, executor_type="thread")
+    manager = OptimizationJobManager(pool=pool)
+    release = threading.Event()
+    recorded = []
+
+    def optimize(jobs, crews, progress_callback=None):
+        release.wait(10)
+        return {"jobs": len(jobs)}
+
+    job_id = manager.submit(optimize, [{}], [], on_result=recorded.append)
+    assert pool.in_flight == 1
+    with pytest.raises(PoolSaturatedError):
+        manager.submit(optimize, [], [])
+
+    release.set()
+    record = wait_for(manager.store, job_id, "completed")
+    assert record["result"] == {"jobs": 1} and recorded == [{"jobs": 1}]
+    manager.shutdown()
+    assert pool.in_flight == 0
+    pool.shutdown()
+
+
+def test_jobs_run_again_after_the_app_restarts():
+    from fastapi.testclient import TestClient
+    from app.main import app
+    from app.services.job_store import optimization_jobs
+
+    for _ in range(2):
+        with TestClient(app) as client:
+            demo = client.get("/api/demo-data").json()
+            submitted = client.post("/api/optimize-jobs", json=demo)
+            assert submitted.status_code == 202
+            record = wait_for(optimization_jobs.store, submitted.json()["job_id"], "completed")
+            assert record["percent"] == 100
@@ -0,0 +1,68 @@
+import pytest
+
+from app.services.locations import location_index
+from app.services.partitioning import PartitionedSolver
+from app.services.synthetic_data import SyntheticDataService
+from app.services.tables import CrewTable, JobTable
+
+
+def plan_rows(plans):
+    return [(plan.crew, plan.jobs, plan.drive_minutes, plan.miles, plan.dropped) for plan in plans]
+
+
+def test_parallel_partitions_give_the_same_plans_as_serial():
+    data = SyntheticDataService(num_jobs=60, num_crews=9, num_historical=10, seed=7)
+    for address, (latitude, longitude) in data.get_locations().items():
+        location_index.add_location(address, latitude, longitude)
+    jobs, crews = JobTable(data.get_sample_jobs()), CrewTable(data.get_sample_crews())
+
+    serial_plans, serial_report = PartitionedSolver(max_workers=1).solve(jobs, crews, "greedy")
+    solver = PartitionedSolver(max_workers=2).start()
+    try:
+        parallel_plans, parallel_report = solver.solve(jobs, crews, "greedy")
+    finally:
+        solver.shutdown()
+
+    assert parallel_report["parallel"] and not serial_report["parallel"]
+    assert serial_report["partitions"] == parallel_report["partitions"] == 3
+    assert plan_rows(parallel_plans) == plan_rows(serial_plans)
+    assert parallel_report["objective"] == serial_report["objective"]
+    assert parallel_report["rebalanced_jobs"] == serial_report["rebalanced_jobs"]
+
+
+def test_solve_defaults_the_time_budget():
+    jobs = JobTable([{"id": "job_a", "service_type": "weekly_mowing", "estimated_duration": 60, "crew_size_needed": 1}])
+    crews = CrewTable([{"id": "crew_a", "size": 2, "skills": ["mowing"], "available_hours": 8, "start_location": "Main Office"}])
+
+    plans, report = PartitionedSolver(max_workers=1).solve(jobs, crews)
+    assert plans[0].jobs == [0]
+    assert report["time_budget_ms"] > 0
+
+
+# Depot A's only crew has time for one of the two jobs next to it, the other is left over for depot B's idle crew.
+# degrees_away puts depot B that far north: a short drive fits B's day, a long one doesn't once the real drive is known
+@pytest.mark.parametrize("degrees_away, rebalanced", [(0.1, 1), (2.0, 0)])
+def test_rebalance_counts_only_jobs_still_routed_after_refitting(degrees_away, rebalanced):
+    location_index.add_location("1 Rebalance Way", 29.0, -96.0)
+    location_index.add_location("2 Rebalance Way", 29.0, -96.001)
+    location_index.add_location("Rebalance Depot A", 29.0, -96.0)
+    location_index.add_location(f"Rebalance Depot B {degrees_away}", 29.0 + degrees_away, -96.0)
+    jobs = JobTable([
+        {"id": f"job_{i}", "address": f"{i} Rebalance Way", "service_type": "weekly_mowing", "estimated_duration": 200, "crew_size_needed": 1}
+        for i in (1, 2)
+    ])
+    crews = CrewTable([
+        {"id": "crew_a", "size": 1, "skills": ["mowing"], "available_hours": 4, "start_location": "Rebalance Depot A"},
+        {"id": "crew_b", "size": 1, "skills": ["mowing"], "available_hours": 8, "start_location": f"Rebalance Depot B {degrees_away}"}
+    ])
+
+    plans, report = PartitionedSolver(max_workers=1).solve(jobs, crews, "greedy")
+
+    assert report["partitions"] == 2
+    assert report["rebalanced_jobs"] == rebalanced
+    assert plans[0].jobs == [0]
+    assert plans[1].jobs == ([1] if rebalanced else [])
+    # A leftover the re-fit took off again is just unassigned, not a job that came off crew B's route
+    assert plans[1].dropped == []
+    # Every job on a route is worth 200 minutes at medium priority with a full skill match
+    assert report["objective"] == 200.0 * (1 + rebalanced)
@@ -0,0 +1,123 @@
+import asyncio
+
+import pytest
+
+from app.services.result_cache import OptimizationResultCache, etag_matches, request_key
+
+
+def test_identical_requests_in_flight_share_one_computation():
+    async def scenario():
+        cache = OptimizationResultCache(maxsize=10, max_bytes=1 << 20)
+        release = asyncio.Event()
+        calls = []
+
+        async def compute():
+            calls.append(1)
+            await release.wait()
+            return {"status": "success", "routes": []}
+
+        waiters = [asyncio.ensure_future(cache.get_or_compute("key", compute)) for _ in range(5)]
+        await asyncio.sleep(0)
+        assert cache.stats()["in_flight"] == 1
+        release.set()
+        results = await asyncio.gather(*waiters)
+        again = await cache.get_or_compute("key", compute)
+        return cache, calls, results, again
+
+    cache, calls, results, again = asyncio.run(scenario())
+    assert len(calls) == 1
+    assert sorted(how for _, _, how in results) == ["coalesced"] * 4 + ["miss"]
+    # Every waiter gets the same bytes and ETag, and the next request is a hit without computing again
+    assert len({(body, etag) for body, etag, _ in results}) == 1
+    assert again[:2] == results[0][:2] and again[2] == "hit"
+    assert cache.stats()["coalesced"] == 4 and cache.stats()["in_flight"] == 0
+
+
+def test_a_failed_computation_fails_every_waiter_and_is_not_stored():
+    async def scenario():
+        cache = OptimizationResultCache(maxsize=10, max_bytes=1 << 20)
+
+        async def compute():
+            await asyncio.sleep(0)
+            raise RuntimeError("solver failed")
+
+        outcomes = await asyncio.gather(*(cache.get_or_compute("key", compute) for _ in range(3)), return_exceptions=True)
+        return cache, outcomes
+
+    cache, outcomes = asyncio.run(scenario())
+    assert all(isinstance(outcome, RuntimeError) for outcome in outcomes)
+    assert cache.stats()["in_flight"] == 0 and cache.results.get("key") is None
+
+
+def test_result_is_not_stored_when_keep_says_no():
+    async def compute():
+        return {"status": "success"}
+
+    cache = OptimizationResultCache(maxsize=10, max_bytes=1 << 20)
+    _, _, how = asyncio.run(cache.get_or_compute("key", compute, keep=lambda result: False))
+    assert how == "miss"
+    assert cache.results.get("key") is None
+
+
+def test_request_key_ignores_field_order_but_not_job_order():
+    jobs = [{"id": "a", "estimated_duration": 60}, {"id": "b", "estimated_duration": 90}]
+    reordered_fields = [{"estimated_duration": 60, "id": "a"}, {"estimated_duration": 90, "id": "b"}]
+    crews = [{"id": "crew", "size": 2}]
+    options = {"strategy": "greedy"}
+    assert request_key(jobs, crews, options, "v1") == request_key(reordered_fields, crews, options, "v1")
+    assert request_key(jobs, crews, options, "v1") != request_key(jobs[::-1], crews, options, "v1")
+    assert request_key(jobs, crews, options, "v1") != request_key(jobs, crews, options, "v2")
+
+
+@pytest.mark.parametrize("header, matches", [
+    (None, False),
+    ('"abc"', True),
+    ('W/"abc"', True),
+    ('"other", "abc"', True),
+    ("*", True),
+    ('"other"', False)
+])
+def test_etag_matches(header, matches):
+    assert etag_matches(header, '"abc"') is matches
+
+
+def test_optimize_schedule_answers_304_for_a_matching_etag():
+    from fastapi.testclient import TestClient
+    from app.main import app
+    from app.services.result_cache import result_cache
+
+    result_cache.clear()
+    with TestClient(app) as client:
+        demo = client.get("/api/demo-data").json()
+        first = client.post("/api/optimize-schedule", json=demo)
+        assert first.status_code == 200
+        assert first.headers["X-Cache"] == "miss"
+        etag = first.headers["ETag"]
+
+        unchanged = client.post("/api/optimize-schedule", json=demo, headers={"If-None-Match": etag})
+        assert unchanged.status_code == 304
+        assert unchanged.headers["X-Cache"] == "hit" and unchanged.headers["ETag"] == etag
+        assert unchanged.content == b""
+
+        # A different schedule doesn't match the old ETag
+        changed = client.post("/api/optimize-schedule", json={**demo, "jobs": demo["jobs"][:-1]}, headers={"If-None-Match": etag})
+        assert changed.status_code == 200 and changed.headers["ETag"] != etag
+
+
+def test_result_from_another_model_than_the_key_is_not_stored(monkeypatch):
+    from fastapi.testclient import TestClient
+    from app.main import app
+    from app.services.ml_model import duration_predictor
+    from app.services.result_cache import result_cache
+
+    # The predictions come from a model other than the one the request was keyed with, like a worker that hadn't reloaded
+    predict_durations = duration_predictor.predict_durations
+    monkeypatch.setattr(duration_predictor, "predict_durations", lambda *args: {**predict_durations(*args), "model_version": "stale"})
+
+    result_cache.clear()
+    with TestClient(app) as client:
+        demo = client.get("/api/demo-data").json()
+        first = client.post("/api/optimize-schedule", json=demo)
+        assert first.status_code == 200 and first.json()["ml_model_info"]["model_version"] == "stale"
+        again = client.post("/api/optimize-schedule", json=demo)
+        assert again.status_code == 200 and again.headers["X-Cache"] == "miss"
@@ -0,0 +1,185 @@
+import numpy as np
+import pytest
+
+from app.services.locations import location_index
+from app.services.scheduler import ScheduleOptimizer
+from app.services.sessions import ScheduleSession
+from app.services.tables import CrewTable, JobTable, RoutePlan
+
+# Test locations on one meridian, so driving between them adds up along the line
+LONGITUDE = -97.7
+PLACES = {
+    "1 Session Test North Depot": 30.00,
+    "2 Session Test Stop A": 30.02,
+    "3 Session Test Stop B": 30.04,
+    "4 Session Test Stop C": 30.06,
+    "5 Session Test South Depot": 30.30,
+    "6 Session Test Stop South": 30.31,
+    "7 Session Test Far Stop": 31.50
+}
+NORTH, A, B, C, SOUTH, NEAR_SOUTH, FAR = PLACES
+
+
+@pytest.fixture(autouse=True)
+def places():
+    for address, latitude in PLACES.items():
+        location_index.add_location(address, latitude, LONGITUDE)
+
+
+def job(job_id, address, minutes, priority="medium", service_type="weekly_mowing"):
+    return {
+        "id": job_id, "address": address, "service_type": service_type, "priority": priority,
+        "estimated_duration": minutes, "crew_size_needed": 1, "property_size": "medium"
+    }
+
+
+def crew(crew_id, start_location, hours=8, skills=("mowing",)):
+    return {"id": crew_id, "name": crew_id, "size": 2, "available_hours": hours, "skills": list(skills), "start_location": start_location}
+
+
+def make_session(monkeypatch, jobs, crews, routes, **options):
+    """A session whose jobs take exactly their estimate, routes are job ids per crew"""
+    job_table, crew_table = JobTable(jobs), CrewTable(crews)
+    minutes = job_table.estimated_duration
+    job_table.set_predictions(minutes, np.full(len(jobs), 80.0), (minutes * 0.9, minutes * 1.1))
+    positions = {job_id: j for j, job_id in enumerate(job_table.ids)}
+    plans = [RoutePlan(c, [positions[job_id] for job_id in route]) for c, route in enumerate(routes)]
+    session = ScheduleSession(ScheduleOptimizer(), job_table, crew_table, plans, **options)
+
+    # New and changed jobs take their estimate too, no model needed
+    def predict(jobs):
+        return {
+            job["id"]: (job["estimated_duration"], 80.0, job["estimated_duration"] * 0.9, job["estimated_duration"] * 1.1, job["estimated_duration"])
+            for job in jobs
+        }
+
+    monkeypatch.setattr(session, "_predict", predict)
+    return session
+
+
+def test_cheapest_insertion_goes_between_the_stops_it_sits_between(monkeypatch):
+    session = make_session(monkeypatch, [job("a", A, 60), job("c", C, 60)], [crew("north", NORTH)], [["a", "c"]])
+    location = location_index.location_id(B)
+
+    position, added_minutes = session._cheapest_insertion(0, location)
+
+    index, minutes, _ = location_index.travel_matrices([location_index.location_id(address) for address in (NORTH, A, B, C)])
+    a, b, c = (index[location_index.location_id(address)] for address in (A, B, C))
+    assert position == 1
+    assert added_minutes == pytest.approx(minutes[a, b] + minutes[b, c] - minutes[a, c])
+
+    diff = session.apply({"add_jobs": [job("b", B, 60)]})
+    assert session.routes[0] == ["a", "b", "c"]
+    assert diff["changed_routes"][0]["added_job_ids"] == ["b"]
+    assert diff["newly_unassigned_job_ids"] == []
+
+
+def test_new_job_goes_to_the_crew_it_adds_the_least_driving_to(monkeypatch):
+    session = make_session(
+        monkeypatch, [job("a", A, 60), job("south", NEAR_SOUTH, 60)],
+        [crew("north", NORTH), crew("south", SOUTH)], [["a"], ["south"]]
+    )
+    session.apply({"add_jobs": [job("b", B, 60)]})
+    assert session.routes == [["a", "b"], ["south"]]
+
+
+def test_skill_match_comes_before_distance_unless_partitioned_by_depot(monkeypatch):
+    jobs = [job("a", A, 60)]
+    crews = [crew("north", NORTH, skills=("mowing",)), crew("south", SOUTH, skills=("cleanup",))]
+    session = make_session(monkeypatch, jobs, crews, [["a"], []])
+    session.apply({"add_jobs": [job("new", NEAR_SOUTH, 60)]})
+    assert session.job_crew["new"] == 0
+
+    session = make_session(monkeypatch, jobs, crews, [["a"], []], partition_by_depot=True)
+    session.apply({"add_jobs": [job("new", NEAR_SOUTH, 60)]})
+    assert session.job_crew["new"] == 1
+
+
+def test_freed_time_is_refilled_from_the_waiting_list(monkeypatch):
+    # 8 hours, x and y take 2 x (200 + 25) = 450 minutes, nothing waiting fits in the last 30
+    jobs = [
+        job("x", A, 200), job("y", B, 200),
+        job("low_short", C, 100, "low"), job("low_long", C, 300, "low"), job("low_mid", C, 150, "low"),
+        job("high", C, 200, "high")
+    ]
+    session = make_session(monkeypatch, jobs, [crew("north", NORTH)], [["x", "y"]])
+    assert list(session.unassigned) == ["low_short", "low_long", "low_mid", "high"]
+
+    # Removing x frees 225 of 255 minutes: the high priority job first (225), then nothing else fits
+    diff = session.apply({"remove_job_ids": ["x"]})
+    assert diff["newly_assigned_job_ids"] == ["high"]
+    assert sorted(session.routes[0]) == ["high", "y"]
+    assert set(session.unassigned) == {"low_short", "low_long", "low_mid"}
+
+    # Removing high frees 225 again, the longest low priority job that fits comes first (175), then 80 are left
+    diff = session.apply({"remove_job_ids": ["high"]})
+    assert diff["newly_assigned_job_ids"] == ["low_mid"]
+    assert set(session.unassigned) == {"low_short", "low_long"}
+    assert session.used_minutes[0] == pytest.approx(225 + 175)
+
+
+def test_delta_predictions_use_the_session_risk_percentile(monkeypatch):
+    from app.services.ml_model import duration_predictor
+
+    seen = []
+
+    def predict_durations(feature_matrix, risk_percentile=None):
+        seen.append(risk_percentile)
+        n = len(feature_matrix)
+        result = {
+            "predicted_duration": np.full(n, 100), "confidence": np.full(n, 80.0),
+            "p10": np.full(n, 90.0), "p50": np.full(n, 100.0), "p90": np.full(n, 130.0)
+        }
+        if risk_percentile is not None:
+            result["risk_duration"] = np.full(n, 125)
+        return result
+
+    job_table, crew_table = JobTable([job("a", A, 60)]), CrewTable([crew("north", NORTH)])
+    job_table.set_predictions([60], [80.0], ([50.0], [70.0]), [66])
+    session = ScheduleSession(ScheduleOptimizer(), job_table, crew_table, [RoutePlan(0, [0])], risk_percentile=80)
+    assert session.used_minutes[0] == 66 + 25
+
+    monkeypatch.setattr(duration_predictor, "predict_durations", predict_durations)
+    session.apply({"add_jobs": [job("b", B, 60)]})
+    assert seen == [80]
+    assert session.predictions["b"][0] == 100 and session.predictions["b"][4] == 125
+    assert session.used_minutes[0] == 66 + 25 + 125 + 25
+
+
+def test_repair_sends_jobs_the_real_drive_does_not_fit_back_to_the_waiting_list(monkeypatch):
+    session = make_session(monkeypatch, [job("a", A, 60)], [crew("north", NORTH)], [["a"]])
+
+    # 100 minutes plus the flat travel allowance fits the day, but the real drive out to FAR takes over five hours
+    diff = session.apply({"add_jobs": [job("far", FAR, 100, priority="low")]})
+
+    assert session.routes[0] == ["a"]
+    assert "far" in session.unassigned and "far" not in session.job_crew
+    assert diff["newly_unassigned_job_ids"] == ["far"]
+    assert diff["changed_routes"][0]["added_job_ids"] == []
+    work, drive = 60, session.route_stats[0][0]
+    assert work + drive <= session.available_minutes[0]
+    assert session.used_minutes[0] == pytest.approx(60 + 25)
+
+
+def test_a_failed_prediction_leaves_the_session_as_it_was(monkeypatch):
+    session = make_session(
+        monkeypatch, [job("a", A, 60), job("b", B, 60), job("waiting", C, 600)], [crew("north", NORTH)], [["a", "b"]]
+    )
+    state = (
+        [list(route) for route in session.routes], dict(session.jobs), dict(session.predictions), dict(session.job_crew),
+        list(session.unassigned), {rank: list(waiting) for rank, waiting in session.waiting.items()},
+        session.used_minutes.tolist(), session.version
+    )
+
+    def predict(jobs):
+        raise RuntimeError("model unavailable")
+
+    monkeypatch.setattr(session, "_predict", predict)
+    with pytest.raises(RuntimeError):
+        session.apply({"remove_job_ids": ["a"], "update_jobs": [job("b", B, 90)], "add_jobs": [job("c", C, 30)]})
+
+    assert state == (
+        [list(route) for route in session.routes], dict(session.jobs), dict(session.predictions), dict(session.job_crew),
+        list(session.unassigned), {rank: list(waiting) for rank, waiting in session.waiting.items()},
+        session.used_minutes.tolist(), session.version
+    )
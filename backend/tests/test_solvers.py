@@ -0,0 +1,70 @@
+import itertools
+import random
+
+import numpy as np
+import pytest
+
+from app.services.solvers import AssignmentSolver
+from test_assignment import random_instance
+
+
+def check_feasible(solver, assignments):
+    """Every job on at most one crew, each crew big enough for its jobs and its jobs plus travel within its hours"""
+    placed = [j for crew_jobs in assignments for j in crew_jobs]
+    assert len(placed) == len(set(placed))
+    for c, crew_jobs in enumerate(assignments):
+        crew_jobs = np.asarray(crew_jobs, dtype=np.intp)
+        assert (solver.engine.sizes[crew_jobs] <= solver.engine.crews.sizes[c]).all()
+        assert solver.costs[crew_jobs].sum() <= solver.capacity[c] + 1e-9
+
+
+def brute_force(solver):
+    """The best objective over every way to give each job to a crew or leave it off"""
+    best = 0.0
+    for owners in itertools.product(range(-1, solver.num_crews), repeat=solver.num_jobs):
+        assignments = [[j for j, c in enumerate(owners) if c == crew] for crew in range(solver.num_crews)]
+        load_fits = all(solver.costs[crew_jobs].sum() <= solver.capacity[c] for c, crew_jobs in enumerate(assignments))
+        size_fits = all(solver.engine.sizes[j] <= solver.engine.crews.sizes[c] for j, c in enumerate(owners) if c >= 0)
+        if load_fits and size_fits:
+            best = max(best, solver.objective(assignments))
+    return best
+
+
+@pytest.mark.parametrize("strategy", ["local_search", "exact"])
+@pytest.mark.parametrize("seed", range(10))
+def test_searches_keep_crew_sizes_and_hours_and_never_lose_to_greedy(strategy, seed):
+    rng = random.Random(seed)
+    jobs, crews = random_instance(rng, rng.randint(0, 80), rng.randint(1, 8))
+    solver = AssignmentSolver(jobs, crews, seed=seed)
+
+    assignments, report = solver.solve(strategy, time_budget_ms=50)
+
+    check_feasible(solver, assignments)
+    assert report["objective"] == round(solver.objective(assignments), 1)
+    assert report["objective"] >= report["greedy_objective"]
+
+
+@pytest.mark.parametrize("seed", range(15))
+def test_branch_and_bound_matches_brute_force_on_small_instances(seed):
+    rng = random.Random(seed)
+    jobs, crews = random_instance(rng, rng.randint(1, 7), rng.randint(1, 2))
+    solver = AssignmentSolver(jobs, crews, seed=seed)
+
+    assignments, report = solver.solve("exact", time_budget_ms=10000)
+
+    check_feasible(solver, assignments)
+    assert report["optimal"]
+    assert solver.objective(assignments) == pytest.approx(brute_force(solver))
+
+
+def test_optimal_is_only_reported_when_the_search_finished():
+    jobs, crews = random_instance(random.Random(0), 120, 8)
+    solver = AssignmentSolver(jobs, crews)
+
+    # No time at all: branch and bound gives up at its first time check, the incumbent comes back unproven
+    assignments, report = solver.solve("exact", time_budget_ms=0)
+    check_feasible(solver, assignments)
+    assert not report["optimal"]
+
+    for strategy in ("greedy", "local_search"):
+        assert not solver.solve(strategy, time_budget_ms=50)[1]["optimal"]
@@ -13,35 +13,57 @@ function AIOptimizer({ jobs, crews, onOptimized, onBack }: AIOptimizerProps) {
   const [progress, setProgress] = useState(0);
   const [currentStep, setCurrentStep] = useState('');
 
-  const steps = [
-    { text: 'Analyzing job requirements', duration: 800 },
-    { text: 'Calculating optimal routes', duration: 1000 },
-    { text: 'Matching crews to skills', duration: 600 },
-    { text: 'Minimizing travel time', duration: 800 },
-    { text: 'Maximizing daily revenue', duration: 600 },
-  ];
+  const API_URL = 'http://localhost:8000';
+
+  // Follow the job's progress events until the backend says it is done
+  const waitForJob = (jobId: string) =>
+    new Promise<void>((resolve, reject) => {
+      const events = new EventSource(`${API_URL}/api/optimize-jobs/${jobId}/events`);
+
+      events.addEventListener('progress', (event) => {
+        const data = JSON.parse((event as MessageEvent).data);
+        setCurrentStep(data.message);
+        setProgress(Math.min(95, data.percent)); // Hold at 95% until the result is loaded
+      });
+
+      events.addEventListener('done', (event) => {
+        events.close();
+        const data = JSON.parse((event as MessageEvent).data);
+        if (data.status === 'completed') {
+          resolve();
+        } else {
+          reject(new Error(`Optimization ${data.status}`));
+        }
+      });
+
+      events.onerror = () => {
+        events.close();
+        reject(new Error('Lost connection to progress stream'));
+      };
+    });
 
   const runOptimization = async () => {
     setOptimizing(true);
     setProgress(0);
+    setCurrentStep('Submitting jobs');
 
-    // Start API call in parallel (don't wait for it)
-    const apiPromise = fetch('http://localhost:8000/api/optimize-schedule', {
-      method: 'POST',
-      headers: { 'Content-Type': 'application/json' },
-      body: JSON.stringify({ jobs, crews })
-    }).then(response => response.json());
-
-    // Animate through steps
-    for (let i = 0; i < steps.length; i++) {
-      setCurrentStep(steps[i].text);
-      setProgress(((i + 1) / steps.length) * 95); // Go to 95%, not 100%
-      await new Promise(resolve => setTimeout(resolve, steps[i].duration));
-    }
-
-    // Wait for API call to complete
     try {
-      const result = await apiPromise;
+      // Submit the job, then show the real progress the backend reports
+      const submitted = await fetch(`${API_URL}/api/optimize-jobs`, {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ jobs, crews })
+      }).then(response => {
+        if (!response.ok) throw new Error(`Submit failed: ${response.status}`);
+        return response.json();
+      });
+
+      await waitForJob(submitted.job_id);
+
+      const result = await fetch(`${API_URL}/api/optimize-jobs/${submitted.job_id}/result`).then(response => {
+        if (!response.ok) throw new Error(`Result failed: ${response.status}`);
+        return response.json();
+      });
       setProgress(100);
       setCurrentStep('Optimization complete!');
       
@@ -31,6 +31,8 @@ export interface Job {
     total_drive_time: string;
     total_work_time: string;
     efficiency_score: number;
+    total_miles?: number;
+    baseline_miles?: number;
   }
   
   export interface EfficiencyReport {
@@ -46,6 +48,7 @@ export interface Job {
     routes: Route[];
     efficiency_report: EfficiencyReport;
     recommendations: string[];
+    unassigned_job_ids?: string[];
     ml_model_info?: MLModelInfo;  // Add this line
   }
   
@@ -57,4 +60,5 @@ export interface Job {
     training_samples: number;
     model_status: string;
     cost_savings: string;
+    model_version?: string;
   }
\ No newline at end of file